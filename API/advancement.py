@@ -0,0 +1,109 @@
+"""
+Round advancement for the Voter App API
+
+Decides which ideas of a finished round go on to the next one. A strategy
+gives every idea a rank score; the policy keeps the best keep_fraction of
+the ideas (at least min_keep), optionally only among ideas whose score
+reaches min_score. The top k of n ideas are found with a heap in
+O(n log k), ties going to the idea listed first, and the survivors keep
+their order in the round. The same votes therefore always advance the same
+ideas.
+
+Strategies (ADVANCEMENT_MODE):
+    total       sum of the voters' scores
+    normalized  sum of the scores after per-voter normalization
+    random      a uniform sample, reproducible per round when a seed is set
+
+More can be added to STRATEGIES: a function (RoundScores, policy,
+round_num) returning one rank score per idea.
+"""
+import heapq
+import random
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+@dataclass
+class AdvancementPolicy:
+    mode: str = 'total'
+    keep_fraction: float = 0.7
+    # Ideas ranked below this score never advance (ignored in random mode)
+    min_score: Optional[float] = None
+    min_keep: int = 1
+    seed: Optional[int] = None
+
+    def __post_init__(self):
+        if self.mode not in STRATEGIES:
+            raise ValueError(f"Unknown advancement mode: {self.mode}")
+        if not 0 <= self.keep_fraction <= 1:
+            raise ValueError(f"keep_fraction must be between 0 and 1: {self.keep_fraction}")
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(mode=config.ADVANCEMENT_MODE,
+                   keep_fraction=config.ADVANCEMENT_KEEP_FRACTION,
+                   min_score=config.ADVANCEMENT_MIN_SCORE,
+                   seed=config.ADVANCEMENT_SEED)
+
+
+@dataclass
+class Advancement:
+    ideas: List[dict]
+    total: int
+    mode: str
+
+    @property
+    def survival_rate(self):
+        return len(self.ideas) / self.total if self.total > 0 else 0
+
+
+def _total(round_scores, policy, round_num):
+    return round_scores.totals()
+
+
+def _normalized(round_scores, policy, round_num):
+    # Rounded so that NumPy and pure Python sums rank ties the same way
+    return [round(total, 9) for total in round_scores.totals(normalized=True)]
+
+
+def _random(round_scores, policy, round_num):
+    # One random rank per idea: the top k is then a uniform sample
+    rng = random.Random(f'{policy.seed}:{round_num}') if policy.seed is not None else random.Random()
+    return [rng.random() for _ in range(len(round_scores))]
+
+
+STRATEGIES = {
+    'total': _total,
+    'normalized': _normalized,
+    'random': _random,
+}
+
+
+def keep_count(total, policy):
+    return min(total, max(policy.min_keep, int(total * policy.keep_fraction)))
+
+
+def top_positions(scores, k, min_score=None):
+    """Positions of the k highest scores, earliest first among equals"""
+    candidates = range(len(scores))
+    if min_score is not None:
+        candidates = [position for position in candidates if scores[position] >= min_score]
+    return heapq.nlargest(k, candidates, key=lambda position: (scores[position], -position))
+
+
+def select_next_round(round_scores, round_num, policy):
+    """Ideas (id, title, description) that advance from round_num"""
+    strategy = STRATEGIES[policy.mode]
+    total = len(round_scores)
+    scores = strategy(round_scores, policy, round_num)
+    k = keep_count(total, policy)
+    min_score = None if policy.mode == 'random' else policy.min_score
+    kept = top_positions(scores, k, min_score)
+    if not kept and total:
+        # Nothing reached the threshold: the round still has to go on
+        kept = top_positions(scores, min(total, policy.min_keep))
+
+    kept = set(kept)
+    ideas = [{"id": idea.id, "title": idea.title, "description": idea.description}
+             for position, idea in enumerate(round_scores.ideas) if position in kept]
+    return Advancement(ideas, total, policy.mode)
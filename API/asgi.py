@@ -0,0 +1,407 @@
+"""
+ASGI entry point for the Voter App API
+
+    uvicorn asgi:app
+    python run.py --async [--production]
+
+The submission endpoints (POST /submit-vote, /submit-all-votes,
+/submit-final-results and /save-scores) run as coroutines. The request body
+is read and validated on the event loop, and only VotingService's storage
+reads and writes are handed to a pool of Config.ASYNC_IO_WORKERS threads.
+An application/x-ndjson /submit-all-votes body is stored round by round as
+its lines arrive, so it is never held in memory as a whole.
+Independent voters' submissions therefore overlap instead of queueing
+behind each other's disk writes, and a slow disk holds at most that many
+threads. GET /events is streamed from the event loop without a thread per
+client. Every other route is passed to the Flask app on its own thread pool.
+The same routes under /sessions/<id>/ are served for that voting session.
+"""
+import asyncio
+import functools
+import io
+import logging
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+from config import Config
+from events import format_event
+from logging_config import get_logger
+import serializer
+
+logger = get_logger('asgi')
+
+# Path -> (VotingService validator, VotingService method)
+SUBMISSIONS = {
+    '/submit-vote': ('validate_vote', 'submit_vote'),
+    '/submit-all-votes': ('validate_all_votes', 'submit_all_votes'),
+    '/submit-final-results': ('validate_final_results', 'submit_final_results'),
+    '/save-scores': ('validate_save_scores', 'save_scores'),
+}
+SESSION_PREFIX = '/sessions/'
+
+
+class BoundedIO:
+    """Runs blocking calls on a fixed number of threads"""
+
+    def __init__(self, max_workers, name):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def _header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin1')
+    return None
+
+
+def _is_ndjson(scope):
+    content_type = _header(scope, b'content-type') or ''
+    return content_type.split(';', 1)[0].strip().lower() == main.NDJSON_MIMETYPE
+
+
+def _cors_headers(scope):
+    origin = _header(scope, b'origin')
+    if origin is not None and origin in Config.CORS_ORIGINS:
+        return [(b'access-control-allow-origin', origin.encode('latin1')), (b'vary', b'Origin')]
+    return []
+
+
+def wsgi_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope and its complete body"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin1')
+        value = value.decode('latin1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def call_wsgi(wsgi_app, environ):
+    """Run a WSGI app to completion; returns (status, headers, body)"""
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [status, headers]
+
+    result = wsgi_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    status, headers = started
+    return int(status.split(' ', 1)[0]), headers, body
+
+
+def split_session(path):
+    """(session id, route path) of a request path"""
+    if path.startswith(SESSION_PREFIX):
+        session_id, _, rest = path[len(SESSION_PREFIX):].partition('/')
+        return session_id, '/' + rest
+    return main.DEFAULT_SESSION, path
+
+
+def route_rule(path):
+    """The Flask rule matching a request path, e.g. /sessions/<session_id>/submit-vote"""
+    session_id, route = split_session(path)
+    return route if session_id == main.DEFAULT_SESSION else f'{SESSION_PREFIX}<session_id>{route}'
+
+
+class VoterASGIApp:
+    """ASGI app serving submissions and /events natively, the rest via Flask"""
+
+    def __init__(self, flask_app, sessions):
+        self.flask_app = flask_app
+        self.sessions = sessions
+        self.io = BoundedIO(Config.ASYNC_IO_WORKERS, 'aio')
+        self._wsgi = BoundedIO(Config.ASYNC_WSGI_THREADS, 'wsgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        request_id = _header(scope, b'x-request-id') or uuid.uuid4().hex[:12]
+        started = time.perf_counter()
+        method = scope['method']
+        session_id, path = split_session(scope['path'])
+        native = ((method == 'POST' and path in SUBMISSIONS) or
+                  (method == 'GET' and path == '/events'))
+        if native and main.cluster is not None and not main.cluster.owns(session_id):
+            # Flask redirects it to the node serving the session
+            native = False
+        # Loading a session may read its storage
+        session = await self.io.run(self.sessions.get, session_id) if native else None
+
+        if session is None:
+            # Flask logs these requests itself (and answers 404 for an
+            # unknown session)
+            await self._flask(scope, receive, send)
+            return
+        if method == 'POST' and path == '/submit-all-votes' and _is_ndjson(scope):
+            status = await self._vote_stream(session, scope, receive, send, request_id)
+        elif method == 'POST':
+            status = await self._submission(session, scope, receive, send, request_id,
+                                            *SUBMISSIONS[path])
+        else:
+            status = await self._events(session, scope, receive, send, request_id)
+
+        duration = time.perf_counter() - started
+        # Labelled like the Flask routes, by rule
+        main.REQUEST_SECONDS.labels(method, route_rule(scope['path']), status).observe(duration)
+        duration_ms = round(duration * 1000, 2)
+        level = logging.WARNING if duration_ms >= Config.SLOW_REQUEST_MS else logging.DEBUG
+        logger.log(level, "request", extra={
+            "request_id": request_id, "path": scope['path'], "method": method,
+            "status": status, "duration_ms": duration_ms})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.io.run(self.sessions.close)
+                self.io.shutdown()
+                self._wsgi.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _read_body(receive):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                return bytes(body)
+
+    async def _send_json(self, scope, send, request_id, status, payload):
+        body = serializer.dumps(payload, sort_keys=True)
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'x-request-id', request_id.encode('latin1')),
+                *_cors_headers(scope)
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _submission(self, session, scope, receive, send, request_id,
+                          validate_name, submit_name):
+        body = await self._read_body(receive)
+        if body is None:
+            return 499
+        try:
+            data = serializer.loads(body) if body else None
+        except ValueError:
+            await self._send_json(scope, send, request_id, 400, {"error": "Invalid JSON body"})
+            return 400
+
+        try:
+            error = getattr(session.voting_service, validate_name)(data)
+            if error is None:
+                # Only the recording touches storage
+                submit = getattr(session.voting_service, submit_name)
+                if main.profiler.armed:
+                    submit = functools.partial(main.profiler.call,
+                                               f"POST {route_rule(scope['path'])}", submit)
+                payload, status = await self.io.run(submit, data)
+            else:
+                payload, status = error
+        except Exception:
+            logger.exception("❌ Submission failed", extra={"request_id": request_id,
+                                                          "path": scope['path']})
+            payload, status = {"error": "Internal server error"}, 500
+        await self._send_json(scope, send, request_id, status, payload)
+        return status
+
+    @staticmethod
+    async def _read_lines(receive):
+        """Yield the request body line by line as it arrives.
+
+        At most one line plus one chunk is buffered: a line longer than
+        Config.MAX_VOTE_LINE_BYTES is yielded truncated to that length + 1
+        so VoteUpload.add rejects it. Raises ConnectionError on disconnect.
+        """
+        limit = Config.MAX_VOTE_LINE_BYTES
+        buffer = bytearray()
+        oversized = False
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise ConnectionError('client disconnected')
+            buffer += message.get('body', b'')
+            more = message.get('more_body', False)
+            while True:
+                end = buffer.find(b'\n')
+                if end < 0:
+                    break
+                line = bytes(buffer[:end + 1])
+                del buffer[:end + 1]
+                if oversized:
+                    # The rest of a line that was already rejected
+                    oversized = False
+                    continue
+                yield line
+            if len(buffer) > limit and not oversized:
+                oversized = True
+                yield bytes(buffer[:limit + 1])
+            if oversized:
+                buffer.clear()
+            if not more:
+                if buffer:
+                    yield bytes(buffer)
+                return
+
+    async def _vote_stream(self, session, scope, receive, send, request_id):
+        """Streamed /submit-all-votes: each round is stored as its line arrives"""
+        service = session.voting_service
+        lines = self._read_lines(receive)
+        upload = None
+        try:
+            header = await anext(lines, b'')
+            upload, error = await self.io.run(service.open_vote_upload, header)
+            if error is None:
+                async for line in lines:
+                    error = await self.io.run(upload.add, line)
+                    if error is not None:
+                        break
+            if error is None:
+                payload, status = await self.io.run(upload.finish)
+            else:
+                payload, status = error
+                if upload is not None:
+                    await self.io.run(upload.abort)
+        except ConnectionError:
+            if upload is not None:
+                await self.io.run(upload.abort)
+            return 499
+        except Exception:
+            logger.exception("❌ Submission failed", extra={"request_id": request_id,
+                                                          "path": scope['path']})
+            if upload is not None:
+                await self.io.run(upload.abort)
+            payload, status = {"error": "Internal server error"}, 500
+        await self._send_json(scope, send, request_id, status, payload)
+        return status
+
+    async def _events(self, session, scope, receive, send, request_id):
+        """Same stream as the Flask /events route, without holding a thread"""
+        relay = session.event_relay
+        await self.io.run(relay.start)
+        broadcaster = relay.broadcaster
+        last_event_id = _header(scope, b'last-event-id') or ''
+        cursor = int(last_event_id) if last_event_id.isdigit() else None
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+                (b'x-request-id', request_id.encode('latin1')),
+                *_cors_headers(scope)
+            ]
+        })
+
+        async def write(text):
+            await send({'type': 'http.response.body', 'body': text.encode(), 'more_body': True})
+
+        async def snapshot():
+            return format_event(broadcaster.last_id, 'status',
+                                await self.io.run(session.build_status_snapshot))
+
+        disconnected = asyncio.ensure_future(self._wait_for_disconnect(receive))
+        try:
+            await write("retry: 3000\n\n")
+            if cursor is None:
+                cursor = broadcaster.last_id
+                await write(await snapshot())
+            while not disconnected.done() and not session.closed:
+                waiting = asyncio.ensure_future(
+                    broadcaster.wait_async(cursor, Config.EVENTS_HEARTBEAT_INTERVAL))
+                await asyncio.wait({waiting, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if not waiting.done():
+                    waiting.cancel()
+                    break
+                events = waiting.result()
+                if events is None:
+                    cursor = broadcaster.last_id
+                    await write(await snapshot())
+                elif not events:
+                    await write(": keep-alive\n\n")
+                for event_id, event_type, data in events or ():
+                    cursor = event_id
+                    await write(format_event(event_id, event_type, data))
+        except OSError:
+            # The client went away while we were writing
+            pass
+        finally:
+            disconnected.cancel()
+        return 200
+
+    @staticmethod
+    async def _wait_for_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def _flask(self, scope, receive, send):
+        body = await self._read_body(receive)
+        if body is None:
+            return 499
+        status, headers, response_body = await self._wsgi.run(
+            call_wsgi, self.flask_app, wsgi_environ(scope, body))
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin1'), value.encode('latin1'))
+                        for name, value in headers]
+        })
+        await send({'type': 'http.response.body', 'body': response_body})
+        return status
+
+
+app = VoterASGIApp(main.app, main.sessions)
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness and load generator for the Voter App API
+
+Seeds a scratch working directory with a synthetic round0.json and voter
+roster, then drives the voting flow with concurrent virtual voters through
+the Flask test client and/or over real HTTP against a local server. In each
+round every voter loads its ideas, submits and saves its scores and checks
+the status board; finally every voter submits its final results. Latency percentiles
+(p50/p95/p99) and throughput are reported per endpoint.
+
+Everything runs offline on the local machine:
+
+    python benchmark.py --ideas 200 --voters 20 --concurrency 8
+    python benchmark.py --transport http --save-baseline baseline.json
+    python benchmark.py --transport http --baseline baseline.json --tolerance 0.25
+
+In regression mode the exit status is 1 when any endpoint's p95 or p99
+latency is more than `tolerance` slower than the stored baseline, and 2
+when the baseline was recorded with different parameters.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ENDPOINTS = [
+    'GET /ideas',
+    'POST /submit-vote',
+    'POST /save-scores',
+    'GET /all-users-status',
+    'POST /submit-final-results',
+]
+
+REGRESSION_METRICS = ('p95_ms', 'p99_ms')
+
+# Seconds to wait for aggregation jobs between transports
+JOB_WAIT_TIMEOUT = 60
+
+EXIT_REGRESSION = 1
+EXIT_PARAMS_MISMATCH = 2
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def make_ideas(count):
+    return [{
+        "id": f"idea-{i:05d}",
+        "title": f"Synthetic idea {i}",
+        "description": f"Benchmark idea number {i} " + "lorem ipsum " * 8
+    } for i in range(1, count + 1)]
+
+
+def make_roster(count):
+    return [f"voter{i:04d}@bench.local" for i in range(1, count + 1)]
+
+
+def score_ideas(ideas, rng):
+    """Score ideas at the per-round maximum of 2s and 1s, the rest 0"""
+    total = len(ideas)
+    scores = [2] * int(total * 0.2) + [1] * int(total * 0.4)
+    scores += [0] * (total - len(scores))
+    rng.shuffle(scores)
+    return [dict(idea, score=score) for idea, score in zip(ideas, scores)]
+
+
+class Recorder:
+    """Thread-safe collection of per-endpoint latencies"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {endpoint: [] for endpoint in ENDPOINTS}
+        self.errors = {endpoint: 0 for endpoint in ENDPOINTS}
+
+    def add(self, endpoint, seconds, ok):
+        with self._lock:
+            self.samples[endpoint].append(seconds * 1000)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def summary(self, wall_seconds):
+        results = {}
+        for endpoint, samples in self.samples.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            results[endpoint] = {
+                "requests": len(ordered),
+                "errors": self.errors[endpoint],
+                "mean_ms": round(sum(ordered) / len(ordered), 3),
+                "p50_ms": round(percentile(ordered, 50), 3),
+                "p95_ms": round(percentile(ordered, 95), 3),
+                "p99_ms": round(percentile(ordered, 99), 3),
+                "max_ms": round(ordered[-1], 3),
+                "throughput_rps": round(len(ordered) / wall_seconds, 1) if wall_seconds else 0.0
+            }
+        return results
+
+
+class TestClientTransport:
+    """Calls the app in-process through one Flask test client per thread"""
+
+    name = 'client'
+
+    def __init__(self, app):
+        self._app = app
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, 'client'):
+            self._local.client = self._app.test_client()
+        return self._local.client
+
+    def request(self, method, path, body=None):
+        response = self._client().open(path, method=method, json=body)
+        return response.status_code, response.get_json(silent=True)
+
+    def close(self):
+        pass
+
+
+class HTTPTransport:
+    """Calls a threaded werkzeug server on a local port over real sockets"""
+
+    name = 'http'
+
+    def __init__(self, app):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietRequestHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self._server = make_server('127.0.0.1', 0, app, threaded=True,
+                                   request_handler=QuietRequestHandler)
+        self._base = f'http://127.0.0.1:{self._server.server_port}'
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='bench-server', daemon=True)
+        self._thread.start()
+        # Never route benchmark traffic through a configured proxy
+        self._opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self._base + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+        try:
+            with self._opener.open(req, timeout=60) as response:
+                return response.status, json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+    def close(self):
+        self._server.shutdown()
+        self._thread.join()
+
+
+def timed(recorder, transport, endpoint, path, body=None):
+    method = endpoint.split(' ', 1)[0]
+    started = time.perf_counter()
+    status, payload = transport.request(method, path, body)
+    recorder.add(endpoint, time.perf_counter() - started, 200 <= status < 300)
+    return status, payload
+
+
+class VirtualVoter:
+    """One roster member going through the voting flow"""
+
+    def __init__(self, email, seed):
+        self.email = email
+        self.rng = random.Random(seed)
+        self.final_scores = {}
+        self.last_ideas = []
+
+    def vote(self, transport, recorder, round_num):
+        """Load, submit and save scores for the given (current) round.
+
+        Scores are saved after the vote with an explicit round: a saved score
+        already counts towards round completion, so saving first could let
+        another voter's submission close the round early.
+        """
+        _, ideas = timed(recorder, transport, 'GET /ideas', f'/ideas?email={self.email}')
+        if not isinstance(ideas, list) or not ideas:
+            return
+        self.last_ideas = ideas
+        scored = score_ideas(ideas, self.rng)
+        timed(recorder, transport, 'POST /submit-vote', '/submit-vote',
+              {"email": self.email, "ideas": scored})
+        timed(recorder, transport, 'POST /save-scores', '/save-scores',
+              {"email": self.email, "ideas": scored, "round": round_num})
+        timed(recorder, transport, 'GET /all-users-status', '/all-users-status')
+        for idea in scored:
+            self.final_scores[idea['id']] = self.final_scores.get(idea['id'], 0) + idea['score']
+
+    def submit_final_results(self, transport, recorder):
+        final_results = [{
+            "id": idea['id'],
+            "title": idea['title'],
+            "description": idea['description'],
+            "finalScore": self.final_scores.get(idea['id'], 0)
+        } for idea in self.last_ideas]
+        timed(recorder, transport, 'POST /submit-final-results', '/submit-final-results',
+              {"email": self.email, "finalResults": final_results})
+        timed(recorder, transport, 'GET /all-users-status', '/all-users-status')
+
+
+def run_workload(transport, roster, args, first_round=0):
+    """Every voter votes once per round, then everyone submits final results.
+
+    Voters run concurrently within a phase; a phase ends when all voters are
+    done, so the last vote of a round is what advances it, as in real use.
+    """
+    recorder = Recorder()
+    voters = [VirtualVoter(email, args.seed + index) for index, email in enumerate(roster)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for round_num in range(first_round, first_round + args.rounds):
+            list(pool.map(lambda voter: voter.vote(transport, recorder, round_num), voters))
+        list(pool.map(lambda voter: voter.submit_final_results(transport, recorder), voters))
+    wall = time.perf_counter() - started
+    return recorder.summary(wall), wall
+
+
+def prepare_workdir(workdir, args):
+    """Write the synthetic seed files and point the app at them"""
+    with open(os.path.join(workdir, 'round0.json'), 'w') as f:
+        json.dump(make_ideas(args.ideas), f)
+
+    os.environ['STORAGE_BACKEND'] = args.backend
+    os.environ['SQLITE_PATH'] = os.path.join(workdir, 'voter.db')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.chdir(workdir)
+
+
+def load_app(roster):
+    """Import the app from the scratch directory and install the roster"""
+    sys.path.insert(0, BASE_DIR)
+    import main
+
+    main.default_session.roster.replace(roster)
+    return main
+
+
+def run_benchmark(args):
+    roster = make_roster(args.voters)
+    transports = ['client', 'http'] if args.transport == 'both' else [args.transport]
+    original_cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='voter-bench-')
+    report = {
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "params": {
+            "ideas": args.ideas,
+            "voters": args.voters,
+            "rounds": args.rounds,
+            "concurrency": args.concurrency,
+            "backend": args.backend,
+            "seed": args.seed
+        },
+        "transports": {}
+    }
+
+    try:
+        prepare_workdir(workdir, args)
+        main = load_app(roster)
+        session = main.default_session
+        first_round = 0
+        for name in transports:
+            if first_round:
+                # Later transports restart from the seed ideas in a new round
+                session.round_store.start_round(first_round, make_ideas(args.ideas))
+            transport = (HTTPTransport if name == 'http' else TestClientTransport)(main.app)
+            try:
+                endpoints, wall = run_workload(transport, roster, args, first_round)
+            finally:
+                transport.close()
+            report["transports"][name] = {
+                "wall_seconds": round(wall, 3),
+                "rounds_completed": session.get_current_round() - first_round,
+                "endpoints": endpoints
+            }
+            first_round = session.get_current_round() + 1
+            reset_submissions(main, session, roster)
+    finally:
+        os.chdir(original_cwd)
+        if args.keep_workdir:
+            print(f"Benchmark data kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return report
+
+
+def reset_submissions(main, session, roster, timeout=JOB_WAIT_TIMEOUT):
+    """Wait for aggregation jobs and forget final results between transports"""
+    deadline = time.monotonic() + timeout
+    for name in (main.FINAL_RESULTS_JOB, main.NORMALIZE_JOB):
+        job = session.job_queue.latest(name)
+        while job is not None and not job.done:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Job {job.name} ({job.id}) did not finish in {timeout}s")
+            time.sleep(0.05)
+            # A finished job may have started a rerun under a new id
+            job = session.job_queue.latest(name)
+    session.round_store.compact()
+    session.storage.delete_user_final_results(roster)
+
+
+def print_report(report):
+    params = report["params"]
+    print(f"\n🏁 Voter App benchmark - {params['ideas']} ideas, {params['voters']} voters, "
+          f"{params['rounds']} rounds, concurrency {params['concurrency']}, "
+          f"{params['backend']} backend")
+    header = f"{'endpoint':<28}{'reqs':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}" \
+             f"{'p99 ms':>10}{'max ms':>10}{'req/s':>9}"
+    for name, result in report["transports"].items():
+        print(f"\n[{name}] {result['wall_seconds']}s wall, {result['rounds_completed']} rounds completed")
+        print(header)
+        for endpoint, stats in result["endpoints"].items():
+            print(f"{endpoint:<28}{stats['requests']:>7}{stats['errors']:>5}"
+                  f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+                  f"{stats['max_ms']:>10.2f}{stats['throughput_rps']:>9.1f}")
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Return a list of regressions of report against baseline.
+
+    Only reports made with the same parameters are comparable; check with
+    params_match() first.
+    """
+    regressions = []
+    for name, result in report["transports"].items():
+        base_result = baseline.get("transports", {}).get(name)
+        if base_result is None:
+            print(f"⚠️  No baseline for transport '{name}'")
+            continue
+        for endpoint, stats in result["endpoints"].items():
+            base_stats = base_result["endpoints"].get(endpoint)
+            if base_stats is None:
+                continue
+            for metric in REGRESSION_METRICS:
+                limit = base_stats[metric] * (1 + tolerance)
+                if stats[metric] > limit:
+                    regressions.append(
+                        f"[{name}] {endpoint} {metric}: {stats[metric]:.2f} ms "
+                        f"(baseline {base_stats[metric]:.2f} ms, limit {limit:.2f} ms)")
+    return regressions
+
+
+def params_match(report, baseline):
+    return baseline.get("params") == report["params"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Voter App API")
+    parser.add_argument('--ideas', type=int, default=100, help="Ideas in the seeded round 0")
+    parser.add_argument('--voters', type=int, default=10, help="Size of the synthetic roster")
+    parser.add_argument('--rounds', type=int, default=3, help="Rounds each voter votes in")
+    parser.add_argument('--concurrency', type=int, default=4, help="Concurrent virtual voters")
+    parser.add_argument('--transport', choices=['client', 'http', 'both'], default='both')
+    parser.add_argument('--backend', choices=['json', 'sqlite'], default='json')
+    parser.add_argument('--seed', type=int, default=42, help="Seed for the synthetic scores")
+    parser.add_argument('--output', help="Write the full report as JSON to this file")
+    parser.add_argument('--save-baseline', metavar='FILE', help="Store the report as a baseline")
+    parser.add_argument('--baseline', metavar='FILE', help="Compare against a stored baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed slowdown over the baseline (0.25 = 25%%)")
+    parser.add_argument('--keep-workdir', action='store_true',
+                        help="Keep the scratch directory with the generated data")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmark(args)
+    print_report(report)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"\n💾 Report written to {path}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if not params_match(report, baseline):
+            print("\n❌ Baseline was recorded with different parameters, not comparing:")
+            print(f"  baseline: {baseline.get('params')}")
+            print(f"  this run: {report['params']}")
+            return EXIT_PARAMS_MISMATCH
+        regressions = compare_to_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) over {args.tolerance:.0%} tolerance:")
+            for line in regressions:
+                print(f"  {line}")
+            return EXIT_REGRESSION
+        print(f"\n✅ No regressions over {args.tolerance:.0%} tolerance")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Clustered deployment of the Voter App API
+
+Several API nodes serve the same voting sessions. Their state lives in a
+shared Redis-protocol store (STORAGE_BACKEND=redis, see kvstore.py and
+storage.KeyValueStorage), so any node could serve any request; the
+storage's version stamps make a node reload a round, the round pointer
+or the roster once another node changed it, and its lease locks let only
+one node at a time start a round or save the final results.
+
+For their caches, event relays and per-voter views to stay warm, each
+session is still served by one node: the one a consistent-hash ring over
+the live nodes assigns it to. A request that reaches another node is
+redirected there (307, so the method and body are kept). Adding or
+removing a node only moves the sessions of the ring points it gains or
+loses.
+
+Nodes register themselves in the store with a heartbeat: a key per node,
+holding its URL, that expires CLUSTER_NODE_TTL seconds after the last
+heartbeat. Every node rebuilds its ring from the registered nodes at each
+heartbeat, so a node that stopped is dropped from every ring within the
+TTL and its sessions move to the remaining nodes. The server workers of a
+node share its id and all keep it registered.
+"""
+import bisect
+import hashlib
+import threading
+
+from logging_config import get_logger
+
+logger = get_logger('cluster')
+
+
+def _point(key):
+    # Stable across processes and nodes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hashing of keys onto nodes, with replicas points per node"""
+
+    def __init__(self, nodes, replicas=64):
+        self.nodes = sorted(set(nodes))
+        points = sorted((_point(f'{node}#{replica}'), node)
+                        for node in self.nodes for replica in range(replicas))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node(self, key):
+        """The node owning key, None for an empty ring"""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _point(key)) % len(self._points)
+        return self._owners[index]
+
+
+class Cluster:
+    """This node's view of the cluster: the live nodes and the ring over them"""
+
+    def __init__(self, client, node_id, url, prefix='voter:', heartbeat_interval=2,
+                 node_ttl=10, replicas=64):
+        self._client = client
+        self.node_id = node_id
+        self.url = url.rstrip('/')
+        self._prefix = prefix
+        self._heartbeat_interval = heartbeat_interval
+        self._node_ttl = node_ttl
+        self._replicas = replicas
+        self._stop = threading.Event()
+        self._thread = None
+        # (members {node id: url}, HashRing), replaced as a whole
+        self._view = ({node_id: self.url}, HashRing([node_id], replicas))
+
+    def _key(self, *parts):
+        return self._prefix + ':'.join(parts)
+
+    def start(self):
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name='cluster-heartbeat', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self._heartbeat_interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Cluster heartbeat failed")
+
+    def refresh(self):
+        """Renew this node's registration and rebuild the ring from the live nodes"""
+        pipe = self._client.pipeline()
+        pipe.set(self._key('node', self.node_id), self.url, px=int(self._node_ttl * 1000))
+        pipe.sadd(self._key('nodes'), self.node_id)
+        pipe.execute()
+
+        node_ids = sorted(node_id.decode() for node_id in self._client.smembers(self._key('nodes')))
+        pipe = self._client.pipeline()
+        for node_id in node_ids:
+            pipe.get(self._key('node', node_id))
+        members, expired = {}, []
+        for node_id, url in zip(node_ids, pipe.execute()):
+            if url is None:
+                expired.append(node_id)
+            else:
+                members[node_id] = url.decode()
+        if expired:
+            # A node that comes back registers itself again
+            self._client.srem(self._key('nodes'), *expired)
+        members[self.node_id] = self.url
+
+        previous = self.members
+        if members != previous:
+            logger.info("Cluster membership changed", extra={
+                "node": self.node_id, "nodes": sorted(members),
+                "joined": sorted(members.keys() - previous.keys()),
+                "left": sorted(previous.keys() - members.keys())})
+            self._view = (members, HashRing(members, self._replicas))
+
+    @property
+    def members(self):
+        return self._view[0]
+
+    def owner(self, key):
+        return self._view[1].node(key)
+
+    def owns(self, key):
+        return self.owner(key) == self.node_id
+
+    def owner_url(self, key):
+        """Base URL of the node serving key, None if it is this node"""
+        members, ring = self._view
+        node_id = ring.node(key)
+        return None if node_id == self.node_id else members[node_id]
@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,6 +10,90 @@ class Config:
     PORT = int(os.getenv('PORT', 8080))
     ENV = os.getenv('ENV', 'development')
 
+    # Production server (run.py with ENV=production)
+    SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', os.cpu_count() or 1))
+    SERVER_THREADS = int(os.getenv('SERVER_THREADS', 4))
+    SERVER_TIMEOUT = int(os.getenv('SERVER_TIMEOUT', 60))
+
+    # Async server (run.py --async): threads for storage I/O of the native
+    # async endpoints, and for the routes still served by Flask
+    ASYNC_IO_WORKERS = int(os.getenv('ASYNC_IO_WORKERS', 8))
+    ASYNC_WSGI_THREADS = int(os.getenv('ASYNC_WSGI_THREADS', SERVER_THREADS))
+
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # 'text' or 'json'
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+    SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 500))
+
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json')
+    SQLITE_PATH = os.getenv('SQLITE_PATH', 'voter.db')
+    ROUND_MANIFEST_FILE = os.getenv('ROUND_MANIFEST_FILE', 'manifest.json')
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+    SCORE_LOG_COMPACTION_INTERVAL = float(os.getenv('SCORE_LOG_COMPACTION_INTERVAL', 5))
+    # fsync data files (JSON backend); score saves arriving within the group
+    # interval of each other share one fsync
+    DURABLE_WRITES = os.getenv('DURABLE_WRITES', 'True').lower() == 'true'
+    FSYNC_GROUP_INTERVAL_MS = float(os.getenv('FSYNC_GROUP_INTERVAL_MS', 5))
+    # Eligible voters: 'file' (ROSTER_FILE) or 'storage' (see roster.py),
+    # checked for changes every ROSTER_RELOAD_INTERVAL seconds
+    ROSTER_SOURCE = os.getenv('ROSTER_SOURCE', 'file')
+    ROSTER_FILE = os.getenv('ROSTER_FILE', 'roster.json')
+    ROSTER_RELOAD_INTERVAL = float(os.getenv('ROSTER_RELOAD_INTERVAL', 5))
+    # Voting sessions other than 'default' (see sessions.py): one directory
+    # each under SESSIONS_DIR; at most SESSIONS_MAX_LOADED are kept in memory
+    SESSIONS_DIR = os.getenv('SESSIONS_DIR', 'sessions')
+    SESSIONS_MAX_LOADED = int(os.getenv('SESSIONS_MAX_LOADED', 256))
+    # Clustered deployment (see cluster.py). STORAGE_BACKEND=redis keeps
+    # every session's state in the Redis-protocol store at REDIS_URL
+    # (local://<name> for the in-process stand-in of kvstore.py), under
+    # REDIS_PREFIX; its locks are leases that expire REDIS_LOCK_TTL seconds
+    # after their holder stopped renewing them
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    REDIS_PREFIX = os.getenv('REDIS_PREFIX', 'voter:')
+    REDIS_LOCK_TTL = float(os.getenv('REDIS_LOCK_TTL', 10))
+    # With CLUSTER_ENABLED each session is served by one node of those
+    # registered in the store, chosen by consistent hashing; the others
+    # redirect its requests to CLUSTER_NODE_URL of that node
+    CLUSTER_ENABLED = os.getenv('CLUSTER_ENABLED', 'False').lower() == 'true'
+    CLUSTER_NODE_ID = os.getenv('CLUSTER_NODE_ID', socket.gethostname())
+    CLUSTER_NODE_URL = os.getenv('CLUSTER_NODE_URL', f'http://{CLUSTER_NODE_ID}:{PORT}')
+    CLUSTER_HEARTBEAT_INTERVAL = float(os.getenv('CLUSTER_HEARTBEAT_INTERVAL', 2))
+    CLUSTER_NODE_TTL = float(os.getenv('CLUSTER_NODE_TTL', 10))
+    CLUSTER_RING_REPLICAS = int(os.getenv('CLUSTER_RING_REPLICAS', 64))
+    # Round advancement: 'total', 'normalized' or 'random' (see advancement.py)
+    ADVANCEMENT_MODE = os.getenv('ADVANCEMENT_MODE', 'total')
+    ADVANCEMENT_KEEP_FRACTION = float(os.getenv('ADVANCEMENT_KEEP_FRACTION', 0.7))
+    ADVANCEMENT_MIN_SCORE = (float(os.environ['ADVANCEMENT_MIN_SCORE'])
+                             if os.getenv('ADVANCEMENT_MIN_SCORE') else None)
+    ADVANCEMENT_SEED = int(os.environ['ADVANCEMENT_SEED']) if os.getenv('ADVANCEMENT_SEED') else None
+    # 'orjson', 'json' or 'auto' (orjson when installed)
+    JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')
+    # Write indented JSON data files (debugging only; much slower)
+    JSON_PRETTY = os.getenv('JSON_PRETTY', 'False').lower() == 'true'
+    # Largest accepted line (one round) of a streamed /submit-all-votes body
+    MAX_VOTE_LINE_BYTES = int(os.getenv('MAX_VOTE_LINE_BYTES', 1024 * 1024))
+
+    # GET /events (Server-Sent Events)
+    EVENTS_POLL_INTERVAL = float(os.getenv('EVENTS_POLL_INTERVAL', 0.5))
+    EVENTS_HEARTBEAT_INTERVAL = float(os.getenv('EVENTS_HEARTBEAT_INTERVAL', 15))
+    EVENTS_BUFFER_SIZE = int(os.getenv('EVENTS_BUFFER_SIZE', 1000))
+
+    # Required in the X-Admin-Token header of /admin endpoints, which are
+    # disabled while it is unset
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+    # Where profiles armed through /admin/profiles are written
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+    # GET /metrics (Prometheus text format)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+
+    # Cached read endpoints (ETag / 304 / precompressed bodies), shared by
+    # all sessions
+    RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 1024))
+    # Memory for the per-voter GET /ideas bodies, per loaded session
+    IDEAS_VIEW_CACHE_MB = float(os.getenv('IDEAS_VIEW_CACHE_MB', 64))
+    RESPONSE_GZIP_MIN_SIZE = int(os.getenv('RESPONSE_GZIP_MIN_SIZE', 1024))
+
     MAX_SCORE_2_PERCENTAGE = 0.4
     MAX_SCORE_1_PERCENTAGE = 0.3
 
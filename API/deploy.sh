@@ -28,5 +28,5 @@ echo "🌐 Starting API server..."
 echo "API will be available at http://localhost:5000"
 echo "Press Ctrl+C to stop the server"
 
-# Start the server
-python main.py
\ No newline at end of file
+# Start the production server (gunicorn, SERVER_WORKERS x SERVER_THREADS)
+python run.py --production
\ No newline at end of file
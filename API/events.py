@@ -0,0 +1,167 @@
+"""
+Server-Sent Events for the Voter App API
+
+Voting state changes (a round started, a vote recorded, final results
+submitted or ready) are appended to the storage's event log, so every
+server worker sees the events of the others. One relay thread per worker
+and voting session, started by the session's first /events client, tails
+the log and publishes new events to an EventBroadcaster.
+
+Connected clients do not get a queue of their own: each only keeps the id
+of the last event it was sent and reads newer events from the
+broadcaster's shared ring buffer. An idle connection therefore costs a
+cursor and a wait on one condition, and publishing is a single
+notify_all() however many clients are connected. Clients served by an
+event loop (see asgi.py) wait on one future per loop instead of a thread.
+"""
+import asyncio
+import threading
+from collections import deque
+from datetime import datetime
+
+from logging_config import get_logger
+import serializer
+
+logger = get_logger('events')
+
+
+def format_event(event_id, event_type, data):
+    """Render one event in the text/event-stream wire format"""
+    return f"id: {event_id}\nevent: {event_type}\ndata: {serializer.dumps_text(data)}\n\n"
+
+
+def _resolve(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class EventBroadcaster:
+    """Ring buffer of recent events shared by all subscribers of a worker"""
+
+    def __init__(self, buffer_size):
+        self._events = deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        # Events with an id up to the horizon are no longer buffered
+        self._horizon = 0
+        self.last_id = 0
+        # Event loop -> future shared by all of that loop's waiting clients
+        self._loop_waiters = {}
+
+    def reset(self, event_id):
+        """Start publishing after event_id, forgetting older events"""
+        with self._condition:
+            self._events.clear()
+            self._horizon = self.last_id = event_id
+
+    def publish(self, event_id, event_type, data):
+        with self._condition:
+            if len(self._events) == self._events.maxlen:
+                self._horizon = self._events[0][0]
+            self._events.append((event_id, event_type, data))
+            self.last_id = event_id
+            self._condition.notify_all()
+            for loop, waiter in self._loop_waiters.items():
+                try:
+                    loop.call_soon_threadsafe(_resolve, waiter)
+                except RuntimeError:
+                    # The loop has been closed
+                    pass
+            self._loop_waiters.clear()
+
+    def _newer(self, last_id):
+        if last_id < self._horizon:
+            return None
+        newer = []
+        for event in reversed(self._events):
+            if event[0] <= last_id:
+                break
+            newer.append(event)
+        newer.reverse()
+        return newer
+
+    def wait(self, last_id, timeout):
+        """Events published after last_id, waiting up to timeout for one.
+
+        Returns an empty list on timeout, and None if some of the events
+        after last_id have already left the buffer.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.last_id > last_id, timeout)
+            return self._newer(last_id)
+
+    async def wait_async(self, last_id, timeout):
+        """wait() for coroutines: suspends the caller without holding a thread"""
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            waiter = None
+            if self.last_id <= last_id:
+                waiter = self._loop_waiters.get(loop)
+                if waiter is None:
+                    waiter = self._loop_waiters[loop] = loop.create_future()
+        if waiter is not None:
+            try:
+                # Shielded: one client timing out must not cancel the future
+                # the loop's other clients are waiting on
+                await asyncio.wait_for(asyncio.shield(waiter), timeout)
+            except asyncio.TimeoutError:
+                pass
+        with self._condition:
+            return self._newer(last_id)
+
+
+class EventRelay:
+    """Writes events to the shared log and tails it into a broadcaster"""
+
+    def __init__(self, storage, broadcaster, poll_interval):
+        self._storage = storage
+        self.broadcaster = broadcaster
+        self._poll_interval = poll_interval
+        self._last_id = None
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopped = False
+        self._lock = threading.Lock()
+
+    def publish(self, event_type, data):
+        """Append an event to the shared log; every worker's relay picks it up"""
+        event = {
+            "type": event_type,
+            "data": data,
+            "ts": datetime.utcnow().isoformat() + "Z"
+        }
+        try:
+            self._storage.append_event(event)
+        except Exception:
+            logger.exception("Could not append event", extra={"event": event_type})
+            return
+        self._wake.set()
+
+    def start(self):
+        """Start tailing the log, from its current end, on first use"""
+        with self._lock:
+            if self._thread is not None or self._stopped:
+                return
+            self._last_id = self._storage.last_event_id()
+            self.broadcaster.reset(self._last_id)
+            self._thread = threading.Thread(
+                target=self._relay_loop, name='event-relay', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop tailing the log (the relay of a session being unloaded)"""
+        with self._lock:
+            self._stopped = True
+        self._wake.set()
+
+    def _relay_loop(self):
+        while not self._stopped:
+            self._wake.wait(self._poll_interval)
+            self._wake.clear()
+            if self._stopped:
+                return
+            try:
+                for event_id, event in self._storage.read_events(self._last_id):
+                    self.broadcaster.publish(event_id, event['type'], event['data'])
+                    self._last_id = event_id
+            except Exception:
+                logger.exception("Error reading the event log")
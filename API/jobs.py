@@ -0,0 +1,227 @@
+"""
+In-process background job queue for the Voter App API
+
+Long-running work such as final-result aggregation is submitted here so it
+runs on a worker thread instead of inside the HTTP request that triggered
+it. Each job records its status and progress for GET /jobs/<id>. When a
+store is given, job status is persisted there so that every server worker
+sees the jobs started by the others.
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+
+from logging_config import get_logger
+
+logger = get_logger('jobs')
+
+# Process ids are only meaningful on the host that ran the job
+HOST = socket.gethostname()
+
+
+class Job:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = Job.QUEUED
+        self.progress = 0.0
+        self.error = None
+        self.rerun = False
+        self.worker = os.getpid()
+        self.host = HOST
+        self.created_at = datetime.utcnow().isoformat() + "Z"
+        self.started_at = None
+        self.finished_at = None
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls.__new__(cls)
+        job.id = data['id']
+        job.name = data['name']
+        job.status = data['status']
+        job.progress = data['progress']
+        job.error = data['error']
+        job.rerun = data.get('rerun', False)
+        job.worker = data.get('worker')
+        job.host = data.get('host')
+        job.created_at = data['created_at']
+        job.started_at = data['started_at']
+        job.finished_at = data['finished_at']
+        if (not job.done and job.worker and job.host in (None, HOST)
+                and not _process_alive(job.worker)):
+            job.status = Job.FAILED
+            job.error = "Worker exited before the job finished"
+        return job
+
+    @property
+    def done(self):
+        return self.status in (Job.COMPLETED, Job.FAILED)
+
+    def set_progress(self, progress):
+        self.progress = round(min(max(progress, 0.0), 1.0), 4)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "rerun": self.rerun,
+            "worker": self.worker,
+            "host": self.host,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """Thread pool that runs named jobs and keeps their status.
+
+    on_finished(job), if given, is called after each job completes or fails.
+    Queues may share the threads of one executor (e.g. one queue per voting
+    session); max_workers is then ignored.
+    """
+
+    def __init__(self, max_workers, history=100, store=None, on_finished=None, executor=None):
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_workers,
+                                                        thread_name_prefix='job')
+        self._jobs = {}
+        self._latest = {}
+        self._history = history
+        self._store = store
+        self._on_finished = on_finished
+        self._lock = threading.Lock()
+
+    def _store_lock(self):
+        return self._store.lock('jobs') if self._store is not None else nullcontext()
+
+    def _persist(self, job):
+        if self._store is None:
+            return
+        try:
+            with self._store_lock():
+                # A rerun may have been requested by another server worker
+                stored = self._store.load_job(job.id)
+                if stored is not None and stored.get('rerun'):
+                    job.rerun = True
+                self._store.save_job(job.to_dict())
+        except Exception:
+            logger.exception("Could not persist job status", extra={"job_id": job.id})
+
+    def submit(self, name, fn, *args, **kwargs):
+        """Queue fn(*args, progress=job.set_progress, **kwargs).
+
+        If a job with the same name is already queued or running, it is marked
+        for a rerun and returned instead of starting a duplicate; the rerun
+        starts once it finishes, so input submitted meanwhile is not missed.
+        With a store this also covers jobs started by other server workers.
+        """
+        # The check and the persisted claim happen under the store's lock, so
+        # two workers cannot both decide that no job is running
+        with self._store_lock(), self._lock:
+            current = self.latest(name)
+            if current is not None and not current.done:
+                if not current.rerun:
+                    current.rerun = True
+                    self._persist(current)
+                    logger.info("Job rerun requested", extra={"job": name, "job_id": current.id})
+                return current
+
+            job = Job(name)
+            self._jobs[job.id] = job
+            self._latest[name] = job
+            self._trim()
+            self._persist(job)
+
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = Job.RUNNING
+        job.started_at = datetime.utcnow().isoformat() + "Z"
+        self._persist(job)
+        started = time.perf_counter()
+
+        def progress(fraction):
+            job.set_progress(fraction)
+            self._persist(job)
+
+        try:
+            fn(*args, progress=progress, **kwargs)
+            job.set_progress(1.0)
+            job.status = Job.COMPLETED
+        except Exception as e:
+            logger.exception("❌ Job failed", extra={"job": job.name, "job_id": job.id})
+            job.error = str(e)
+            job.status = Job.FAILED
+        finally:
+            job.finished_at = datetime.utcnow().isoformat() + "Z"
+            # Finishing and checking for a rerun request happen under the same
+            # lock as submit(), so a request is either seen here or starts a
+            # new job itself
+            with self._store_lock(), self._lock:
+                self._persist(job)
+                rerun = job.rerun
+            logger.info("Job finished", extra={
+                "job": job.name, "job_id": job.id, "status": job.status,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2)})
+
+        if self._on_finished is not None:
+            try:
+                self._on_finished(job)
+            except Exception:
+                logger.exception("Job finished callback failed", extra={"job_id": job.id})
+        if rerun:
+            self.submit(job.name, fn, *args, **kwargs)
+
+    def _trim(self):
+        """Forget the oldest finished jobs beyond the history limit"""
+        if len(self._jobs) <= self._history:
+            return
+        latest_ids = {job.id for job in self._latest.values()}
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self._history:
+                break
+            job = self._jobs[job_id]
+            if job.done and job_id not in latest_ids:
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None and self._store is not None:
+            data = self._store.load_job(job_id)
+            job = Job.from_dict(data) if data else None
+        return job
+
+    def latest(self, name):
+        local = self._latest.get(name)
+        if self._store is None:
+            return local
+        data = self._store.latest_job(name)
+        if data is None:
+            return local
+        if local is not None and local.id == data['id']:
+            return local
+        return Job.from_dict(data)
@@ -0,0 +1,461 @@
+"""
+Redis-protocol key-value store shared by the nodes of a cluster
+
+connect(url) returns the client used by the 'redis' storage backend
+(storage.KeyValueStorage), the shared session catalog and the cluster
+membership (cluster.py):
+
+    redis://host:6379/0     a Redis (or Redis-compatible) server, through the
+    rediss://, unix://      redis package
+    local://name            LocalStore, an in-process stand-in for tests and
+                            single-process development
+
+Only a small subset of commands is used, the ones LocalStore implements
+with the same results as redis-py: strings with NX and PX expiry, INCR,
+hashes, lists, sets, RENAME, MULTI/EXEC pipelines and the Lua scripts
+defined with Script. Values come back as bytes.
+
+LeaseLock is the cluster-wide counterpart of storage.ProcessLock: a lease
+key set with NX and an expiry, renewed while it is held, so the lock of a
+node that died is released after its TTL.
+"""
+import threading
+import time
+import uuid
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - only needed for a real server
+    redis = None
+
+from logging_config import get_logger
+
+logger = get_logger('kvstore')
+
+LOCAL_SCHEME = 'local://'
+
+
+def _encode(value):
+    # The conversions redis-py applies to command arguments
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode()
+    if isinstance(value, (int, float)):
+        return repr(value).encode()
+    raise TypeError(f"Invalid value for the key-value store: {value!r}")
+
+
+def _range(length, start, end):
+    """Python slice bounds of a Redis LRANGE/LTRIM index range"""
+    if start < 0:
+        start = max(length + start, 0)
+    if end < 0:
+        end = length + end
+    return start, max(min(end + 1, length), start)
+
+
+class LocalStore:
+    """In-process stand-in for a Redis server.
+
+    Every command runs under one lock, so a pipeline or a Script's local
+    implementation is atomic like MULTI/EXEC and EVAL on a server.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._data = {}
+        self._expires = {}
+
+    def _get(self, name, default=None):
+        name = _encode(name)
+        expires = self._expires.get(name)
+        if expires is not None and expires <= time.monotonic():
+            del self._expires[name]
+            self._data.pop(name, None)
+        return self._data.get(name, default)
+
+    def _put(self, name, value):
+        name = _encode(name)
+        self._expires.pop(name, None)
+        self._data[name] = value
+
+    def _container(self, name, factory):
+        with self.lock:
+            value = self._get(name)
+            if value is None:
+                value = factory()
+                self._data[_encode(name)] = value
+            return value
+
+    def _drop_if_empty(self, name, value):
+        if not value:
+            self._data.pop(_encode(name), None)
+
+    # Strings
+    def get(self, name):
+        with self.lock:
+            return self._get(name)
+
+    def set(self, name, value, px=None, nx=False):
+        with self.lock:
+            if nx and self._get(name) is not None:
+                return None
+            self._put(name, _encode(value))
+            if px is not None:
+                self._expires[_encode(name)] = time.monotonic() + px / 1000
+            return True
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            value = int(self._get(name, b'0')) + amount
+            self._data[_encode(name)] = _encode(value)
+            return value
+
+    def pexpire(self, name, time_ms):
+        with self.lock:
+            if self._get(name) is None:
+                return False
+            self._expires[_encode(name)] = time.monotonic() + time_ms / 1000
+            return True
+
+    # Keys
+    def delete(self, *names):
+        with self.lock:
+            deleted = 0
+            for name in names:
+                if self._get(name) is not None:
+                    del self._data[_encode(name)]
+                    self._expires.pop(_encode(name), None)
+                    deleted += 1
+            return deleted
+
+    def exists(self, *names):
+        with self.lock:
+            return sum(1 for name in names if self._get(name) is not None)
+
+    def rename(self, src, dst):
+        with self.lock:
+            value = self._get(src)
+            if value is None:
+                raise KeyError(f"no such key: {src!r}")
+            expires = self._expires.pop(_encode(src), None)
+            del self._data[_encode(src)]
+            self._put(dst, value)
+            if expires is not None:
+                self._expires[_encode(dst)] = expires
+            return True
+
+    # Hashes
+    def hget(self, name, key):
+        with self.lock:
+            return self._get(name, {}).get(_encode(key))
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        with self.lock:
+            fields = self._container(name, dict)
+            items = dict(mapping or {})
+            if key is not None:
+                items[key] = value
+            added = 0
+            for field, field_value in items.items():
+                if _encode(field) not in fields:
+                    added += 1
+                fields[_encode(field)] = _encode(field_value)
+            return added
+
+    def hexists(self, name, key):
+        with self.lock:
+            return _encode(key) in self._get(name, {})
+
+    def hlen(self, name):
+        with self.lock:
+            return len(self._get(name, {}))
+
+    def hmget(self, name, keys):
+        with self.lock:
+            fields = self._get(name, {})
+            return [fields.get(_encode(key)) for key in keys]
+
+    def hgetall(self, name):
+        with self.lock:
+            return dict(self._get(name, {}))
+
+    def hkeys(self, name):
+        with self.lock:
+            return list(self._get(name, {}))
+
+    def hdel(self, name, *keys):
+        with self.lock:
+            fields = self._get(name, {})
+            deleted = sum(1 for key in keys if fields.pop(_encode(key), None) is not None)
+            self._drop_if_empty(name, fields)
+            return deleted
+
+    # Lists
+    def rpush(self, name, *values):
+        with self.lock:
+            items = self._container(name, list)
+            items.extend(_encode(value) for value in values)
+            return len(items)
+
+    def lpop(self, name):
+        with self.lock:
+            items = self._get(name, [])
+            value = items.pop(0) if items else None
+            self._drop_if_empty(name, items)
+            return value
+
+    def lrange(self, name, start, end):
+        with self.lock:
+            items = self._get(name, [])
+            start, stop = _range(len(items), start, end)
+            return items[start:stop]
+
+    def llen(self, name):
+        with self.lock:
+            return len(self._get(name, []))
+
+    def ltrim(self, name, start, end):
+        with self.lock:
+            items = self._get(name, [])
+            start, stop = _range(len(items), start, end)
+            items[:] = items[start:stop]
+            self._drop_if_empty(name, items)
+            return True
+
+    # Sets
+    def sadd(self, name, *values):
+        with self.lock:
+            members = self._container(name, set)
+            added = {_encode(value) for value in values} - members
+            members.update(added)
+            return len(added)
+
+    def srem(self, name, *values):
+        with self.lock:
+            members = self._get(name, set())
+            removed = {_encode(value) for value in values} & members
+            members.difference_update(removed)
+            self._drop_if_empty(name, members)
+            return len(removed)
+
+    def smembers(self, name):
+        with self.lock:
+            return set(self._get(name, set()))
+
+    def sismember(self, name, value):
+        with self.lock:
+            return _encode(value) in self._get(name, set())
+
+    def pipeline(self, transaction=True):
+        return _LocalPipeline(self)
+
+
+class _LocalPipeline:
+    """Queued LocalStore commands, run atomically by execute()"""
+
+    def __init__(self, store):
+        self._store = store
+        self._commands = []
+
+    def __getattr__(self, command):
+        def queue(*args, **kwargs):
+            self._commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self._commands = self._commands, []
+        with self._store.lock:
+            return [getattr(self._store, command)(*args, **kwargs)
+                    for command, args, kwargs in commands]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._commands = []
+
+
+class Script:
+    """A server-side Lua script, with the equivalent Python for LocalStore.
+
+    local(store, keys, args) runs under the LocalStore's lock, which makes
+    it as atomic as the Lua script is on a server.
+    """
+
+    def __init__(self, lua, local):
+        self.lua = lua
+        self._local = local
+        self._registered = {}
+
+    def __call__(self, client, keys=(), args=()):
+        if isinstance(client, LocalStore):
+            with client.lock:
+                return self._local(client, list(keys), list(args))
+        script = self._registered.get(id(client))
+        if script is None:
+            script = self._registered[id(client)] = client.register_script(self.lua)
+        return script(keys=list(keys), args=list(args))
+
+
+# url -> client, so every storage of a process shares one connection pool
+# (or one LocalStore)
+_clients = {}
+_clients_guard = threading.Lock()
+
+
+def connect(url):
+    """The shared client for a store URL (see the module docstring)"""
+    with _clients_guard:
+        client = _clients.get(url)
+        if client is None:
+            if url.startswith(LOCAL_SCHEME):
+                client = LocalStore()
+            elif redis is None:
+                raise RuntimeError(f"The redis package is required for {url}")
+            else:
+                client = redis.Redis.from_url(url)
+            _clients[url] = client
+        return client
+
+
+def _local_release(store, keys, args):
+    if store.get(keys[0]) == _encode(args[0]):
+        return store.delete(keys[0])
+    return 0
+
+
+def _local_renew(store, keys, args):
+    if store.get(keys[0]) == _encode(args[0]):
+        return int(store.pexpire(keys[0], int(args[1])))
+    return 0
+
+
+# Deletes or extends a lease only while it still holds the caller's token,
+# never one that expired and was taken by another holder since
+RELEASE_LEASE = Script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""", _local_release)
+
+RENEW_LEASE = Script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+""", _local_renew)
+
+
+class LeaseLock:
+    """Re-entrant lock that serializes threads and, through a lease key, every
+    process and node sharing the store.
+
+    The lease expires ttl seconds after it was last renewed; the lease
+    keeper renews it while it is held, so only a holder that died (or
+    stalled for longer than ttl) loses it.
+    """
+
+    def __init__(self, client, key, ttl):
+        self._client = client
+        self.key = key
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._token = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                self._acquire()
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        try:
+            if self._depth == 0:
+                _keeper.discard(self)
+                token, self._token = self._token, None
+                RELEASE_LEASE(self._client, [self.key], [token])
+        finally:
+            self._lock.release()
+
+    def _acquire(self):
+        token = uuid.uuid4().hex
+        delay = 0.001
+        while not self._client.set(self.key, token, nx=True, px=int(self.ttl * 1000)):
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        self._token = token
+        _keeper.add(self)
+
+    def renew(self):
+        token = self._token
+        if token is None:
+            return
+        renewed = RENEW_LEASE(self._client, [self.key], [token, int(self.ttl * 1000)])
+        # A lease released since the keeper picked it up is not lost
+        if not renewed and self._token == token:
+            logger.error("Lease lost while held", extra={"lock": self.key})
+
+
+class _LeaseKeeper:
+    """One thread renewing the held leases of a process, running only while there are some"""
+
+    def __init__(self):
+        self._leases = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, lease):
+        with self._lock:
+            self._leases.add(lease)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='lease-keeper',
+                                                daemon=True)
+                self._thread.start()
+
+    def discard(self, lease):
+        with self._lock:
+            self._leases.discard(lease)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._leases:
+                    self._thread = None
+                    return
+                interval = min(lease.ttl for lease in self._leases) / 3
+            time.sleep(interval)
+            with self._lock:
+                leases = list(self._leases)
+            for lease in leases:
+                try:
+                    lease.renew()
+                except Exception:
+                    logger.exception("Could not renew lease", extra={"lock": lease.key})
+
+
+_keeper = _LeaseKeeper()
+
+# (client, key) -> LeaseLock; like storage.process_lock, every storage of a
+# process locking the same key shares one lock
+_lease_locks = {}
+_lease_locks_guard = threading.Lock()
+
+
+def lease_lock(client, key, ttl):
+    """The LeaseLock of a key, one per key and client in each process"""
+    with _lease_locks_guard:
+        lock = _lease_locks.get((id(client), key))
+        if lock is None:
+            lock = _lease_locks[id(client), key] = LeaseLock(client, key, ttl)
+        return lock
@@ -0,0 +1,135 @@
+"""
+Logging setup for the Voter App API
+
+Log records are handed to a bounded queue and written by a background
+listener thread, so request handlers never block on stdout. Records
+carry structured fields (passed with `extra=`) that are rendered as
+key=value pairs or as JSON lines depending on Config.LOG_FORMAT.
+"""
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+LOGGER_NAME = 'voter'
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'taskName'}
+
+
+def get_logger(name):
+    return logging.getLogger(f'{LOGGER_NAME}.{name}')
+
+
+class StructuredFormatter(logging.Formatter):
+    """Renders a record plus its extra fields as text or a JSON line"""
+
+    def __init__(self, output='text'):
+        super().__init__()
+        self.output = output
+
+    def format(self, record):
+        fields = {key: value for key, value in record.__dict__.items()
+                  if key not in _STANDARD_ATTRS}
+        timestamp = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created))
+        timestamp += f'.{int(record.msecs):03d}Z'
+        message = record.getMessage()
+
+        if self.output == 'json':
+            entry = {"ts": timestamp, "level": record.levelname,
+                     "logger": record.name, "msg": message, **fields}
+            if record.exc_text:
+                entry["exc"] = record.exc_text
+            return json.dumps(entry, default=str, ensure_ascii=False)
+
+        line = f'{timestamp} {record.levelname:<7} {record.name} {message}'
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds request id, route and elapsed time to records logged in a request"""
+
+    def filter(self, record):
+        if has_request_context() and 'request_start' in g:
+            record.request_id = g.request_id
+            record.path = request.path
+            record.elapsed_ms = round((time.perf_counter() - g.request_start) * 1000, 2)
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._traceback_formatter = logging.Formatter()
+
+    def prepare(self, record):
+        # The base class folds the traceback into msg; keep it in exc_text so
+        # the formatter can place it (and the message stays unformatted)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._traceback_formatter.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    """Queue listener whose stop() waits for room in a full queue"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def _stop_listener(listener, queue_handler, logger):
+    """Flush the queue and report how many records were dropped"""
+    listener.stop()
+    if queue_handler.dropped:
+        record = logger.makeRecord(
+            logger.name, logging.WARNING, __file__, 0,
+            "Log records dropped because the log queue was full", (), None,
+            extra={"dropped": queue_handler.dropped})
+        for handler in listener.handlers:
+            handler.handle(record)
+
+
+def setup_logging(config):
+    """Configure the 'voter' logger hierarchy from config and start the listener"""
+    logger = logging.getLogger(LOGGER_NAME)
+    if logger.handlers:
+        return logger
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(StructuredFormatter(config.LOG_FORMAT))
+
+    log_queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    listener = DrainingQueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(_stop_listener, listener, queue_handler, logger)
+
+    logger.addHandler(queue_handler)
+    logger.setLevel(config.LOG_LEVEL.upper())
+    logger.propagate = False
+    return logger
@@ -1,294 +1,1116 @@
-from flask import Flask, jsonify, request
+from flask import Blueprint, Flask, Response, g, jsonify, redirect, request, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+import atexit
+import functools
+import hmac
 import json
+import logging
 import os
-import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from advancement import Advancement, AdvancementPolicy, select_next_round
+from cluster import Cluster
 from config import Config
+from events import EventBroadcaster, EventRelay, format_event
+from jobs import Job, JobQueue
+from logging_config import get_logger, setup_logging
+from models import RoundScores
+from profiling import Profiler
+from response_cache import IdeasViews, ResponseCache
+from roster import create_roster, read_roster_file
+from scoring import combine_final_results, normalize_round_votes
+from sessions import DEFAULT_SESSION, SessionRegistry, create_catalog
+from storage import GroupCommit, JsonStorage, create_storage
+from transitions import RoundTransitions
+import kvstore
+import metrics
+import serializer
 
-app = Flask(__name__)
-CORS(app, origins=Config.CORS_ORIGINS)
 
-submitted_votes = []
+class SerializerJSONProvider(DefaultJSONProvider):
+    """Flask's JSON (jsonify, request.get_json) on top of serializer.py"""
 
-valid_emails = [
-    "Filipe",
-    "Pedro"
-]
+    def dumps(self, obj, **kwargs):
+        return serializer.dumps_text(obj, sort_keys=self.sort_keys, default=self.default)
 
+    def loads(self, s, **kwargs):
+        return serializer.loads(s)
 
-def load_ideas():
-    try:
-        with open('ideas.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print("Warning: ideas.json not found, using empty list")
-        return []
-    except json.JSONDecodeError:
-        print("Warning: Invalid JSON in ideas.json, using empty list")
-        return []
-
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        body = serializer.dumps(obj, pretty=pretty, sort_keys=self.sort_keys,
+                                default=self.default)
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
 
-def get_current_round():
-    """Get the current round number by finding the highest roundX.json file"""
-    round_files = [f for f in os.listdir(
-        '.') if f.startswith('round') and f.endswith('.json')]
-    if not round_files:
-        return 0
-
-    round_numbers = []
-    for f in round_files:
-        try:
-            round_num = int(f.replace('round', '').replace('.json', ''))
-            round_numbers.append(round_num)
-        except ValueError:
-            continue
 
-    return max(round_numbers) if round_numbers else 0
+serializer.use_backend(Config.JSON_BACKEND)
 
+app = Flask(__name__)
+app.json = SerializerJSONProvider(app)
+CORS(app, origins=Config.CORS_ORIGINS)
 
-def load_current_round_ideas():
-    """Load ideas for the current round"""
-    current_round = get_current_round()
+setup_logging(Config)
+logger = get_logger('api')
 
-    round_file = f'round{current_round}.json'
-    print(round_file)
-    try:
-        with open(round_file, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        print(f"Warning: Could not load {
-              round_file}, falling back to ideas.json")
+REQUEST_SECONDS = metrics.histogram(
+    'voter_request_duration_seconds', 'Time to serve a request, by route',
+    ('method', 'route', 'status'))
+AGGREGATION_SECONDS = metrics.histogram(
+    'voter_aggregation_duration_seconds', 'Time to compute the final results', ('job',))
+ROUND_TRANSITION_SECONDS = metrics.histogram(
+    'voter_round_transition_duration_seconds',
+    'Time to select the ideas of the next round and start it')
 
+# Profiles armed through /admin/profiles, see profiling.py
+profiler = Profiler(Config.PROFILE_DIR)
 
-def check_all_users_voted():
-    """Check if all valid users have submitted votes for the current round by reading from round file"""
-    print("🔍 check_all_users_voted() called")
+# One fsync group for the JSON storages of all sessions, so its counters
+# survive a session being unloaded
+group_commit = GroupCommit(Config.FSYNC_GROUP_INTERVAL_MS / 1000) if Config.DURABLE_WRITES else None
 
-    current_round = get_current_round()
-    print(f"📊 Checking round: {current_round}")
 
-    voted_users = set()
+def load_ideas():
+    try:
+        with open('ideas.json', 'rb') as f:
+            return serializer.loads(f.read())
+    except FileNotFoundError:
+        logger.warning("ideas.json not found, using empty list")
+        return []
+    except json.JSONDecodeError:
+        logger.warning("Invalid JSON in ideas.json, using empty list")
+        return []
 
-    print(f"👥 Valid emails: {valid_emails} (total: {len(valid_emails)})")
 
-    # Load current round file to check user_scores
-    round_file = f'round{current_round}.json'
-    try:
-        with open(round_file, 'r') as f:
-            current_ideas = json.load(f)
-
-        print(f"📂 Loaded round file: {round_file} with {
-              len(current_ideas)} ideas")
-
-        # Check each idea's user_scores to see who has voted
-        for idea in current_ideas:
-            idea_id = idea.get('id')
-            user_scores = idea.get('user_scores', {})
-
-            if user_scores:
-                print(f"  💡 Idea {idea_id} has scores from: {
-                      list(user_scores.keys())}")
-
-                # Check each user who scored this idea
-                for user_email in user_scores.keys():
-                    user_email_lower = user_email.strip().lower()
-
-                    # Only count votes from valid email addresses
-                    if any(user_email_lower == valid_email.lower() for valid_email in valid_emails):
-                        voted_users.add(user_email_lower)
-                        print(f"    ✅ Valid vote from: {user_email}")
-                    else:
-                        print(f"    ❌ Invalid/unknown voter: {user_email}")
+class RoundPointer:
+    """Cached pointer to the current round.
+
+    The pointer is read from storage at startup (the manifest file for the
+    JSON backend) and moved by Storage.start_round() together with the new
+    round, so looking up the current round never touches the directory
+    listing. It is re-read only when its storage stamp shows that it moved.
+    """
+
+    def __init__(self, storage):
+        self._storage = storage
+        self._lock = threading.Lock()
+        self._stamp = storage.current_round_stamp()
+        self._current = storage.load_current_round()
+
+    def get(self):
+        stamp = self._storage.current_round_stamp()
+        if stamp != self._stamp:
+            with self._lock:
+                self._stamp = stamp
+                self._current = self._storage.load_current_round()
+        return self._current
+
+
+class RoundStore:
+    """A session's store of round ideas.
+
+    Each round is loaded from storage once and the in-memory copy, a compact
+    models.RoundScores, is authoritative from then on. Whole rounds are written back through save(),
+    while individual votes go through record_scores(), which only persists
+    the voter's scores (an appended score log line for the JSON backend).
+    While there are logs to compact, a background thread periodically folds
+    them into the round snapshots. The cache is only dropped when a new
+    round is produced; events (an EventRelay) is told about started rounds.
+
+    Several server workers may share the storage: writes happen under the
+    storage's 'rounds' lock, and a cached round is reloaded when its storage
+    stamp shows that another worker changed it.
+    """
+
+    def __init__(self, storage, pointer, compaction_interval, events=None):
+        self._storage = storage
+        self._events = events
+        self._rounds = {}
+        self._stamps = {}
+        self._loads = {}
+        self._dirty = set()
+        self._pointer = pointer
+        self._compaction_interval = compaction_interval
+        self._compactor = None
+        self.lock = threading.RLock()
+
+    def _resolve_scores(self, round_num, scores):
+        """([idea_id, score] pairs, (position, score) cells) of the known ideas"""
+        round_scores = self._rounds[round_num]
+        applied = []
+        cells = []
+        for idea_id, score in scores:
+            position = round_scores.position(idea_id)
+            if position is None:
+                logger.warning("Idea not found in round",
+                               extra={"idea_id": idea_id, "round": round_num})
+                continue
+            cells.append((position, score))
+            applied.append([idea_id, score])
+        return applied, cells
+
+    def _load(self, round_num):
+        # The stamp is taken first, so a write racing with the load is
+        # picked up by the next get()
+        stamp = self._storage.round_stamp(round_num)
+        ideas = self._storage.load_round(round_num)
+        if ideas is None:
+            self._rounds.pop(round_num, None)
+            return None
+        round_scores = self._rounds[round_num] = RoundScores.from_dicts(ideas)
+        self._stamps[round_num] = stamp
+        self._loads[round_num] = self._loads.get(round_num, 0) + 1
+        if self._storage.score_log_mark(round_num):
+            self._dirty.add(round_num)
+        return round_scores
+
+    def get(self, round_num):
+        """Return the RoundScores of a round, loading it from storage on first use"""
+        with self.lock:
+            if (round_num not in self._rounds or
+                    self._storage.round_stamp(round_num) != self._stamps[round_num]):
+                return self._load(round_num)
+            return self._rounds[round_num]
+
+    def generation(self, round_num):
+        """Number of times the round was (re)loaded from storage.
+
+        It changes when another worker modified the round, which tells
+        derived per-round state that it has to be rebuilt.
+        """
+        with self.lock:
+            self.get(round_num)
+            return self._loads.get(round_num, 0)
+
+    def save(self, round_num, ideas):
+        """Make ideas (a list of idea dicts) the authoritative copy of a round and persist it"""
+        with self._storage.lock('rounds'), self.lock:
+            round_scores = RoundScores.from_dicts(ideas)
+            self._storage.save_round(round_num, round_scores.to_dicts())
+            self._cache(round_num, round_scores)
+
+    def _cache(self, round_num, round_scores):
+        """Make a just written round the cached copy"""
+        self._rounds[round_num] = round_scores
+        self._stamps[round_num] = self._storage.round_stamp(round_num)
+        self._loads[round_num] = self._loads.get(round_num, 0) + 1
+        self._dirty.discard(round_num)
+
+    def record_scores(self, round_num, email, ideas):
+        """Record one voter's scores in O(submitted ideas).
+
+        The scores are journaled before they are applied in memory, and the
+        call returns once the journal entry is durable. That wait happens
+        after the locks are released, so concurrent voters share an fsync.
+        Returns False if the round could not be loaded.
+        """
+        with self._storage.lock('rounds'), self.lock:
+            round_scores = self.get(round_num)
+            if round_scores is None:
+                return False
+            scores = [[idea_data['id'], idea_data.get('score')]
+                      for idea_data in ideas]
+            applied, cells = self._resolve_scores(round_num, scores)
+            token = self._storage.append_scores(round_num, email, applied)
+            round_scores.set_scores(email, cells)
+            self._stamps[round_num] = self._storage.round_stamp(round_num)
+            if self._storage.score_log_mark(round_num):
+                self._dirty.add(round_num)
+                self._ensure_compactor()
+        self._storage.wait_durable(token)
+        return True
+
+    def voters(self, round_num):
+        """Emails that scored at least one idea of the round"""
+        with self.lock:
+            round_scores = self.get(round_num)
+            if round_scores is None:
+                return None
+            return set(round_scores.voters())
+
+    def _ensure_compactor(self):
+        if self._compactor is None:
+            self._compactor = threading.Thread(
+                target=self._compaction_loop, name='round-compactor', daemon=True)
+            self._compactor.start()
+
+    def _compaction_loop(self):
+        while True:
+            time.sleep(self._compaction_interval)
+            try:
+                self.compact()
+            except Exception:
+                logger.exception("Error compacting score logs")
+            with self.lock:
+                # The next record_scores() starts a new thread, so idle
+                # sessions do not keep one each
+                if not self._dirty:
+                    self._compactor = None
+                    return
+
+    def compact(self):
+        """Fold the score logs of modified rounds into their snapshots"""
+        with self.lock:
+            pending = list(self._dirty)
+
+        for round_num in pending:
+            # Writers in every worker are held off while the snapshot is
+            # written; readers of this worker only wait for the copy
+            with self._storage.lock('rounds'):
+                with self.lock:
+                    round_scores = self.get(round_num)
+                    if round_scores is None or round_num not in self._dirty:
+                        continue
+                    snapshot = round_scores.copy()
+                    mark = self._storage.score_log_mark(round_num)
+                    self._dirty.discard(round_num)
+
+                self._storage.compact_round(round_num, snapshot.to_dicts(), mark)
+
+                with self.lock:
+                    if round_num in self._stamps:
+                        self._stamps[round_num] = self._storage.round_stamp(round_num)
+
+    def start_round(self, round_num, ideas):
+        """Write a newly produced round, drop the cache and move the pointer.
+
+        The round is written by the storage's compare-and-swap on the round
+        pointer, so nothing is written unless the pointer is still at the
+        round before. Returns whether this call started the round.
+        """
+        with self._storage.lock('rounds'), self.lock:
+            current_round = self._pointer.get()
+            if current_round == round_num - 1:
+                self.compact()
+                round_scores = RoundScores.from_dicts(ideas)
+                started = self._storage.start_round(round_num, round_scores.to_dicts(),
+                                                    current_round)
+            else:
+                started = False
+            if not started:
+                logger.info("Round already started by another request",
+                            extra={"round": round_num, "current_round": self._pointer.get()})
+                return False
+            self._rounds.clear()
+            self._stamps.clear()
+            self._cache(round_num, round_scores)
+        if self._events is not None:
+            self._events.publish('round', {"round": round_num, "ideas": len(ideas)})
+        return True
+
+
+class VoterTracker:
+    """Incremental per-round set of roster users who have voted.
+
+    The set for a round is rebuilt from storage the first time it is needed
+    (e.g. after a restart, or after another worker changed the round) and
+    then kept up to date as scores are saved, so the completion check does
+    not have to rescan the round.
+    """
+
+    def __init__(self, round_store, roster):
+        self._round_store = round_store
+        self._roster = roster
+        self._voted = {}
+        self._lock = threading.Lock()
+
+    def _round_set(self, round_num):
+        members = self._roster.current()
+        # A new roster may add or drop voters of the round
+        version = (self._round_store.generation(round_num), members.version)
+        cached = self._voted.get(round_num)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        round_voters = self._round_store.voters(round_num) or set()
+        voted = {email.strip().lower() for email in round_voters}
+        voted &= members.keys()
+        self._voted[round_num] = (version, voted)
+        return voted
+
+    def record(self, round_num, email):
+        email_lower = email.strip().lower()
+        with self._lock:
+            voted = self._round_set(round_num)
+            if email_lower in self._roster.current():
+                voted.add(email_lower)
             else:
-                print(f"  💤 Idea {idea_id} has no scores yet")
+                logger.debug("Invalid/unknown voter", extra={"email": email})
+
+    def voted_count(self, round_num):
+        with self._lock:
+            return len(self._round_set(round_num))
+
+
+advancement_policy = AdvancementPolicy.from_config(Config)
+
+FINAL_RESULTS_JOB = 'store_final_results'
+NORMALIZE_JOB = 'normalize_all_scores'
+
+# Threads running the aggregation jobs of every session
+job_executor = ThreadPoolExecutor(max_workers=Config.JOB_WORKERS, thread_name_prefix='job')
+
+
+class VotingSession:
+    """One voting session: its storage, roster, rounds, jobs and events.
+
+    Each session has its own storage (see sessions.py), and with it its
+    own locks, round cache, voter tracking, per-voter views and event log,
+    so requests of different sessions never wait for each other. Only the
+    job threads and the response cache, whose keys include the session's
+    path prefix, are shared.
+    """
+
+    def __init__(self, session_id, storage, roster, ideas_file=None):
+        self.id = session_id
+        # The original ideas, with the details normalization reports; None
+        # (or a missing file) falls back to round 0
+        self.ideas_file = ideas_file
+        self.storage = storage
+        self.roster = roster
+        self.event_relay = EventRelay(storage, EventBroadcaster(Config.EVENTS_BUFFER_SIZE),
+                                      Config.EVENTS_POLL_INTERVAL)
+        self.round_pointer = RoundPointer(storage)
+        self.round_store = RoundStore(storage, self.round_pointer,
+                                      Config.SCORE_LOG_COMPACTION_INTERVAL, self.event_relay)
+        self.voter_tracker = VoterTracker(self.round_store, roster)
+        self.round_transitions = RoundTransitions(self._transition)
+        self.job_queue = JobQueue(Config.JOB_WORKERS, store=storage,
+                                  on_finished=self.publish_job_finished, executor=job_executor)
+        self.ideas_views = IdeasViews(Config.IDEAS_VIEW_CACHE_MB * 1024 * 1024,
+                                      Config.RESPONSE_GZIP_MIN_SIZE)
+        self.voting_service = VotingService(self)
+        self.closed = False
+
+    def close(self):
+        """Unload the session: stop its event relay and compact its score logs.
+
+        Requests still holding the session finish normally; /events streams
+        end, and their clients reconnect to the reloaded session.
+        """
+        self.closed = True
+        self.event_relay.stop()
+        self.round_store.compact()
+        self.ideas_views.clear()
+
+    def get_current_round(self):
+        """Get the current round number from the round pointer"""
+        return self.round_pointer.get()
+
+    def load_current_round_ideas(self):
+        """Load ideas for the current round"""
+        current_round = self.get_current_round()
+
+        current_ideas = self.round_store.get(current_round)
+        if current_ideas is None:
+            logger.warning("Could not load current round",
+                           extra={"session": self.id, "round": current_round})
+        return current_ideas
+
+    def check_all_users_voted(self):
+        """Check if all valid users have submitted votes for the current round"""
+        current_round = self.get_current_round()
+        voted_count = self.voter_tracker.voted_count(current_round)
+        required = len(self.roster.current())
+        all_voted = voted_count == required
+
+        fields = {"session": self.id, "round": current_round, "voted": voted_count,
+                  "required": required}
+        if all_voted:
+            logger.info("🎉 Round complete - all users have voted", extra=fields)
+        else:
+            logger.debug("⏳ Round incomplete", extra=fields)
 
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        print(f"⚠️  Could not load round file {round_file}: {e}")
-        print("  Assuming no votes have been submitted yet")
+        return all_voted
+
+    def check_all_users_voted_final(self):
+        """Check if all valid users have submitted their final votes"""
+        members = self.roster.current()
         voted_users = set()
 
-    print(f"📈 Round {current_round} summary:")
-    print(f"  - Valid votes found: {len(voted_users)}")
-    print(f"  - Required votes: {len(valid_emails)}")
-    print(f"  - Users who voted: {list(voted_users)}")
+        for valid_email in self.storage.users_with_votes(members.emails):
+            voted_users.add(valid_email.lower())
+            logger.debug("Found votes", extra={"email": valid_email})
 
-    all_voted = len(voted_users) == len(valid_emails)
+        all_voted = len(voted_users) == len(members)
 
-    if all_voted:
-        print(f"🎉 ROUND {
-              current_round} COMPLETE - All {len(valid_emails)} users have voted!")
-        print("🚀 Automatic round ending will be triggered")
-    else:
-        print(f"⏳ ROUND {current_round} INCOMPLETE - {len(voted_users)
-                                                      }/{len(valid_emails)} users have voted")
+        fields = {"session": self.id, "voted": len(voted_users), "required": len(members)}
+        if all_voted:
+            logger.info("🎉 All users have voted, ready for normalization", extra=fields)
+        else:
+            logger.debug("⏳ Waiting for final votes", extra=fields)
 
-    return all_voted
+        return all_voted
 
+    def check_all_users_final_results(self):
+        """Check if all valid users have submitted their final results"""
+        members = self.roster.current()
+        submitted_users = set()
 
-def check_all_users_voted_final():
-    """Check if all valid users have submitted their final votes"""
-    print("🔍 check_all_users_voted_final() called")
+        for valid_email in self.storage.users_with_final_results(members.emails):
+            submitted_users.add(valid_email.lower())
+            logger.debug("Found final results", extra={"email": valid_email})
 
-    voted_users = set()
+        all_submitted = len(submitted_users) == len(members)
 
-    # Check for user vote files
-    for valid_email in valid_emails:
-        user_file = f'user_votes_{valid_email.replace(
-            "@", "_").replace(".", "_")}.json'
-        if os.path.exists(user_file):
-            voted_users.add(valid_email.lower())
-            print(f"    ✅ Found votes from: {valid_email}")
-
-    print(f"📈 Final voting summary:")
-    print(f"  - Valid votes found: {len(voted_users)}")
-    print(f"  - Required votes: {len(valid_emails)}")
-    print(f"  - Users who voted: {list(voted_users)}")
-
-    all_voted = len(voted_users) == len(valid_emails)
-
-    if all_voted:
-        print(f"🎉 ALL USERS HAVE VOTED! Ready for normalization.")
-    else:
-        print(f"⏳ WAITING - {len(voted_users)
-                             }/{len(valid_emails)} users have voted")
-
-    return all_voted
-
-
-def normalize_all_scores():
-    """Normalize all user scores and calculate final idea scores"""
-    print("🔄 Starting score normalization process...")
-
-    # Load all user vote files
-    all_user_votes = {}
-    for valid_email in valid_emails:
-        user_file = f'user_votes_{valid_email.replace(
-            "@", "_").replace(".", "_")}.json'
-        if os.path.exists(user_file):
-            with open(user_file, 'r') as f:
-                user_data = json.load(f)
-                all_user_votes[valid_email] = user_data
-
-    print(f"📊 Loaded votes from {len(all_user_votes)} users")
-
-    # Calculate total scores across all tasks by all users
-    total_all_scores = 0
-    user_totals = {}
-
-    for email, user_data in all_user_votes.items():
-        user_total = 0
-        rounds_data = user_data.get('rounds')
-        if rounds_data and isinstance(rounds_data, list):
-            for round_data in rounds_data:
-                if isinstance(round_data, dict):
-                    ideas_data = round_data.get('ideas')
-                    if ideas_data and isinstance(ideas_data, list):
-                        for idea in ideas_data:
-                            if isinstance(idea, dict):
-                                score = idea.get('score', 0)
-                                if isinstance(score, (int, float)):
-                                    user_total += score
-        user_totals[email] = user_total
-        total_all_scores += user_total
-    total_all_scores /= len(valid_emails)
-
-    print(f"📈 Total scores across all users: {total_all_scores}")
-    print(f"👥 User totals: {user_totals}")
-
-    # Calculate normalization factors
-    user_normalizations = {}
-    for email, user_total in user_totals.items():
-        if total_all_scores > 0:
-            user_normalizations[email] = total_all_scores / user_total
+        fields = {"session": self.id, "submitted": len(submitted_users), "required": len(members)}
+        if all_submitted:
+            logger.info("🎉 All users have submitted final results", extra=fields)
         else:
-            user_normalizations[email] = 1.0
-
-    print(f"🔢 User normalization factors: {user_normalizations}")
-
-    # Calculate final normalized scores for each idea
-    final_idea_scores = {}
-
-    # Load original ideas to get idea details
-    try:
-        with open('ideas.json', 'r') as f:
-            original_ideas = json.load(f)
-    except FileNotFoundError:
-        print("⚠️  ideas.json not found, using round0.json")
-        try:
-            with open('round0.json', 'r') as f:
-                original_ideas = json.load(f)
-        except FileNotFoundError:
-            print("❌ No idea files found!")
+            logger.debug("⏳ Waiting for final results", extra=fields)
+
+        return all_submitted
+
+    @profiler.hook(NORMALIZE_JOB)
+    def normalize_all_scores(self, progress=None):
+        """Normalize all user scores and calculate final idea scores"""
+        logger.info("🔄 Starting score normalization", extra={"session": self.id})
+        progress = progress or (lambda fraction: None)
+        started = time.perf_counter()
+
+        # Load all user votes
+        members = self.roster.current()
+        all_user_votes = self.storage.load_user_votes(members.emails)
+        progress(0.3)
+
+        logger.info("Loaded user votes", extra={"users": len(all_user_votes)})
+
+        # Load original ideas to get idea details
+        original_ideas = None
+        if self.ideas_file is not None:
+            try:
+                with open(self.ideas_file, 'rb') as f:
+                    original_ideas = serializer.loads(f.read())
+            except FileNotFoundError:
+                pass
+        if original_ideas is None:
+            logger.warning("ideas.json not found, using round 0")
+            original_ideas = self.storage.load_round(0)
+            if original_ideas is None:
+                logger.error("No idea files found")
+                return
+
+        result = normalize_round_votes(all_user_votes, original_ideas, len(members))
+        progress(0.8)
+
+        logger.debug("User totals", extra={"user_totals": result.user_totals,
+                                           "average_total": result.average_total})
+        logger.debug("User normalization factors",
+                     extra={"user_normalizations": result.user_normalizations})
+
+        # Save final results
+        self.storage.save_final_results(result.final_results)
+
+        duration = time.perf_counter() - started
+        AGGREGATION_SECONDS.labels(NORMALIZE_JOB).observe(duration)
+        logger.info("🏆 Normalization complete", extra={
+            "session": self.id,
+            "ideas": len(result.final_results),
+            "duration_ms": round(duration * 1000, 2)})
+
+    @profiler.hook(FINAL_RESULTS_JOB)
+    def store_final_results(self, progress=None):
+        """Store the final accumulated results from all users with normalization"""
+        logger.info("🔄 Starting final results calculation", extra={"session": self.id})
+        progress = progress or (lambda fraction: None)
+        started = time.perf_counter()
+
+        # Load all user final results
+        all_final_results = self.storage.load_user_final_results(self.roster.current().emails)
+        progress(0.3)
+
+        logger.info("Loaded final results", extra={"users": len(all_final_results)})
+
+        result = combine_final_results(all_final_results)
+        final_results_list = result.final_results
+        progress(0.8)
+
+        logger.debug("User totals", extra={"user_totals": result.user_totals,
+                                           "average_total": result.average_total})
+        logger.debug("User normalization factors",
+                     extra={"user_normalizations": result.user_normalizations})
+        if logger.isEnabledFor(logging.DEBUG):
+            for rank, ranked in enumerate(final_results_list, 1):
+                logger.debug("Final ranking", extra={
+                    "rank": rank,
+                    "idea_id": ranked['id'],
+                    "final_score": round(ranked['final_score'], 4),
+                    "user_scores": ranked['user_scores'],
+                    "normalized_user_scores": ranked['normalized_user_scores']})
+
+        # Save combined final results
+        self.storage.save_final_results(final_results_list)
+
+        duration = time.perf_counter() - started
+        AGGREGATION_SECONDS.labels(FINAL_RESULTS_JOB).observe(duration)
+        logger.info("🏆 Final results calculation complete", extra={
+            "session": self.id,
+            "users": len(all_final_results),
+            "ideas": len(final_results_list),
+            "duration_ms": round(duration * 1000, 2)})
+
+    def publish_job_finished(self, job):
+        """Tell /events clients that the final results are ready (or failed)"""
+        if job.name in (FINAL_RESULTS_JOB, NORMALIZE_JOB) and not job.rerun:
+            self.event_relay.publish('final-results', {"status": job.status, "job_id": job.id})
+
+    def run_aggregation(self, aggregate, progress=None):
+        """Run an aggregation job under the storage's 'aggregation' lock.
+
+        The job queue runs one job of each name at a time; the lock also
+        keeps the two jobs, and those of other workers and cluster nodes,
+        from overwriting each other's final results.
+        """
+        with self.storage.lock('aggregation'):
+            aggregate(progress=progress)
+
+    def advance_round(self, current_round):
+        """Start the round after current_round with the ideas that advance.
+
+        Returns the Advancement, the same one for every request ending the
+        round (see transitions.py), or None if the round could not be
+        loaded or is not the current one.
+        """
+        return self.round_transitions.advance(current_round)
+
+    def _transition(self, current_round):
+        # Requests of other workers and nodes wait here, then find the
+        # round started and reuse its result
+        with self.storage.lock('transition'):
+            if self.get_current_round() != current_round:
+                return self._recorded_advancement(current_round)
+
+            started = time.perf_counter()
+            with self.round_store.lock:
+                round_scores = self.round_store.get(current_round)
+                if round_scores is None:
+                    return None
+                advancement = select_next_round(round_scores, current_round, advancement_policy)
+
+            logger.info("Selected ideas for next round", extra={
+                "session": self.id, "round": current_round, "mode": advancement.mode,
+                "selected": len(advancement.ideas), "total": advancement.total})
+            logger.debug("Selected idea IDs",
+                         extra={"idea_ids": [idea['id'] for idea in advancement.ideas]})
+
+            if not self.round_store.start_round(current_round + 1, advancement.ideas):
+                return self._recorded_advancement(current_round)
+            ROUND_TRANSITION_SECONDS.observe(time.perf_counter() - started)
+            return advancement
+
+    def _recorded_advancement(self, current_round):
+        """The Advancement of a round that was already ended, rebuilt from its next round"""
+        with self.round_store.lock:
+            ended = self.round_store.get(current_round)
+            next_round = self.round_store.get(current_round + 1)
+            if ended is None or next_round is None:
+                return None
+            ideas = [{"id": idea.id, "title": idea.title, "description": idea.description}
+                     for idea in next_round.ideas]
+            return Advancement(ideas, len(ended), advancement_policy.mode)
+
+    def save_user_scores_to_round_file(self, round_num, email, ideas):
+        """Save a user's scores to the round's score log"""
+        if not self.round_store.record_scores(round_num, email, ideas):
+            logger.warning("Could not load round", extra={"session": self.id, "round": round_num})
             return
+        self.voter_tracker.record(round_num, email)
+        self.event_relay.publish('vote', {"round": round_num, "email": email,
+                                          "voted": self.voter_tracker.voted_count(round_num),
+                                          "required": len(self.roster.current())})
+
+    def state_version(self):
+        """Token that changes whenever a response of the cached read endpoints may.
+
+        The current round's storage stamp covers saved scores and round starts;
+        the event log id covers final-results submissions and finished
+        aggregation jobs, including those of other server workers.
+        """
+        current_round = self.get_current_round()
+        return (current_round, self.storage.round_stamp(current_round),
+                self.storage.last_event_id(), self.roster.current().version)
+
+    def latest_results_job(self):
+        """Most recent final-results or normalization job, if any"""
+        jobs = [job for job in (self.job_queue.latest(FINAL_RESULTS_JOB),
+                                self.job_queue.latest(NORMALIZE_JOB)) if job is not None]
+        return max(jobs, key=lambda j: j.created_at) if jobs else None
+
+    def final_results_status(self):
+        """'completed' once final results are stored and no aggregation is pending,
+        otherwise the latest job's status or 'pending'"""
+        job = self.latest_results_job()
+        if job is not None and not job.done:
+            return job.status
+        if self.storage.load_final_results() is not None:
+            return Job.COMPLETED
+        if job is not None and job.status == Job.FAILED:
+            return job.status
+        return "pending"
+
+    def build_status_snapshot(self):
+        """Current round plus the final-results status of every user"""
+        return {"current_round": self.get_current_round(), **self.build_users_status()}
+
+    def build_users_status(self):
+        """Final-results completion status of every valid user"""
+        members = self.roster.current()
+        submitted = self.storage.users_with_final_results(members.emails)
+        users_status = []
+
+        for email in members:
+            has_voted = email in submitted
+
+            users_status.append({
+                "email": email,
+                "has_voted": has_voted,
+                "status": "completed" if has_voted else "waiting"
+            })
 
-    # Initialize final scores
-    for idea in original_ideas:
-        final_idea_scores[idea['id']] = {
-            'id': idea['id'],
-            'title': idea['title'],
-            'description': idea['description'],
-            'final_score': 0.0,
-            'user_scores': {}
-        }
-
-    # Apply normalization to each user's scores
-    for email, user_data in all_user_votes.items():
-        normalization = user_normalizations[email]
-
-        rounds_data = user_data.get('rounds')
-        if rounds_data and isinstance(rounds_data, list):
-            for round_data in rounds_data:
-                if isinstance(round_data, dict):
-                    ideas_data = round_data.get('ideas')
-                    if ideas_data and isinstance(ideas_data, list):
-                        for idea in ideas_data:
-                            if isinstance(idea, dict):
-                                idea_id = idea.get('id')
-                                if idea_id:
-                                    original_score = idea.get('score', 0)
-                                    if isinstance(original_score, (int, float)):
-                                        normalized_score = original_score * normalization
-
-                                        if idea_id in final_idea_scores:
-                                            final_idea_scores[idea_id]['final_score'] += normalized_score
-                                            final_idea_scores[idea_id]['user_scores'][email] = normalized_score
-
-    print(f"✅ Calculated final scores for {len(final_idea_scores)} ideas")
-
-    # Save final results
-    final_results = list(final_idea_scores.values())
-    final_results.sort(key=lambda x: x['final_score'], reverse=True)
+        all_voted = all(user["has_voted"] for user in users_status)
 
-    with open('final_results.json', 'w') as f:
-        json.dump(final_results, f, indent=2)
+        return {
+            "users": users_status,
+            "all_voted": all_voted,
+            "results_status": self.final_results_status() if all_voted else "pending",
+            "total_users": len(members),
+            "voted_count": sum(1 for user in users_status if user["has_voted"])
+        }
 
-    print("💾 Saved final normalized results to final_results.json")
-    print("🏆 Normalization complete!")
 
+VALID_SCORES = (0, 1, 2)
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+class VotingService:
+    """Submission logic shared by the Flask views and the async app (asgi.py).
+
+    Each submission has a validate_*() method that only inspects the request
+    data and returns an (error payload, status) pair or None, and a method
+    that records it and returns (payload, status). Only the latter does
+    storage I/O, so the async app runs validation on its event loop and
+    hands just the recording to its bounded I/O pool. Each VotingSession
+    has its own service.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    def validate_vote(self, data):
+        if not data or 'ideas' not in data:
+            return {"error": "No ideas provided"}, 400
+
+        ideas = data['ideas']
+        if not ideas:
+            return {"error": "No ideas provided"}, 400
+
+        error = self.validate_scores(data)
+        if error is not None:
+            return error
+
+        scored_count = sum(1 for idea in ideas if idea.get('score') is not None)
+        total_count = len(ideas)
+
+        if scored_count != total_count:
+            return {
+                "error": f"All ideas must be scored. Currently scored: {scored_count}/{total_count}"
+            }, 400
+
+        score_counts = self._score_counts(ideas)
+        max_score_2 = int(total_count * 0.2)
+        max_score_1 = int(total_count * 0.4)
+
+        if score_counts[2] > max_score_2:
+            return {
+                "error": f"Too many score 2 assignments. Maximum allowed: {max_score_2}, current: {score_counts[2]}"
+            }, 400
+
+        if score_counts[1] > max_score_1:
+            return {
+                "error": f"Too many score 1 assignments. Maximum allowed: {max_score_1}, current: {score_counts[1]}"
+            }, 400
+        return None
+
+    def validate_scores(self, round_data):
+        """Check one round of scores: {"ideas": [{"id": ..., "score": 0, 1, 2 or null}]}"""
+        if not isinstance(round_data, dict):
+            return {"error": "A round must be an object with an ideas list"}, 400
+        ideas = round_data.get('ideas')
+        if not isinstance(ideas, list) or not ideas:
+            return {"error": "No ideas provided"}, 400
+        for idea in ideas:
+            if not isinstance(idea, dict) or idea.get('id') is None:
+                return {"error": "Every idea needs an id"}, 400
+            score = idea.get('score')
+            if score is not None and (isinstance(score, bool) or score not in VALID_SCORES):
+                return {"error": f"Invalid score {score!r} for idea {idea['id']}"}, 400
+        return None
+
+    @staticmethod
+    def _score_counts(ideas):
+        score_counts = {0: 0, 1: 0, 2: 0}
+        for idea in ideas:
+            score = idea.get('score')
+            if score is not None:
+                score_counts[score] += 1
+        return score_counts
+
+    def submit_vote(self, data):
+        """Record a validated vote and end the round once everyone has voted"""
+        ideas = data['ideas']
+        total_score = sum(idea.get('score', 0) for idea in ideas)
+        session = self.session
+        current_round = session.get_current_round()
+
+        result = {
+            "ideas": ideas,
+            "submitted_at": datetime.utcnow().isoformat() + "Z",
+            "total_score": total_score,
+            "score_distribution": self._score_counts(ideas),
+            "round": current_round,
+            "user_email": data.get('email', 'unknown')
+        }
 
-def create_next_round(ideas_with_scores):
-    """Create the next round by eliminating ideas with 0 score"""
-    current_round = get_current_round()
-    next_round = current_round + 1
+        session.storage.record_vote(result)
+
+        email = data.get('email', '').strip().lower()
+        if email:
+            session.save_user_scores_to_round_file(current_round, email, ideas)
+            logger.debug("Saved scores", extra={"email": email, "round": current_round})
+
+        # Check if all users have voted and automatically end the round
+        if session.check_all_users_voted():
+            logger.info("Automatically ending round",
+                        extra={"session": session.id, "round": current_round})
+            try:
+                self._end_round_automatically(current_round)
+            except Exception:
+                logger.exception("Error automatically ending round",
+                                 extra={"session": session.id, "round": current_round})
+
+        return result, 200
+
+    def _end_round_automatically(self, current_round):
+        advancement = self.session.advance_round(current_round)
+        if advancement is not None:
+            logger.info("Automatically ended round", extra={
+                "session": self.session.id, "round": current_round, "next_round": current_round + 1,
+                "ideas": len(advancement.ideas)})
+
+    def validate_all_votes(self, data):
+        if not data or 'email' not in data or 'rounds' not in data:
+            return {"error": "Email and rounds data required"}, 400
+
+        rounds = data['rounds']
+        if not rounds or not isinstance(rounds, list):
+            return {"error": "No rounds data provided"}, 400
+        return None
+
+    def submit_all_votes(self, data):
+        """Store all rounds of a user's votes and normalize once everyone has"""
+        email = data['email'].strip().lower()
+        rounds_list = data['rounds']
+
+        logger.info("📥 Received all votes", extra={"email": email, "rounds": len(rounds_list)})
+
+        # Store user votes data
+        user_vote_data = {
+            "email": email,
+            "rounds": rounds_list,
+            "submitted_at": datetime.utcnow().isoformat() + "Z"
+        }
 
-    surviving_ideas = []
-    for idea in ideas_with_scores:
-        if idea.get('score', 0) > 0:
-            idea_copy = idea.copy()
-            idea_copy['score'] = None
-            surviving_ideas.append(idea_copy)
+        self.session.storage.save_user_votes(email, user_vote_data)
+        return self._all_votes_saved()
 
-    if not surviving_ideas:
-        print("No ideas survived this round - voting complete!")
-        return False
+    def open_vote_upload(self, header_line):
+        """Start a streamed /submit-all-votes from its {"email": ...} header line.
 
-    round_file = f'round{next_round}.json'
-    with open(round_file, 'w') as f:
-        json.dump(surviving_ideas, f, indent=2)
+        Returns (VoteUpload, None), or (None, (error payload, status)).
+        """
+        try:
+            header = serializer.loads(header_line) if header_line.strip() else None
+        except ValueError:
+            header = None
+        if not isinstance(header, dict) or not isinstance(header.get('email'), str):
+            return None, ({"error": "The first line must be {\"email\": ...}"}, 400)
+        email = header['email'].strip().lower()
+        writer = self.session.storage.open_user_votes(email, datetime.utcnow().isoformat() + "Z")
+        return VoteUpload(self, email, writer), None
+
+    def ingest_vote_stream(self, lines):
+        """Store a streamed NDJSON /submit-all-votes body given as an iterable of lines"""
+        lines = iter(lines)
+        upload, error = self.open_vote_upload(next(lines, b''))
+        if error is not None:
+            return error
+        try:
+            for line in lines:
+                error = upload.add(line)
+                if error is not None:
+                    upload.abort()
+                    return error
+        except BaseException:
+            upload.abort()
+            raise
+        return upload.finish()
+
+    def _all_votes_saved(self):
+        # Process and normalize scores if all users have voted
+        session = self.session
+        if session.check_all_users_voted_final():
+            logger.info("🎯 All users have voted, queueing normalization",
+                        extra={"session": session.id})
+            job = session.job_queue.submit(NORMALIZE_JOB, session.run_aggregation,
+                                           session.normalize_all_scores)
+            session.event_relay.publish('final-results', {"status": job.status, "job_id": job.id})
+            return {
+                "message": "All votes submitted successfully. Scores are being normalized.",
+                "status": job.status,
+                "job_id": job.id
+            }, 200
+
+        return {
+            "message": "Votes submitted successfully. Waiting for other users.",
+            "status": "waiting"
+        }, 200
+
+    def validate_final_results(self, data):
+        if not data or 'email' not in data or 'finalResults' not in data:
+            return {"error": "Email and finalResults data required"}, 400
+
+        if not data['finalResults']:
+            return {"error": "No final results data provided"}, 400
+        return None
+
+    def submit_final_results(self, data):
+        """Store a user's final results and aggregate once everyone has"""
+        email = data['email'].strip().lower()
+        final_results = data['finalResults']
+
+        logger.info("📥 Received final results", extra={"email": email})
+
+        # Store user final results data
+        user_final_data = {
+            "email": email,
+            "finalResults": final_results,
+            "submitted_at": datetime.utcnow().isoformat() + "Z"
+        }
 
-    print(f"Created {round_file} with {len(surviving_ideas)} surviving ideas")
-    return True
+        session = self.session
+        session.storage.save_user_final_results(email, user_final_data)
+
+        # Check if all users have submitted final results
+        all_submitted = session.check_all_users_final_results()
+        job = None
+        if all_submitted:
+            logger.info("🎯 All users have submitted final results, queueing aggregation",
+                        extra={"session": session.id})
+            job = session.job_queue.submit(FINAL_RESULTS_JOB, session.run_aggregation,
+                                           session.store_final_results)
+        # Published once the job is queued, so clients refreshing on this event
+        # (and the response cache) already see it
+        session.event_relay.publish('final-results-submitted', {"email": email, "all_submitted": all_submitted})
+
+        if job is not None:
+            return {
+                "message": "Final results submitted successfully. All users completed.",
+                "completed": True,
+                "job_id": job.id
+            }, 200
+
+        return {
+            "message": "Final results submitted successfully. Waiting for other users.",
+            "completed": False
+        }, 200
+
+    def validate_save_scores(self, data):
+        if not data or 'email' not in data or 'ideas' not in data:
+            return {"success": False, "error": "Email and ideas are required"}, 400
+        error = self.validate_scores(data)
+        if error is not None:
+            payload, status = error
+            return {"success": False, "error": payload['error']}, status
+        return None
+
+    def save_scores(self, data):
+        """Save a user's scores for a round (the current one by default)"""
+        email = data['email'].strip().lower()
+        round_num = str(data.get('round', self.session.get_current_round()))
+
+        self.session.save_user_scores_to_round_file(int(round_num), email, data['ideas'])
+
+        return {"success": True, "round": round_num}, 200
+
+
+class VoteUpload:
+    """One streamed /submit-all-votes body, written round by round.
+
+    Only the current line is held in memory: each round is validated and
+    handed to the storage writer as compact [[idea_id, score], ...] pairs.
+    Nothing is visible to other requests until finish().
+    """
+
+    def __init__(self, service, email, writer):
+        self._service = service
+        self.email = email
+        self._writer = writer
+        self.rounds = 0
+
+    def add(self, line):
+        """Validate and store one NDJSON line; returns an error pair or None"""
+        if len(line) > Config.MAX_VOTE_LINE_BYTES:
+            return {"error": f"Round {self.rounds + 1} is larger than "
+                             f"{Config.MAX_VOTE_LINE_BYTES} bytes"}, 413
+        if not line.strip():
+            return None
+        try:
+            round_data = serializer.loads(line)
+        except ValueError:
+            return {"error": f"Round {self.rounds + 1} is not valid JSON"}, 400
+        error = self._service.validate_scores(round_data)
+        if error is not None:
+            payload, status = error
+            return {"error": f"Round {self.rounds + 1}: {payload['error']}"}, status
+        self._writer.add_round([[idea['id'], idea.get('score')] for idea in round_data['ideas']])
+        self.rounds += 1
+        return None
+
+    def finish(self):
+        if not self.rounds:
+            self._writer.abort()
+            return {"error": "No rounds data provided"}, 400
+        self._writer.commit()
+        logger.info("📥 Received streamed votes", extra={"email": self.email, "rounds": self.rounds})
+        payload, status = self._service._all_votes_saved()
+        return dict(payload, rounds=self.rounds), status
+
+    def abort(self):
+        self._writer.abort()
+
+
+def handle_submission(validate, submit):
+    """Run a VotingService submission for the current Flask request"""
+    data = request.get_json()
+    payload, status = validate(data) or submit(data)
+    return jsonify(payload), status
+
+
+def open_session(session_id, directory):
+    """Build a VotingSession for the session registry.
+
+    The default session keeps the configured layout and ROSTER_SOURCE; any
+    other session keeps all of its state, the roster included, in its own
+    directory (or, with the 'redis' backend, under its own keys).
+    """
+    if session_id == DEFAULT_SESSION:
+        storage = create_storage(Config, committer=group_commit)
+        return VotingSession(session_id, storage, create_roster(Config, storage), 'ideas.json')
+    storage = create_storage(Config, directory, committer=group_commit, namespace=session_id)
+    if directory is None:
+        # Seeded in the store when the session was created
+        roster = create_roster(Config, storage, source='storage')
+        return VotingSession(session_id, storage, roster)
+    roster = create_roster(Config, storage, source='storage',
+                           seed_file=os.path.join(directory, 'roster.json'))
+    return VotingSession(session_id, storage, roster, os.path.join(directory, 'ideas.json'))
+
+
+# Which node serves each session when several share a store (see cluster.py)
+cluster = None
+if Config.CLUSTER_ENABLED:
+    if Config.STORAGE_BACKEND != 'redis':
+        raise ValueError("CLUSTER_ENABLED needs the shared 'redis' storage backend")
+    cluster = Cluster(kvstore.connect(Config.REDIS_URL), Config.CLUSTER_NODE_ID,
+                      Config.CLUSTER_NODE_URL, Config.REDIS_PREFIX,
+                      Config.CLUSTER_HEARTBEAT_INTERVAL, Config.CLUSTER_NODE_TTL,
+                      Config.CLUSTER_RING_REPLICAS)
+    cluster.start()
+
+sessions = SessionRegistry(create_catalog(Config), open_session, Config.SESSIONS_MAX_LOADED)
+atexit.register(sessions.close)
+# Loaded up front, so that a broken storage or roster fails at startup
+default_session = sessions.get(DEFAULT_SESSION)
+
+# Shared by all sessions: its keys are request paths, which include the
+# session's prefix
+response_cache = ResponseCache(Config.RESPONSE_CACHE_SIZE, Config.RESPONSE_GZIP_MIN_SIZE)
+
+
+metrics.callback('voter_sessions_loaded', 'Voting sessions loaded by this server worker',
+                 lambda: len(sessions.loaded()))
+if cluster is not None:
+    metrics.callback('voter_cluster_nodes', "Live nodes in this node's view of the cluster",
+                     lambda: len(cluster.members))
+metrics.callback('voter_current_round', 'Current voting round',
+                 lambda: {(session.id,): session.get_current_round()
+                          for session in sessions.loaded()}, ('session',))
+metrics.callback('voter_roster_size', 'Voters on the roster',
+                 lambda: {(session.id,): len(session.roster.current())
+                          for session in sessions.loaded()}, ('session',))
+if Config.STORAGE_BACKEND == 'json' and group_commit is not None:
+    metrics.callback('voter_durable_writes_total', 'Writes waiting on a group fsync',
+                     lambda: group_commit.commits, type='counter')
+    metrics.callback('voter_fsyncs_total', 'fsync() calls made by group commits',
+                     lambda: group_commit.syncs, type='counter')
+
+
+def cached_response(view):
+    """Serve a GET endpoint's 200 responses from the response cache.
+
+    Responses carry a strong ETag and are revalidated by clients
+    (Cache-Control: no-cache), which get a 304 while nothing changed.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.path, request.query_string)
+        # Taken before the body is built, so a concurrent change can only
+        # make the stored entry look older than it is
+        version = g.session.state_version()
+        entry = response_cache.get(key, version)
+        if entry is None:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            entry = response_cache.put(key, version, response.get_data(), response.mimetype)
+        return entry.to_response(request, 'no-cache')
+    return wrapper
+
+
+@app.before_request
+def start_request_timer():
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:12]
+    g.request_start = time.perf_counter()
+    if profiler.armed and request.url_rule is not None:
+        g.profile = profiler.start(f'{request.method} {request.url_rule.rule}')
+
+
+@app.teardown_request
+def stop_request_profile(exc):
+    token = g.pop('profile', None)
+    if token is not None:
+        profiler.stop(token)
+
+
+@app.after_request
+def log_request(response):
+    if 'request_start' in g:
+        duration = time.perf_counter() - g.request_start
+        # The route's rule, so that /jobs/<id> is one series
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(duration)
+        duration_ms = round(duration * 1000, 2)
+        level = logging.WARNING if duration_ms >= Config.SLOW_REQUEST_MS else logging.DEBUG
+        logger.log(level, "request", extra={
+            "method": request.method,
+            "status": response.status_code,
+            "duration_ms": duration_ms})
+        response.headers['X-Request-ID'] = g.request_id
+    return response
 
 
 @app.route('/')
@@ -299,509 +1121,303 @@ def root():
         "endpoints": {
             "GET /ideas": "Get all available ideas (with user scores if email provided)",
             "POST /submit-vote": "Submit scored ideas",
-            "POST /end-round": "End current round and create next round with top 60% of ideas",
+            "POST /end-round": "End current round and create next round with its top-scored ideas",
             "GET /results": "Get voting results",
             "GET /round-info": "Get current round information",
             "GET /user-scores": "Get user's saved scores from round files",
-            "POST /save-scores": "Save user scores to round files"
+            "GET /jobs/<id>": "Get status and progress of a background aggregation job",
+            "GET /events": "Server-Sent Events stream of round, vote and final results changes",
+            "GET /metrics": "Prometheus metrics of this server worker",
+            "POST /save-scores": "Save user scores to round files",
+            "/sessions/<id>/...": "The routes above (but /metrics) for voting session <id>"
         }
     })
 
 
-@app.route('/round-info', methods=['GET'])
-def get_round_info():
-    """Get information about the current round"""
-    current_round = get_current_round()
-    current_ideas = load_current_round_ideas()
-
-    round_votes = [vote for vote in submitted_votes if vote.get(
-        'round', 0) == current_round]
-    voted_users = set()
-    for vote in round_votes:
-        email = vote.get('user_email', '').strip().lower()
-        if email in [v.lower() for v in valid_emails]:
-            voted_users.add(email)
-
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request latencies, storage and serializer I/O, aggregation and round
+    transition timings, in the Prometheus text format"""
+    if not Config.METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+def admin_required(view):
+    """Allow the request only with the ADMIN_TOKEN in an X-Admin-Token header"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not Config.ADMIN_TOKEN:
+            return jsonify({"error": "Admin endpoints are disabled (set ADMIN_TOKEN)"}), 404
+        token = request.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(token.encode(), Config.ADMIN_TOKEN.encode()):
+            return jsonify({"error": "Admin token required"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def profile_targets():
+    """Routes ("POST /submit-vote") and hooked functions that can be profiled"""
+    targets = {FINAL_RESULTS_JOB, NORMALIZE_JOB}
+    for rule in app.url_map.iter_rules():
+        for method in rule.methods - {'HEAD', 'OPTIONS'}:
+            targets.add(f'{method} {rule.rule}')
+    return targets
+
+
+@app.route('/admin/profiles', methods=['POST'])
+@admin_required
+def arm_profile():
+    """Profile the next `count` calls of a route or of an aggregation job"""
+    data = request.get_json(silent=True) or {}
+    target = data.get('target')
+    if target not in profile_targets():
+        return jsonify({"error": f"Unknown profiling target: {target}",
+                        "targets": sorted(profile_targets())}), 400
+    try:
+        session = profiler.arm(target, mode=data.get('mode', 'cprofile'),
+                               count=int(data.get('count', 1)),
+                               interval=float(data.get('interval_ms', 2)) / 1000)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(session.to_dict()), 202
+
+
+@app.route('/admin/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    return jsonify({"profiles": [session.to_dict() for session in profiler.sessions()]})
+
+
+@app.route('/admin/profiles/<profile_id>', methods=['GET'])
+@admin_required
+def get_profile(profile_id):
+    session = profiler.get(profile_id)
+    if session is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return jsonify(session.to_dict())
+
+
+@app.route('/admin/profiles/<profile_id>', methods=['DELETE'])
+@admin_required
+def cancel_profile(profile_id):
+    session = profiler.cancel(profile_id)
+    if session is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return jsonify(session.to_dict())
+
+
+@app.route('/admin/profiles/<profile_id>/output', methods=['GET'])
+@admin_required
+def download_profile(profile_id):
+    """The .pstats or collapsed-stacks file of a completed profile"""
+    session = profiler.get(profile_id)
+    if session is None:
+        return jsonify({"error": "Profile not found"}), 404
+    if session.path is None:
+        return jsonify(session.to_dict()), 409
+    return send_file(os.path.abspath(session.path), as_attachment=True)
+
+
+@app.route('/admin/sessions', methods=['POST'])
+@admin_required
+def create_session():
+    """Create a voting session from {"id": ..., "ideas": [...], "emails": [...]}.
+
+    Without an id one is generated; without ideas or emails the session
+    starts from round0.json and the ROSTER_FILE roster.
+    """
+    data = request.get_json(silent=True) or {}
+    session_id = data.get('id') or uuid.uuid4().hex[:12]
+    try:
+        ideas = data.get('ideas')
+        if ideas is None:
+            ideas = JsonStorage('.', Config.ROUND_MANIFEST_FILE).load_round(0)
+        emails = data.get('emails')
+        if emails is None:
+            emails = read_roster_file(Config.ROSTER_FILE) or []
+        sessions.create(session_id, ideas, emails)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FileExistsError as e:
+        return jsonify({"error": str(e)}), 409
+
+    session = sessions.get(session_id)
     return jsonify({
-        "current_round": current_round,
-        "total_ideas": len(current_ideas),
-        "total_users": len(valid_emails),
-        "votes_submitted": len(voted_users),
-        "all_votes_submitted": len(voted_users) >= len(valid_emails),
-        "round_complete": len(voted_users) >= len(valid_emails)
-    })
+        "id": session.id,
+        "url": f"/sessions/{session.id}",
+        "current_round": session.get_current_round(),
+        "total_users": len(session.roster.current())
+    }), 201
 
 
-@app.route('/ideas', methods=['GET'])
-def get_ideas():
-    """Get all available ideas for scoring, or return status if user has already voted"""
-    email = request.args.get('email', '').strip().lower()
+@app.route('/admin/sessions', methods=['GET'])
+@admin_required
+def list_sessions():
+    loaded = {session.id for session in sessions.loaded()}
+    return jsonify({"sessions": [{"id": session_id, "loaded": session_id in loaded}
+                                 for session_id in sessions.ids()]})
 
-    if email:
-        # Check if user has already submitted final results
-        user_final_file = f'user_final_results_{email.replace("@", "_").replace(".", "_")}.json'
-        if os.path.exists(user_final_file):
-            # User has already voted - return status information
-            users_status = []
 
-            for valid_email in valid_emails:
-                user_file = f'user_final_results_{valid_email.replace("@", "_").replace(".", "_")}.json'
-                has_voted = os.path.exists(user_file)
+# Routes of a voting session, served for the default session at / and for
+# any other session under /sessions/<session_id>/ (registered below)
+voting = Blueprint('voting', __name__)
 
-                users_status.append({
-                    "email": valid_email,
-                    "has_voted": has_voted,
-                    "status": "completed" if has_voted else "waiting"
-                })
 
-            all_voted = all(user["has_voted"] for user in users_status)
+@voting.url_value_preprocessor
+def pull_session(endpoint, values):
+    session_id = values.pop('session_id', DEFAULT_SESSION) if values else DEFAULT_SESSION
+    # A session served by another node is not loaded here
+    g.session_owner = cluster.owner_url(session_id) if cluster is not None else None
+    g.session = sessions.get(session_id) if g.session_owner is None else None
 
-            return jsonify({
-                "status": "already_voted",
-                "message": "You have already completed your voting",
-                "user_email": email,
-                "users": users_status,
-                "all_voted": all_voted,
-                "total_users": len(valid_emails),
-                "voted_count": sum(1 for user in users_status if user["has_voted"])
-            })
-
-    # User hasn't voted yet - return ideas for voting
-    current_ideas = load_current_round_ideas()
 
-    ideas = []
-    for idx, idea in enumerate(current_ideas):
-        previous_score = None
-        if email and "user_scores" in idea and email in idea["user_scores"]:
-            previous_score = idea["user_scores"][email]
-
-        ideas.append({
-            "id": idea["id"],
-            "title": idea["title"],
-            "description": idea["description"],
-            "score": previous_score
-        })
+@voting.before_request
+def require_session():
+    if g.session_owner is not None:
+        location = g.session_owner + (request.full_path if request.query_string else request.path)
+        return redirect(location, 307)
+    if g.session is None:
+        return jsonify({"error": "Session not found"}), 404
 
-    return jsonify(ideas)
 
+@voting.route('/round-info', methods=['GET'])
+@cached_response
+def get_round_info():
+    """Get information about the current round"""
+    session = g.session
+    current_round = session.get_current_round()
+    current_ideas = session.load_current_round_ideas()
+    members = session.roster.current()
 
-@app.route('/submit-all-votes', methods=['POST'])
-def submit_all_votes():  # type: ignore
-    """Submit all voting data from all rounds at once"""
-    data = request.get_json()
-
-    if not data or 'email' not in data or 'rounds' not in data:
-        return jsonify({"error": "Email and rounds data required"}), 400
-
-    email = data['email'].strip().lower()
-    rounds = data['rounds']
-
-    if not rounds:
-        return jsonify({"error": "No rounds data provided"}), 400
-
-    # Type: ignore for JSON data handling
-    rounds_list = rounds if isinstance(rounds, list) else []  # type: ignore
-    if not rounds_list or len(rounds_list) == 0:  # type: ignore
-        return jsonify({"error": "No rounds data provided"}), 400
-
-    print(f"📥 Received all votes from user {email}")
-
-    # Store user votes data
-    user_vote_data = {
-        "email": email,
-        "rounds": rounds_list,
-        "submitted_at": datetime.utcnow().isoformat() + "Z"
-    }
-
-    # Save to a user votes file
-    user_votes_file = f'user_votes_{
-        email.replace("@", "_").replace(".", "_")}.json'
-    with open(user_votes_file, 'w') as f:
-        json.dump(user_vote_data, f, indent=2)
-
-    print(f"💾 Saved user votes to {user_votes_file}")
-
-    # Process and normalize scores if all users have voted
-    if check_all_users_voted_final():
-        print("🎯 All users have voted! Processing normalization...")
-        normalize_all_scores()
-        return jsonify({
-            "message": "All votes submitted successfully. Scores normalized.",
-            "normalized": True
-        })
+    voted_users = set()
+    for email in session.storage.vote_users(current_round):
+        email = email.strip().lower()
+        if email in members:
+            voted_users.add(email)
 
     return jsonify({
-        "message": "Votes submitted successfully. Waiting for other users.",
-        "normalized": False
+        "current_round": current_round,
+        "total_ideas": len(current_ideas),
+        "total_users": len(members),
+        "votes_submitted": len(voted_users),
+        "all_votes_submitted": len(voted_users) >= len(members),
+        "round_complete": len(voted_users) >= len(members)
     })
 
 
-@app.route('/submit-final-results', methods=['POST'])
-def submit_final_results():  # type: ignore
-    """Submit final accumulated results from frontend"""
-    data = request.get_json()
-
-    if not data or 'email' not in data or 'finalResults' not in data:
-        return jsonify({"error": "Email and finalResults data required"}), 400
-
-    email = data['email'].strip().lower()
-    final_results = data['finalResults']
-
-    if not final_results:
-        return jsonify({"error": "No final results data provided"}), 400
+@voting.route('/ideas', methods=['GET'])
+def get_ideas():
+    """Get all available ideas for scoring, or return status if user has already voted.
 
-    print(f"📥 Received final results from user {email}")
+    A voter's list is served from the session's ideas_views and only
+    rebuilt when their own scores (or the round) change.
+    """
+    session = g.session
+    email = request.args.get('email', '').strip().lower()
 
-    # Store user final results data
-    user_final_data = {
-        "email": email,
-        "finalResults": final_results,
-        "submitted_at": datetime.utcnow().isoformat() + "Z"
-    }
+    # Check if user has already submitted final results
+    if email and session.storage.has_final_results(email):
+        return already_voted_response(email)
 
-    # Save to a user final results file
-    user_final_file = f'user_final_results_{email.replace("@", "_").replace(".", "_")}.json'
-    with open(user_final_file, 'w') as f:
-        json.dump(user_final_data, f, indent=2)
+    # User hasn't voted yet - return ideas for voting, with their saved scores
+    current_round = session.get_current_round()
+    with session.round_store.lock:
+        round_scores = session.round_store.get(current_round)
+        if round_scores is None:
+            logger.warning("Could not load current round", extra={"round": current_round})
+            return jsonify({"error": f"Could not load round {current_round} data"}), 500
+        cells = round_scores.user_cells(email) if email else None
 
-    print(f"💾 Saved user final results to {user_final_file}")
+    entry = session.ideas_views.get(current_round, round_scores, email, cells)
+    return entry.to_response(request, 'no-cache')
 
-    # Check if all users have submitted final results
-    if check_all_users_final_results():
-        print("🎯 All users have submitted final results! Storing final results...")
-        store_final_results()
-        return jsonify({
-            "message": "Final results submitted successfully. All users completed.",
-            "completed": True
-        })
 
+@cached_response
+def already_voted_response(email):
+    """Status information for a user who has already voted"""
     return jsonify({
-        "message": "Final results submitted successfully. Waiting for other users.",
-        "completed": False
+        "status": "already_voted",
+        "message": "You have already completed your voting",
+        "user_email": email,
+        **g.session.build_users_status()
     })
 
 
-def check_all_users_final_results():
-    """Check if all valid users have submitted their final results"""
-    print("🔍 check_all_users_final_results() called")
+@voting.route('/submit-all-votes', methods=['POST'])
+def submit_all_votes():
+    """Submit all voting data from all rounds at once.
 
-    submitted_users = set()
+    With Content-Type application/x-ndjson the body is streamed: an
+    {"email": ...} line followed by one round object per line.
+    """
+    service = g.session.voting_service
+    if request.mimetype == NDJSON_MIMETYPE:
+        lines = iter(lambda: request.stream.readline(Config.MAX_VOTE_LINE_BYTES + 1), b'')
+        payload, status = service.ingest_vote_stream(lines)
+        return jsonify(payload), status
+    return handle_submission(service.validate_all_votes, service.submit_all_votes)
 
-    # Check for user final results files
-    for valid_email in valid_emails:
-        user_file = f'user_final_results_{valid_email.replace("@", "_").replace(".", "_")}.json'
-        if os.path.exists(user_file):
-            submitted_users.add(valid_email.lower())
-            print(f"    ✅ Found final results from: {valid_email}")
-
-    print(f"📈 Final results summary:")
-    print(f"  - Valid submissions found: {len(submitted_users)}")
-    print(f"  - Required submissions: {len(valid_emails)}")
-    print(f"  - Users who submitted: {list(submitted_users)}")
-
-    all_submitted = len(submitted_users) == len(valid_emails)
-
-    if all_submitted:
-        print(f"🎉 ALL USERS HAVE SUBMITTED FINAL RESULTS!")
-    else:
-        print(f"⏳ WAITING - {len(submitted_users)}/{len(valid_emails)} users have submitted")
-
-    return all_submitted
-
-
-def store_final_results():
-    """Store the final accumulated results from all users with detailed logging and normalization"""
-    print("🔄 Starting final results calculation and storage...")
-    print("=" * 80)
-
-    # Load all user final results
-    all_final_results = {}
-    for valid_email in valid_emails:
-        user_file = f'user_final_results_{valid_email.replace("@", "_").replace(".", "_")}.json'
-        if os.path.exists(user_file):
-            with open(user_file, 'r') as f:
-                user_data = json.load(f)
-                all_final_results[valid_email] = user_data['finalResults']
-
-    print(f"📊 Loaded final results from {len(all_final_results)} users")
-    print(f"👥 Participating users: {list(all_final_results.keys())}")
-    print()
-
-    # Display raw scores from each user
-    print("📋 RAW SCORES FROM EACH USER:")
-    print("-" * 50)
-    for email, user_results in all_final_results.items():
-        print(f"User: {email}")
-        for result in user_results:
-            print(f"  Idea {result['id']} ({result['title']}): {result['finalScore']} points")
-        print()
-
-    # Calculate user totals for normalization
-    print("🔍 CALCULATING USER TOTALS FOR NORMALIZATION:")
-    print("-" * 50)
-    user_totals = {}
-    total_all_scores = 0
-
-    for email, user_results in all_final_results.items():
-        user_total = sum(result['finalScore'] or 0 for result in user_results)
-        user_totals[email] = user_total
-        total_all_scores += user_total
-        print(f"User {email} total: {user_total} points")
-
-    average_user_total = total_all_scores / len(all_final_results)
-    print(f"Average user total: {average_user_total:.2f} points")
-    print(f"Total scores across all users: {total_all_scores} points")
-    print()
-
-    # Calculate normalization factors
-    print("🔢 CALCULATING NORMALIZATION FACTORS:")
-    print("-" * 50)
-    user_normalizations = {}
-    for email, user_total in user_totals.items():
-        if user_total > 0:
-            normalization_factor = average_user_total / user_total
-            user_normalizations[email] = normalization_factor
-            print(f"User {email}: {user_total} points → normalization factor = {average_user_total:.2f} ÷ {user_total} = {normalization_factor:.4f}")
-        else:
-            user_normalizations[email] = 1.0
-            print(f"User {email}: {user_total} points → normalization factor = 1.0 (no scores)")
-
-    print(f"Normalization factors: {user_normalizations}")
-    print()
-
-    # Apply normalization and combine results
-    combined_results = {}
-
-    print("🔄 APPLYING NORMALIZATION AND COMBINING RESULTS:")
-    print("-" * 50)
-
-    for email, user_results in all_final_results.items():
-        normalization = user_normalizations[email]
-        print(f"Processing user: {email} (normalization factor: {normalization:.4f})")
-
-        for result in user_results:
-            idea_id = result['id']
-            raw_score = result['finalScore'] or 0
-            normalized_score = raw_score * normalization
-
-            if idea_id not in combined_results:
-                combined_results[idea_id] = {
-                    'id': result['id'],
-                    'title': result['title'],
-                    'description': result['description'],
-                    'final_score': 0,
-                    'user_scores': {},
-                    'normalized_user_scores': {}
-                }
-                print(f"  Created entry for Idea {idea_id} ({result['title']})")
-
-            # Store both raw and normalized scores
-            combined_results[idea_id]['user_scores'][email] = raw_score
-            combined_results[idea_id]['normalized_user_scores'][email] = normalized_score
-
-            # Add normalized score to final total
-            previous_total = combined_results[idea_id]['final_score']
-            combined_results[idea_id]['final_score'] += normalized_score
-
-            print(f"  Idea {idea_id}: raw={raw_score}, normalized={raw_score}×{normalization:.4f}={normalized_score:.4f}, total={previous_total:.4f}+{normalized_score:.4f}={combined_results[idea_id]['final_score']:.4f}")
-        print()
-
-    # Display final calculations summary
-    print("🏆 FINAL NORMALIZED CALCULATIONS SUMMARY:")
-    print("-" * 50)
-    print(f"Total participating users: {len(all_final_results)}")
-    print()
-
-    for idea_id, result in combined_results.items():
-        print(f"Idea {idea_id} - {result['title']}:")
-        print(f"  Raw scores: {result['user_scores']}")
-        print(f"  Normalized scores: {result['normalized_user_scores']}")
-        print(f"  Final normalized score: {result['final_score']:.4f}")
-        print()
-
-    # Convert to list and sort by final score
-    final_results_list = list(combined_results.values())
-    final_results_list.sort(key=lambda x: x['final_score'], reverse=True)
-
-    print("📊 FINAL NORMALIZED RANKINGS (sorted by normalized score):")
-    print("-" * 50)
-    for i, result in enumerate(final_results_list, 1):
-        print(f"{i}. Idea {result['id']} - {result['title']}: {result['final_score']:.4f} points")
-        print(f"   Raw scores: {result['user_scores']}")
-        print(f"   Normalized scores: {result['normalized_user_scores']}")
-    print()
-
-    # Save combined final results
-    with open('final_results.json', 'w') as f:
-        json.dump(final_results_list, f, indent=2)
-
-    print("💾 Saved normalized final results to final_results.json")
-    print("🏆 Final results calculation and storage complete!")
-    print("=" * 80)
-
-
-@app.route('/submit-vote', methods=['POST'])
-def submit_vote():
-    """Submit scored ideas"""
-    data = request.get_json()
 
-    if not data or 'ideas' not in data:
-        return jsonify({"error": "No ideas provided"}), 400
-
-    ideas = data['ideas']
-    if not ideas:
-        return jsonify({"error": "No ideas provided"}), 400
-
-    scored_count = sum(1 for idea in ideas if idea.get('score') is not None)
-    total_count = len(ideas)
-
-    if scored_count != total_count:
-        return jsonify({
-            "error": f"All ideas must be scored. Currently scored: {scored_count}/{total_count}"
-        }), 400
-
-    score_counts = {0: 0, 1: 0, 2: 0}
-    for idea in ideas:
-        score = idea.get('score')
-        if score is not None:
-            score_counts[score] += 1
-
-    max_score_2 = int(total_count * 0.2)
-    max_score_1 = int(total_count * 0.4)
-
-    if score_counts[2] > max_score_2:
-        return jsonify({
-            "error": f"Too many score 2 assignments. Maximum allowed: {max_score_2}, current: {score_counts[2]}"
-        }), 400
-
-    if score_counts[1] > max_score_1:
-        return jsonify({
-            "error": f"Too many score 1 assignments. Maximum allowed: {max_score_1}, current: {score_counts[1]}"
-        }), 400
-
-    total_score = sum(idea.get('score', 0) for idea in ideas)
-    current_round = get_current_round()
-
-    result = {
-        "id": len(submitted_votes) + 1,
-        "ideas": ideas,
-        "submitted_at": datetime.utcnow().isoformat() + "Z",
-        "total_score": total_score,
-        "score_distribution": score_counts,
-        "round": current_round,
-        "user_email": data.get('email', 'unknown')
-    }
-
-    submitted_votes.append(result)
-
-    email = data.get('email', '').strip().lower()
-    if email:
-        save_user_scores_to_round_file(current_round, email, ideas)
-        print(f"Saved scores for user {email} in round {current_round}")
-
-    # Check if all users have voted and automatically end the round
-    if check_all_users_voted():
-        print(f"All users have voted for round {
-              current_round}. Automatically ending round...")
-        try:
-            # Load current round ideas with user scores
-            round_file = f'round{current_round}.json'
-            with open(round_file, 'r') as f:
-                current_ideas = json.load(f)
-
-            # Randomly select 70% of ideas (scores are not transmitted between rounds)
-            total_ideas = len(current_ideas)
-            top_count = max(1, int(total_ideas * 0.7))  # At least 1 idea
-
-            # Get all idea IDs and randomly select top_count of them
-            all_idea_ids = [idea['id'] for idea in current_ideas]
-            top_idea_ids = random.sample(all_idea_ids, top_count)
-
-            print(f"🔀 Randomly selected {top_count} ideas out of {
-                  total_ideas} for next round")
-            print(f"📋 Selected idea IDs: {top_idea_ids}")
-
-            # Create next round ideas (only id, title, description)
-            next_round = current_round + 1
-            next_round_ideas = []
-
-            for idea in current_ideas:
-                if idea['id'] in top_idea_ids:
-                    next_round_ideas.append({
-                        "id": idea["id"],
-                        "title": idea["title"],
-                        "description": idea["description"]
-                    })
-
-            # Save next round file
-            next_round_file = f'round{next_round}.json'
-            with open(next_round_file, 'w') as f:
-                json.dump(next_round_ideas, f, indent=2)
-
-            print(f"Automatically ended round {current_round}, created round {
-                  next_round} with {len(next_round_ideas)} ideas")
+@voting.route('/submit-final-results', methods=['POST'])
+def submit_final_results():
+    """Submit final accumulated results from frontend"""
+    service = g.session.voting_service
+    return handle_submission(service.validate_final_results, service.submit_final_results)
 
-        except Exception as e:
-            print(f"Error automatically ending round {current_round}: {e}")
 
-    return jsonify(result)
+@voting.route('/submit-vote', methods=['POST'])
+def submit_vote():
+    """Submit scored ideas"""
+    service = g.session.voting_service
+    return handle_submission(service.validate_vote, service.submit_vote)
 
 
-@app.route('/end-round', methods=['POST'])
+@voting.route('/end-round', methods=['POST'])
 def end_round():
-    """End the current round and create the next round with top 70% of ideas"""
-    current_round = get_current_round()
-
-    try:
-        round_file = f'round{current_round}.json'
-        with open(round_file, 'r') as f:
-            current_ideas = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
+    """End the current round and create the next round with its best ideas.
+
+    An optional {"round": n} body ends round n only: a request repeated
+    after round n was ended gets its recorded result instead of ending the
+    round after it.
+    """
+    session = g.session
+    data = request.get_json(silent=True) or {}
+    current_round = data.get('round', session.get_current_round())
+    if not isinstance(current_round, int) or isinstance(current_round, bool) or current_round < 0:
+        return jsonify({"error": "round must be a non-negative integer"}), 400
+    if current_round > session.get_current_round():
+        return jsonify({"error": f"Round {current_round} has not started"}), 409
+
+    if session.round_store.get(current_round) is None:
         return jsonify({"error": f"Could not load round {current_round} data"}), 500
 
-    # Randomly select 70% of ideas (scores are not transmitted between rounds)
-    total_ideas = len(current_ideas)
-    top_count = max(1, int(total_ideas * 0.7))  # At least 1 idea
-
-    # Get all idea IDs and randomly select top_count of them
-    all_idea_ids = [idea['id'] for idea in current_ideas]
-    top_idea_ids = random.sample(all_idea_ids, top_count)
-
-    print(f"🔀 Manually ended round {
-          current_round} - randomly selected {top_count} ideas out of {total_ideas}")
-    print(f"📋 Selected idea IDs: {top_idea_ids}")
+    advancement = session.advance_round(current_round)
+    if advancement is None:
+        return jsonify({"error": f"Round {current_round} could not be ended"}), 409
 
     next_round = current_round + 1
-    next_round_ideas = []
-
-    for idea in current_ideas:
-        if idea['id'] in top_idea_ids:
-            next_round_ideas.append({
-                "id": idea["id"],
-                "title": idea["title"],
-                "description": idea["description"]
-            })
-
-    next_round_file = f'round{next_round}.json'
-    with open(next_round_file, 'w') as f:
-        json.dump(next_round_ideas, f, indent=2)
-
-    print(f"Ended round {current_round}, created round {
-          next_round} with {len(next_round_ideas)} ideas")
+    logger.info("Ended round", extra={"session": session.id, "round": current_round,
+                                      "next_round": next_round,
+                                      "ideas": len(advancement.ideas)})
 
     return jsonify({
         "message": f"Round {current_round} ended successfully",
         "next_round": next_round,
-        "total_ideas": total_ideas,
-        "surviving_ideas": len(next_round_ideas),
-        "survival_rate": len(next_round_ideas) / total_ideas if total_ideas > 0 else 0
+        "total_ideas": advancement.total,
+        "surviving_ideas": len(advancement.ideas),
+        "survival_rate": advancement.survival_rate,
+        "mode": advancement.mode
     })
 
 
-@app.route('/results', methods=['GET'])
+@voting.route('/results', methods=['GET'])
 def get_results():
     """Get voting results"""
-    if not submitted_votes:
+    total_votes, average_scores, score_distributions, recent_votes = \
+        g.session.storage.vote_summary()
+
+    if not total_votes:
         return jsonify({
             "total_votes": 0,
             "average_scores": {},
@@ -809,29 +1425,6 @@ def get_results():
             "recent_votes": []
         })
 
-    total_votes = len(submitted_votes)
-
-    idea_scores = {}
-    score_distributions = {0: 0, 1: 0, 2: 0}
-
-    for vote in submitted_votes:
-        for idea in vote['ideas']:
-            idea_id = idea['id']
-            score = idea.get('score', 0)
-
-            if idea_id not in idea_scores:
-                idea_scores[idea_id] = []
-            idea_scores[idea_id].append(score)
-
-            score_distributions[score] += 1
-
-    average_scores = {}
-    for idea_id, scores in idea_scores.items():
-        average_scores[idea_id] = sum(scores) / len(scores)
-
-    recent_votes = submitted_votes[-5:] if len(
-        submitted_votes) > 5 else submitted_votes
-
     return jsonify({
         "total_votes": total_votes,
         "average_scores": average_scores,
@@ -840,7 +1433,7 @@ def get_results():
     })
 
 
-@app.route('/validate-email', methods=['POST'])
+@voting.route('/validate-email', methods=['POST'])
 def validate_email():
     """Validate email address"""
     data = request.get_json()
@@ -850,7 +1443,7 @@ def validate_email():
 
     email = data['email'].strip()
 
-    match = next((e for e in valid_emails if e.lower() == email.lower()), None)
+    match = g.session.roster.current().lookup(email)
 
     if not match:
         return jsonify({"valid": False, "error": "Wrong email address check for typos"}), 400
@@ -858,7 +1451,7 @@ def validate_email():
     return jsonify({"valid": True, "email": match})
 
 
-@app.route('/user-scores', methods=['GET'])
+@voting.route('/user-scores', methods=['GET'])
 def get_user_scores():
     """Get saved scores for a user"""
     email = request.args.get('email')
@@ -869,15 +1462,14 @@ def get_user_scores():
 
     email = email.strip().lower()
 
-    current_ideas = load_current_round_ideas()
+    current_ideas = g.session.load_current_round_ideas()
 
     scores_list = []
-    for idx, idea in enumerate(current_ideas):
-        score = idea.get('user_scores', {}).get(email)
+    for idea, score in current_ideas.scores_for(email):
         if score is not None:
             scores_list.append({
-                'id': idea['id'],
-                'title': idea['title'],
+                'id': idea.id,
+                'title': idea.title,
                 'score': score
             })
 
@@ -888,107 +1480,114 @@ def get_user_scores():
     return jsonify(response)
 
 
-@app.route('/save-scores', methods=['POST'])
+@voting.route('/save-scores', methods=['POST'])
 def save_user_scores():
     """Save user scores (called automatically when submitting votes)"""
-    data = request.get_json()
-
-    if not data or 'email' not in data or 'ideas' not in data:
-        return jsonify({"success": False, "error": "Email and ideas are required"}), 400
-
-    email = data['email'].strip().lower()
-    ideas = data['ideas']
-    round_num = str(data.get('round', get_current_round()))
-
-    save_user_scores_to_round_file(int(round_num), email, ideas)
-
-    return jsonify({"success": True, "round": round_num})
+    service = g.session.voting_service
+    return handle_submission(service.validate_save_scores, service.save_scores)
 
 
-@app.route('/final-results', methods=['GET'])
+@voting.route('/final-results', methods=['GET'])
+@cached_response
 def get_final_results():
-    """Get the final normalized results"""
-    try:
-        with open('final_results.json', 'r') as f:
-            final_results = json.load(f)
-        return jsonify(final_results)
-    except FileNotFoundError:
-        return jsonify({"error": "Final results not available yet"}), 404
+    """Get the final normalized results, or the status of their aggregation"""
+    session = g.session
+    job = session.latest_results_job()
+
+    if job is not None and not job.done:
+        response = jsonify({
+            "error": "Final results are being calculated",
+            "status": job.status,
+            "job": job.to_dict()
+        })
+        response.headers['Retry-After'] = '2'
+        return response, 503
+
+    final_results = session.storage.load_final_results()
+    if final_results is None:
+        if job is not None and job.status == Job.FAILED:
+            return jsonify({
+                "error": "Final results calculation failed",
+                "status": job.status,
+                "job": job.to_dict()
+            }), 500
+        return jsonify({"error": "Final results not available yet", "status": "pending"}), 404
+    return jsonify({"status": Job.COMPLETED, "results": final_results})
+
+
+@voting.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status and progress of a background job"""
+    job = g.session.job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@voting.route('/events', methods=['GET'])
+def stream_events():
+    """Server-Sent Events stream of voting status changes.
+
+    A new client first receives a 'status' snapshot; a client reconnecting
+    with Last-Event-ID receives the events it missed, or a fresh snapshot
+    if they are no longer buffered. The stream ends when the session is
+    unloaded, and the client's reconnect reaches the reloaded session.
+    """
+    session = g.session
+    session.event_relay.start()
+    broadcaster = session.event_relay.broadcaster
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    cursor = int(last_event_id) if last_event_id.isdigit() else None
+
+    def stream(cursor):
+        yield "retry: 3000\n\n"
+        if cursor is None:
+            cursor = broadcaster.last_id
+            yield format_event(cursor, 'status', session.build_status_snapshot())
+        while not session.closed:
+            events = broadcaster.wait(cursor, Config.EVENTS_HEARTBEAT_INTERVAL)
+            if events is None:
+                cursor = broadcaster.last_id
+                yield format_event(cursor, 'status', session.build_status_snapshot())
+            elif not events:
+                yield ": keep-alive\n\n"
+            for event_id, event_type, data in events or ():
+                cursor = event_id
+                yield format_event(event_id, event_type, data)
+
+    return Response(stream(cursor), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 
-@app.route('/user-status', methods=['GET'])
+@voting.route('/user-status', methods=['GET'])
 def get_user_status():
     """Check if a specific user has submitted final results"""
     email = request.args.get('email', '').strip().lower()
     if not email:
         return jsonify({"error": "Email required"}), 400
 
-    user_file = f'user_final_results_{email.replace("@", "_").replace(".", "_")}.json'
-    has_voted = os.path.exists(user_file)
-
     return jsonify({
         "email": email,
-        "has_voted": has_voted
+        "has_voted": g.session.storage.has_final_results(email)
     })
 
 
-@app.route('/all-users-status', methods=['GET'])
+@voting.route('/all-users-status', methods=['GET'])
+@cached_response
 def get_all_users_status():
     """Get voting status for all users"""
-    users_status = []
-
-    for email in valid_emails:
-        user_file = f'user_final_results_{email.replace(
-            "@", "_").replace(".", "_")}.json'
-        has_voted = os.path.exists(user_file)
-
-        users_status.append({
-            "email": email,
-            "has_voted": has_voted,
-            "status": "completed" if has_voted else "waiting"
-        })
+    return jsonify(g.session.build_users_status())
 
-    all_voted = all(user["has_voted"] for user in users_status)
-
-    return jsonify({
-        "users": users_status,
-        "all_voted": all_voted,
-        "total_users": len(valid_emails),
-        "voted_count": sum(1 for user in users_status if user["has_voted"])
-    })
-
-
-def save_user_scores_to_round_file(round_num, email, ideas):
-    """Save a user's scores directly to the round file"""
-    if round_num == 0:
-        current_ideas = load_current_round_ideas()
-        round_file = 'round0.json'
-    else:
-        round_file = f'round{round_num}.json'
-        try:
-            with open(round_file, 'r') as f:
-                current_ideas = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            print(f"Warning: Could not load {round_file}")
-            return
-
-    for idea_data in ideas:
-        idea_id = idea_data['id']
-        score = idea_data.get('score')
-
-        idea = next(
-            (idea for idea in current_ideas if idea.get('id') == idea_id), None)
-        if idea is not None:
-            if 'user_scores' not in idea:
-                idea['user_scores'] = {}
-            idea['user_scores'][email] = score
-        else:
-            print(f"Warning: idea with id {
-                  idea_id} not found in round {round_num}")
 
-    with open(round_file, 'w') as f:
-        json.dump(current_ideas, f, indent=2)
+app.register_blueprint(voting)
+app.register_blueprint(voting, url_prefix='/sessions/<session_id>', name='session')
 
 
 if __name__ == '__main__':
+    # Development server only: `python run.py --production` serves the app
+    # with gunicorn workers
+    if Config.ENV == 'production':
+        sys.exit("ENV=production: start the server with `python run.py --production`")
     app.run(debug=Config.DEBUG, host=Config.HOST, port=Config.PORT)
@@ -0,0 +1,245 @@
+"""
+Metrics for the Voter App API
+
+Counters and histograms rendered in the Prometheus text exposition format
+by GET /metrics. Modules declare their metrics at import time:
+
+    REQUESTS = metrics.counter('voter_requests_total', 'Requests served', ('route',))
+    REQUESTS.labels('/ideas').inc()
+
+Recording never takes a lock: every thread adds to its own shard of a
+metric's values, and only a scrape walks the shards and sums them. The
+shards of threads that have exited are folded into a retired total on the
+next scrape. Label children are cached, so after the first use of a label
+set an observation is a dict lookup, a bisect and two list additions.
+
+Metrics are kept per process. With several server workers each scrape is
+answered by one of them, so scrape each worker (or run one per container).
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from logging_config import get_logger
+
+logger = get_logger('metrics')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds, from a fast cache hit to a slow aggregation job
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Shards:
+    """Per-thread lists of a metric's values, only ever written by their thread"""
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._live = []
+        self._retired = [0] * size
+        self._lock = threading.Lock()
+
+    def get(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = [0] * self._size
+            with self._lock:
+                self._live.append((threading.current_thread(), values))
+            return values
+
+    def totals(self):
+        with self._lock:
+            live = []
+            for thread, values in self._live:
+                if thread.is_alive():
+                    live.append((thread, values))
+                else:
+                    self._retired = [a + b for a, b in zip(self._retired, values)]
+            self._live = live
+            totals = list(self._retired)
+        for _, values in live:
+            totals = [a + b for a, b in zip(totals, values)]
+        return totals
+
+
+class _CounterChild:
+    __slots__ = ('_shards',)
+
+    def __init__(self):
+        self._shards = _Shards(1)
+
+    def inc(self, amount=1):
+        self._shards.get()[0] += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self._shards.totals()[0]
+
+
+class _HistogramChild:
+    __slots__ = ('_bounds', '_shards')
+
+    def __init__(self, bounds):
+        self._bounds = bounds
+        # One count per bucket (the last one is +Inf), then the sum
+        self._shards = _Shards(len(bounds) + 2)
+
+    def observe(self, value):
+        values = self._shards.get()
+        values[bisect.bisect_left(self._bounds, value)] += 1
+        values[-1] += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def samples(self, name, labels):
+        totals = self._shards.totals()
+        cumulative = 0
+        for bound, count in zip(self._bounds + (float('inf'),), totals):
+            cumulative += count
+            yield f'{name}_bucket', labels + (('le', _format_value(bound)),), cumulative
+        yield f'{name}_sum', labels, totals[-1]
+        yield f'{name}_count', labels, cumulative
+
+
+class _Metric:
+    """A named metric, with one child per set of label values"""
+
+    def __init__(self, name, documentation, labelnames, make_child):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._make_child = make_child
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._make_child())
+        return child
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield from child.samples(self.name, tuple(zip(self.labelnames, map(str, values))))
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames, _CounterChild)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, lambda: _HistogramChild(bounds))
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+class Callback:
+    """A gauge or counter whose value is read from fn() at scrape time.
+
+    fn returns a number, or {label values: number} when there are labels.
+    """
+
+    def __init__(self, name, documentation, fn, labelnames=(), type='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.type = type
+        self._fn = fn
+
+    def samples(self):
+        value = self._fn()
+        if not self.labelnames:
+            yield self.name, (), value
+            return
+        for values, number in value.items():
+            yield self.name, tuple(zip(self.labelnames, map(str, values))), number
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add metric, or return the one already registered under its name"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                samples = list(metric.samples())
+            except Exception:
+                # A failing callback must not take the other metrics down
+                logger.exception("Could not collect metric", extra={"metric": metric.name})
+                continue
+            lines.append(f'# HELP {metric.name} {_escape_help(metric.documentation)}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in samples:
+                if labels:
+                    rendered = ','.join(f'{key}="{_escape_label(val)}"' for key, val in labels)
+                    lines.append(f'{name}{{{rendered}}} {_format_value(value)}')
+                else:
+                    lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_help(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def callback(name, documentation, fn, labelnames=(), type='gauge'):
+    return REGISTRY.register(Callback(name, documentation, fn, labelnames, type))
+
+
+def render():
+    """All registered metrics in the Prometheus text format"""
+    return REGISTRY.render()
@@ -1,13 +1,222 @@
+import sys
+from array import array
 from typing import List, Optional
 from dataclasses import dataclass
 from datetime import datetime
 
-@dataclass
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised when NumPy is missing
+    np = None
+
+# Cell values of a RoundScores matrix besides the scores themselves
+NO_SCORE = -1      # the voter submitted the idea without a score (null)
+NOT_VOTED = -128   # the voter has no entry for the idea
+MAX_STORED_SCORE = 127
+
+
 class Idea:
-    id: int
-    title: str
-    description: str
-    score: Optional[int] = None
+    """An idea of a round. Slotted: a round can hold tens of thousands."""
+
+    __slots__ = ('id', 'title', 'description', 'score', 'extra')
+
+    def __init__(self, id: int, title: str, description: str,
+                 score: Optional[int] = None, extra: Optional[dict] = None):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.score = score
+        # Any other keys of the stored idea, kept so it round-trips
+        self.extra = extra
+
+    def __repr__(self):
+        return f"Idea(id={self.id!r}, title={self.title!r}, score={self.score!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, Idea):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Idea':
+        """Idea from a stored idea dict; its 'user_scores' are not kept here"""
+        extra = {key: value for key, value in data.items()
+                 if key not in ('id', 'title', 'description', 'score', 'user_scores')}
+        return cls(data.get('id'), data.get('title'), data.get('description'),
+                   data.get('score'), extra or None)
+
+    def to_dict(self) -> dict:
+        data = {"id": self.id, "title": self.title, "description": self.description}
+        if self.score is not None:
+            data["score"] = self.score
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+def _encode_score(score):
+    if score is None:
+        return NO_SCORE
+    if type(score) is not int or not 0 <= score <= MAX_STORED_SCORE:
+        raise ValueError(f"Score must be null or an integer from 0 to {MAX_STORED_SCORE}: {score!r}")
+    return score
+
+
+def _decode_score(cell):
+    return None if cell == NO_SCORE else cell
+
+
+class RoundScores:
+    """The ideas of one round and every voter's score for each of them.
+
+    Ideas and voters are interned to positions: ideas keep their order in
+    the round, voters are numbered as they first score. The scores are one
+    array('b') holding a row of len(ideas) signed bytes per voter, so a
+    round costs one byte per (voter, idea) instead of a dict entry, and one
+    voter's scores are a contiguous slice.
+
+    from_dicts() and to_dicts() convert from and to the stored round shape:
+    a list of idea dicts carrying a 'user_scores' mapping of email -> score.
+    """
+
+    __slots__ = ('ideas', '_positions', '_rows', '_emails', '_matrix')
+
+    def __init__(self, ideas: List[Idea]):
+        self.ideas = list(ideas)
+        self._positions = {idea.id: position for position, idea in enumerate(self.ideas)}
+        self._rows = {}
+        self._emails = []
+        self._matrix = array('b')
+
+    @classmethod
+    def from_dicts(cls, ideas: List[dict]) -> 'RoundScores':
+        round_scores = cls(Idea.from_dict(data) for data in ideas)
+        width = len(round_scores.ideas)
+        matrix = round_scores._matrix
+        rows = round_scores._rows
+        for position, data in enumerate(ideas):
+            for email, score in (data.get('user_scores') or {}).items():
+                row = rows.get(email)
+                if row is None:
+                    row = round_scores._row(email)
+                matrix[row * width + position] = _encode_score(score)
+        return round_scores
+
+    def to_dicts(self) -> List[dict]:
+        width = len(self.ideas)
+        ideas = []
+        for position, idea in enumerate(self.ideas):
+            data = idea.to_dict()
+            column = self._matrix[position::width] if width else ()
+            user_scores = {email: _decode_score(cell)
+                           for email, cell in zip(self._emails, column) if cell != NOT_VOTED}
+            if user_scores:
+                data['user_scores'] = user_scores
+            ideas.append(data)
+        return ideas
+
+    def copy(self) -> 'RoundScores':
+        """Snapshot of the scores; the (unchanging) Idea objects are shared"""
+        snapshot = RoundScores.__new__(RoundScores)
+        snapshot.ideas = self.ideas
+        snapshot._positions = self._positions
+        snapshot._rows = dict(self._rows)
+        snapshot._emails = list(self._emails)
+        snapshot._matrix = array('b', self._matrix)
+        return snapshot
+
+    def __len__(self):
+        return len(self.ideas)
+
+    def __iter__(self):
+        return iter(self.ideas)
+
+    def position(self, idea_id) -> Optional[int]:
+        return self._positions.get(idea_id)
+
+    def _row(self, email):
+        row = self._rows.get(email)
+        if row is None:
+            email = sys.intern(email)
+            row = self._rows[email] = len(self._emails)
+            self._emails.append(email)
+            self._matrix.extend(array('b', [NOT_VOTED]) * len(self.ideas))
+        return row
+
+    def set_score(self, email: str, position: int, score: Optional[int]):
+        """Record email's score (or null) for the idea at position"""
+        cell = _encode_score(score)
+        self._matrix[self._row(email) * len(self.ideas) + position] = cell
+
+    def set_scores(self, email: str, scores):
+        """Record email's scores from (position, score) pairs"""
+        cells = [(position, _encode_score(score)) for position, score in scores]
+        if not cells:
+            return
+        offset = self._row(email) * len(self.ideas)
+        matrix = self._matrix
+        for position, cell in cells:
+            matrix[offset + position] = cell
+
+    def scores_for(self, email: str):
+        """(Idea, score or None) for every idea of the round, in order"""
+        row = self._rows.get(email)
+        if row is None:
+            return ((idea, None) for idea in self.ideas)
+        width = len(self.ideas)
+        cells = self._matrix[row * width:(row + 1) * width]
+        return ((idea, None if cell == NOT_VOTED else _decode_score(cell))
+                for idea, cell in zip(self.ideas, cells))
+
+    def user_cells(self, email: str) -> Optional[bytes]:
+        """Copy of email's row of raw cells (as unsigned bytes), or None"""
+        row = self._rows.get(email)
+        if row is None:
+            return None
+        width = len(self.ideas)
+        return self._matrix[row * width:(row + 1) * width].tobytes()
+
+    def voters(self) -> List[str]:
+        """Emails with at least one entry, in the order they first voted"""
+        return list(self._emails)
+
+    def totals(self, normalized: bool = False) -> List[float]:
+        """Sum of the voters' scores per idea, in idea order.
+
+        Null and missing scores count as 0. When normalized, each voter's
+        scores are first scaled by (average voter total / voter total), as
+        the final normalization does, so that generous voters do not
+        outweigh strict ones; voters who scored nothing are left out.
+        """
+        width = len(self.ideas)
+        if not width or not self._emails:
+            return [0.0] * width
+        if np is not None:
+            cells = np.frombuffer(self._matrix, dtype=np.int8).reshape(len(self._emails), width)
+            scores = np.maximum(cells, 0).astype(np.float64)
+            if normalized:
+                voter_totals = scores.sum(axis=1)
+                scoring = voter_totals > 0
+                if scoring.any():
+                    factors = np.zeros_like(voter_totals)
+                    factors[scoring] = voter_totals[scoring].mean() / voter_totals[scoring]
+                    scores *= factors[:, None]
+            return scores.sum(axis=0).tolist()
+
+        rows = [[max(cell, 0) for cell in self._matrix[row * width:(row + 1) * width]]
+                for row in range(len(self._emails))]
+        factors = [1.0] * len(rows)
+        if normalized:
+            voter_totals = [sum(row) for row in rows]
+            scoring = [total for total in voter_totals if total > 0]
+            average = sum(scoring) / len(scoring) if scoring else 0
+            factors = [average / total if total > 0 else 0.0 for total in voter_totals]
+        totals = [0.0] * width
+        for row, factor in zip(rows, factors):
+            for position, score in enumerate(row):
+                if score:
+                    totals[position] += score * factor
+        return totals
 
 @dataclass
 class VoteSubmission:
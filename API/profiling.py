@@ -0,0 +1,280 @@
+"""
+On-demand profiling for the Voter App API
+
+An admin arms a profile for a target: a route ("POST /submit-vote") or a
+hooked function such as "store_final_results". The next `count` calls of
+the target are recorded and merged into one profile, written to
+PROFILE_DIR when the last of them finishes:
+
+    cprofile  deterministic cProfile of the calling thread, saved as
+              .pstats (python -m pstats, snakeviz, flameprof)
+    sample    the calling thread's stack sampled every interval, saved as
+              collapsed stacks (flamegraph.pl, speedscope)
+
+Only one cProfile recording runs at a time, since from Python 3.12 on
+cProfile is process-wide; calls that arrive while one is running are
+left out, not counted. While nothing is armed a hooked call costs one
+attribute check.
+
+Profiles are armed per process: with several server workers only the
+worker that received the request records.
+"""
+import cProfile
+import functools
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+from logging_config import get_logger
+
+logger = get_logger('profiling')
+
+MODES = ('cprofile', 'sample')
+DEFAULT_SAMPLE_INTERVAL = 0.002
+# Finished sessions kept for GET /admin/profiles
+HISTORY = 50
+
+
+class _Sampler:
+    """Samples one thread's stack into collapsed-stack counts"""
+
+    def __init__(self, thread_id, interval):
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+        self.stacks = Counter()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:'
+                             f'{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+
+class ProfileSession:
+    ARMED = 'armed'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    CANCELLED = 'cancelled'
+    FAILED = 'failed'
+
+    def __init__(self, target, mode, count, interval):
+        self.id = uuid.uuid4().hex
+        self.target = target
+        self.mode = mode
+        self.count = count
+        self.interval = interval
+        self.remaining = count
+        self.captured = 0
+        self.active = 0
+        self.status = ProfileSession.ARMED
+        self.path = None
+        self.error = None
+        self.worker = os.getpid()
+        self.created_at = datetime.utcnow().isoformat() + "Z"
+        self.finished_at = None
+        self.stats = None
+        self.stacks = Counter()
+
+    @property
+    def done(self):
+        return self.status in (ProfileSession.COMPLETED, ProfileSession.CANCELLED,
+                               ProfileSession.FAILED)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "target": self.target,
+            "mode": self.mode,
+            "count": self.count,
+            "captured": self.captured,
+            "status": self.status,
+            "file": self.path,
+            "error": self.error,
+            "worker": self.worker,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class Profiler:
+    """Armed profile sessions, by target"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        # Checked before anything else on every hooked call
+        self.armed = False
+        self._targets = {}
+        self._sessions = OrderedDict()
+        self._cprofile_running = False
+        self._lock = threading.Lock()
+
+    def arm(self, target, mode='cprofile', count=1, interval=DEFAULT_SAMPLE_INTERVAL):
+        """Profile the next count calls of target; returns the ProfileSession"""
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        with self._lock:
+            if target in self._targets:
+                raise ValueError(f"A profile of {target} is already armed")
+            session = ProfileSession(target, mode, count, interval)
+            self._targets[target] = session
+            self._sessions[session.id] = session
+            self._prune()
+            self.armed = True
+        logger.info("Profile armed", extra=session.to_dict())
+        return session
+
+    def cancel(self, session_id):
+        """Disarm a session; calls being recorded finish unrecorded"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.done:
+                return session
+            session.status = ProfileSession.CANCELLED
+            session.finished_at = datetime.utcnow().isoformat() + "Z"
+            self._disarm(session)
+            return session
+
+    def get(self, session_id):
+        return self._sessions.get(session_id)
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    def call(self, target, fn, *args, **kwargs):
+        """fn(*args, **kwargs), recorded if a profile of target is armed"""
+        token = self.start(target) if self.armed else None
+        if token is None:
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.stop(token)
+
+    def hook(self, target):
+        """Decorator recording a function's calls when target is armed"""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.armed:
+                    return fn(*args, **kwargs)
+                return self.call(target, fn, *args, **kwargs)
+            return wrapper
+        return decorate
+
+    def start(self, target):
+        """Start recording a call of target; returns a token for stop(), or None"""
+        with self._lock:
+            session = self._targets.get(target)
+            if session is None or session.remaining == 0:
+                return None
+            if session.mode == 'cprofile':
+                if self._cprofile_running:
+                    return None
+                self._cprofile_running = True
+            session.remaining -= 1
+            session.active += 1
+            session.status = ProfileSession.RUNNING
+
+        if session.mode == 'cprofile':
+            recorder = cProfile.Profile()
+            try:
+                recorder.enable()
+            except ValueError:
+                # Another tool (a debugger, coverage) holds the profiling hook
+                logger.warning("Could not start cProfile", extra={"profile": session.id})
+                with self._lock:
+                    self._cprofile_running = False
+                    session.remaining += 1
+                    session.active -= 1
+                return None
+        else:
+            recorder = _Sampler(threading.get_ident(), session.interval)
+            recorder.start()
+        return session, recorder
+
+    def stop(self, token):
+        session, recorder = token
+        if session.mode == 'cprofile':
+            recorder.disable()
+        else:
+            recorder.stop()
+
+        with self._lock:
+            if session.mode == 'cprofile':
+                self._cprofile_running = False
+            session.active -= 1
+            if session.done:
+                return
+            session.captured += 1
+            if session.mode == 'cprofile':
+                if session.stats is None:
+                    session.stats = pstats.Stats(recorder)
+                else:
+                    session.stats.add(recorder)
+            else:
+                session.stacks.update(recorder.stacks)
+            finished = session.remaining == 0 and session.active == 0
+            if finished:
+                self._disarm(session)
+        if finished:
+            self._write(session)
+
+    def _disarm(self, session):
+        if self._targets.get(session.target) is session:
+            del self._targets[session.target]
+        self.armed = bool(self._targets)
+
+    def _prune(self):
+        finished = [key for key, session in self._sessions.items() if session.done]
+        for key in finished[:max(0, len(self._sessions) - HISTORY)]:
+            del self._sessions[key]
+
+    def _write(self, session):
+        name = re.sub(r'[^A-Za-z0-9]+', '_', session.target).strip('_')
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        extension = 'pstats' if session.mode == 'cprofile' else 'collapsed'
+        path = os.path.join(self.directory, f'{stamp}-{name}-{session.id[:8]}.{extension}')
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if session.mode == 'cprofile':
+                session.stats.dump_stats(path)
+            else:
+                with open(path, 'w') as f:
+                    for stack, count in session.stacks.most_common():
+                        f.write(f'{stack} {count}\n')
+        except OSError as e:
+            logger.exception("Could not write profile", extra={"profile": session.id})
+            session.status = ProfileSession.FAILED
+            session.error = str(e)
+        else:
+            session.path = path
+            session.status = ProfileSession.COMPLETED
+            logger.info("Profile written", extra=session.to_dict())
+        finally:
+            session.finished_at = datetime.utcnow().isoformat() + "Z"
+            session.stats = None
+            session.stacks = Counter()
@@ -0,0 +1,188 @@
+"""
+Versioned response cache for the read endpoints of the Voter App API
+
+A cached response is stored per (path, query string) together with the
+state version it was built from. While the version is unchanged the
+response is served from memory: the body is serialized once, its strong
+ETag is computed once and a gzip copy is compressed once. A request whose
+If-None-Match matches gets a 304 without a body.
+
+IdeasViews caches GET /ideas per voter instead, since a voter's view only
+changes with their own scores.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response
+
+import serializer
+from models import MAX_STORED_SCORE
+
+# zlib's default trade-off: a third of the time of level 9 for a few
+# percent more bytes, which matters once bodies are built per voter
+GZIP_LEVEL = 6
+
+
+def _etag(body):
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def _accepts_gzip(request):
+    return 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+
+
+class CachedResponse:
+    """One serialized response, with its ETag and optional gzip variant"""
+
+    __slots__ = ('body', 'mimetype', 'etag', 'gzip_body', 'gzip_etag')
+
+    def __init__(self, body, mimetype, gzip_min_size):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = _etag(body)
+        self.gzip_body = None
+        self.gzip_etag = None
+        if len(body) >= gzip_min_size:
+            # mtime=0 keeps the compressed bytes, and so the ETag, stable
+            self.gzip_body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+            self.gzip_etag = self.etag[:-1] + '-gzip"'
+
+    def to_response(self, request, cache_control):
+        use_gzip = self.gzip_body is not None and _accepts_gzip(request)
+        etag = self.gzip_etag if use_gzip else self.etag
+
+        headers = {'ETag': etag, 'Cache-Control': cache_control}
+        if self.gzip_body is not None:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if_none_match = request.headers.get('If-None-Match', '')
+        if if_none_match == '*' or etag in (tag.strip() for tag in if_none_match.split(',')):
+            return Response(status=304, headers=headers)
+
+        if use_gzip:
+            headers['Content-Encoding'] = 'gzip'
+            return Response(self.gzip_body, mimetype=self.mimetype, headers=headers)
+        return Response(self.body, mimetype=self.mimetype, headers=headers)
+
+
+class ResponseCache:
+    """LRU map of request key -> (state version, CachedResponse)"""
+
+    def __init__(self, max_entries, gzip_min_size):
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+        self._gzip_min_size = gzip_min_size
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None or cached[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return cached[1]
+
+    def put(self, key, version, body, mimetype):
+        entry = CachedResponse(body, mimetype, self._gzip_min_size)
+        with self._lock:
+            self._entries[key] = (version, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# "score" member for a RoundScores cell read as an unsigned byte: the
+# score, or null for NO_SCORE (255) and NOT_VOTED (128)
+_SCORE_JSON = [b'"score":' + (str(cell).encode() if cell <= MAX_STORED_SCORE else b'null')
+               for cell in range(256)]
+_NULL_SCORE = b'"score":null'
+
+
+class IdeasViews:
+    """GET /ideas bodies of the current round, per voter.
+
+    The round's ideas are encoded once into a template: the fixed JSON
+    between consecutive "score" values. A voter's body is the template
+    with their row of RoundScores cells mapped into the gaps, which is a
+    list copy, a map and a join, with no per-idea Python code. It is
+    kept, with its ETag and gzip copy, for as long as the voter's row is
+    unchanged, so other voters' saves do not invalidate it. Entries are
+    evicted least recently used beyond max_bytes.
+    """
+
+    def __init__(self, max_bytes, gzip_min_size):
+        self._max_bytes = max_bytes
+        self._gzip_min_size = gzip_min_size
+        self._round_num = None
+        self._owner = None
+        self._parts = None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _template(ideas):
+        # Encoded once with null scores (keys sorted like jsonify) and split
+        # around them; '"score":null' cannot occur inside an encoded string,
+        # whose quotes are escaped
+        encoded = serializer.dumps([{"id": idea.id, "title": idea.title,
+                                     "description": idea.description, "score": None}
+                                    for idea in ideas], sort_keys=True) + b'\n'
+        pieces = encoded.split(_NULL_SCORE)
+        parts = [_NULL_SCORE] * (2 * len(pieces) - 1)
+        parts[0::2] = pieces
+        return parts
+
+    def _use_round(self, round_num, round_scores):
+        if round_num == self._round_num and round_scores is self._owner:
+            return
+        parts = self._template(round_scores.ideas)
+        # A reload of the same round (another worker saved scores) keeps
+        # the same ideas, and with them the cached bodies
+        if round_num != self._round_num or parts != self._parts:
+            self._entries.clear()
+            self._bytes = 0
+        self._round_num, self._owner, self._parts = round_num, round_scores, parts
+
+    def _body(self, cells):
+        if cells is None:
+            return b''.join(self._parts)
+        parts = list(self._parts)
+        parts[1::2] = map(_SCORE_JSON.__getitem__, cells)
+        return b''.join(parts)
+
+    def get(self, round_num, round_scores, email, cells):
+        """CachedResponse of /ideas for email, whose RoundScores.user_cells() are cells"""
+        with self._lock:
+            self._use_round(round_num, round_scores)
+            cached = self._entries.get(email)
+            if cached is not None and cached[0] == cells:
+                self._entries.move_to_end(email)
+                return cached[1]
+            entry = CachedResponse(self._body(cells), 'application/json', self._gzip_min_size)
+            self._store(email, cells, entry)
+            return entry
+
+    def _store(self, email, cells, entry):
+        previous = self._entries.pop(email, None)
+        if previous is not None:
+            self._bytes -= previous[2]
+        size = len(entry.body) + len(entry.gzip_body or b'') + len(cells or b'')
+        self._entries[email] = (cells, entry, size)
+        self._bytes += size
+        while self._bytes > self._max_bytes and len(self._entries) > 1:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._round_num = self._owner = self._parts = None
+            self._entries.clear()
+            self._bytes = 0
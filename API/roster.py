@@ -0,0 +1,207 @@
+"""
+Voter roster for the Voter App API
+
+The roster is the list of people allowed to vote. It is read from a file
+(ROSTER_SOURCE=file, ROSTER_FILE) or from the storage backend
+(ROSTER_SOURCE=storage: roster.json in the JSON backend's directory, the
+roster table of the SQLite database). A roster file is either JSON, a
+list of emails or {"emails": [...]}, or plain text with one email per
+line and '#' comments.
+
+Each load produces an immutable RosterSnapshot indexed by normalized
+email, so membership checks and lookups are a dict probe however long the
+roster is. Roster.current() checks the source's stamp at most every
+reload_interval seconds and swaps in a new snapshot when it changed, so
+an edited roster is picked up by every server worker without a restart.
+A roster that fails to load leaves the previous one in place.
+"""
+import os
+import threading
+import time
+
+import serializer
+from logging_config import get_logger
+from storage import normalize_email
+
+logger = get_logger('roster')
+
+
+class RosterSnapshot:
+    """One version of the roster: emails in roster order, indexed by normalized email"""
+
+    __slots__ = ('emails', 'version', '_index')
+
+    def __init__(self, emails, version=0):
+        index = {}
+        for email in emails:
+            # The first spelling of an email wins
+            index.setdefault(normalize_email(email), email)
+        self.emails = list(index.values())
+        self.version = version
+        self._index = index
+
+    def lookup(self, email):
+        """The roster's spelling of email, or None if it is not on the roster"""
+        return self._index.get(normalize_email(email))
+
+    def keys(self):
+        """Normalized emails of the roster, as a set-like view"""
+        return self._index.keys()
+
+    def __contains__(self, email):
+        return normalize_email(email) in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return iter(self.emails)
+
+
+def parse_roster(data):
+    """List of emails from a stored roster: a JSON list or {"emails": [...]}"""
+    if isinstance(data, dict):
+        data = data.get('emails')
+    if not isinstance(data, list) or not all(isinstance(email, str) for email in data):
+        raise ValueError("A roster must be a list of email strings")
+    return [email.strip() for email in data if email.strip()]
+
+
+def read_roster_file(path):
+    """Emails listed in a roster file, or None if it does not exist"""
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+    except FileNotFoundError:
+        return None
+    if path.endswith('.json'):
+        return parse_roster(serializer.loads(content))
+    lines = (line.split('#', 1)[0].strip() for line in content.decode('utf-8').splitlines())
+    return [line for line in lines if line]
+
+
+class FileRosterSource:
+    def __init__(self, path):
+        self.path = path
+
+    def stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def load(self):
+        return read_roster_file(self.path)
+
+
+class StorageRosterSource:
+    def __init__(self, storage):
+        self.storage = storage
+
+    def stamp(self):
+        return self.storage.roster_stamp()
+
+    def load(self):
+        data = self.storage.load_roster()
+        return None if data is None else parse_roster(data)
+
+
+class Roster:
+    """The current RosterSnapshot of a source, reloaded when the source changes"""
+
+    def __init__(self, source, reload_interval=5.0):
+        self._source = source
+        self._reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._checked_at = 0.0
+        self._snapshot = RosterSnapshot([])
+        self.reload()
+
+    def current(self):
+        """The roster in effect, after checking the source if it is time to"""
+        if time.monotonic() - self._checked_at >= self._reload_interval:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self._reload_interval:
+                    self._checked_at = time.monotonic()
+                    if self._source.stamp() != self._stamp:
+                        self._load()
+        return self._snapshot
+
+    def reload(self):
+        """Load the source now, whether or not it changed"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            self._load()
+        return self._snapshot
+
+    def replace(self, emails):
+        """Use emails as the roster until the source changes (benchmarks, tests)"""
+        with self._lock:
+            self._stamp = self._source.stamp()
+            self._swap(emails)
+        return self._snapshot
+
+    def _load(self):
+        # Stamp first: a change made while loading is picked up next time
+        stamp = self._source.stamp()
+        try:
+            emails = self._source.load()
+        except (OSError, ValueError):
+            logger.exception("Could not load the roster, keeping the previous one")
+            return
+        self._stamp = stamp
+        if emails is None:
+            logger.warning("No roster found, nobody can vote")
+            emails = []
+        if emails != self._snapshot.emails:
+            self._swap(emails)
+            logger.info("Roster loaded", extra={"voters": len(self._snapshot),
+                                                "version": self._snapshot.version})
+
+    def _swap(self, emails):
+        self._snapshot = RosterSnapshot(emails, self._snapshot.version + 1)
+
+
+def create_roster(config, storage, source=None, seed_file=None):
+    """Roster from the source selected in config, or the given source name.
+
+    A storage roster that does not exist yet is seeded from seed_file
+    (ROSTER_FILE by default), like a fresh SQLite database is seeded from
+    round0.json.
+    """
+    source_name = source or config.ROSTER_SOURCE
+    seed_file = seed_file or config.ROSTER_FILE
+    if source_name == 'file':
+        source = FileRosterSource(seed_file)
+    elif source_name == 'storage':
+        source = StorageRosterSource(storage)
+        with storage.lock('roster'):
+            if storage.load_roster() is None:
+                seed = read_roster_file(seed_file)
+                if seed is not None:
+                    storage.save_roster(seed)
+    else:
+        raise ValueError(f"Unknown roster source: {source_name}")
+    return Roster(source, config.ROSTER_RELOAD_INTERVAL)
+
+
+if __name__ == '__main__':
+    import sys
+
+    from config import Config
+    from storage import create_storage
+
+    if len(sys.argv) != 3 or sys.argv[1] != 'import':
+        print("Usage: python roster.py import <roster file>")
+        sys.exit(1)
+
+    emails = read_roster_file(sys.argv[2])
+    if emails is None:
+        sys.exit(f"{sys.argv[2]} not found")
+    emails = RosterSnapshot(emails).emails
+    roster_storage = create_storage(Config)
+    with roster_storage.lock('roster'):
+        roster_storage.save_roster(emails)
+    print(f"Imported {len(emails)} voters into the {Config.STORAGE_BACKEND} storage")
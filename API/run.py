@@ -1,6 +1,13 @@
 #!/usr/bin/env python3
 """
 Run script for the Voter App API
+
+With --production (or ENV=production) the app is served by gunicorn with
+Config.SERVER_WORKERS worker processes of Config.SERVER_THREADS threads
+each. Otherwise the Flask development server is used.
+
+With --async the ASGI app in asgi.py is served by uvicorn instead (as
+gunicorn's worker class in production), with async submission endpoints.
 """
 import os
 import sys
@@ -8,12 +15,63 @@ import sys
 # Add current directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from main import app
 from config import Config
 
-if __name__ == '__main__':
+
+def run_development_server():
+    from main import app
+
     app.run(
         debug=Config.DEBUG,
         host=Config.HOST,
         port=Config.PORT
-    )
\ No newline at end of file
+    )
+
+
+def run_async_development_server():
+    import uvicorn
+
+    uvicorn.run('asgi:app', host=Config.HOST, port=Config.PORT,
+                log_level=Config.LOG_LEVEL.lower(), reload=Config.DEBUG)
+
+
+def on_worker_exit(server, worker):
+    """Fold the worker's pending score logs into the round files"""
+    import main
+
+    main.sessions.close()
+
+
+def run_production_server(use_async=False):
+    from gunicorn.app.base import BaseApplication
+
+    class VoterApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{Config.HOST}:{Config.PORT}')
+            self.cfg.set('workers', Config.SERVER_WORKERS)
+            self.cfg.set('threads', Config.SERVER_THREADS)
+            self.cfg.set('worker_class',
+                         'uvicorn.workers.UvicornWorker' if use_async else 'gthread')
+            self.cfg.set('timeout', Config.SERVER_TIMEOUT)
+            self.cfg.set('worker_exit', on_worker_exit)
+
+        def load(self):
+            # Imported in each worker after the fork, so every worker starts
+            # its own log listener and background threads
+            if use_async:
+                from asgi import app
+            else:
+                from main import app
+            return app
+
+    VoterApplication().run()
+
+
+if __name__ == '__main__':
+    use_async = '--async' in sys.argv[1:]
+    if '--production' in sys.argv[1:] or Config.ENV == 'production':
+        run_production_server(use_async)
+    elif use_async:
+        run_async_development_server()
+    else:
+        run_development_server()
@@ -0,0 +1,316 @@
+"""
+Score normalization engine for the Voter App API
+
+Builds the users x ideas scores once and computes user totals,
+normalization factors and per-idea normalized sums as NumPy array
+operations. Falls back to the plain Python loops when NumPy is not
+installed; both paths produce identical results.
+
+Floating point addition is not associative, so to stay bit-for-bit
+identical to the sequential loops each user's entries are split into
+"layers" of distinct ideas that are added to the running totals in
+submission order.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised when NumPy is missing
+    np = None
+
+
+@dataclass
+class ScoringResult:
+    final_results: List[dict]
+    user_totals: Dict[str, float]
+    average_total: float
+    user_normalizations: Dict[str, float] = field(default_factory=dict)
+
+
+class _Layers:
+    """Collects (column, value) pairs of one user into duplicate-free layers"""
+
+    def __init__(self, user, layers):
+        self.user = user
+        self.layers = layers
+        self._cols = []
+        self._vals = []
+        self._seen = set()
+
+    def add(self, col, value):
+        if col in self._seen:
+            self.flush()
+        self._cols.append(col)
+        self._vals.append(value)
+        self._seen.add(col)
+
+    def flush(self):
+        if self._cols:
+            self.layers.append((self.user, self._cols, self._vals))
+            self._cols, self._vals, self._seen = [], [], set()
+
+
+def _accumulate(n_ideas, n_users, layers, factors):
+    """Return (final sums, last normalized score per idea x user)"""
+    final = np.zeros(n_ideas)
+    last_raw = np.zeros((n_ideas, n_users))
+    for user, cols, vals in layers:
+        cols = np.asarray(cols, dtype=np.intp)
+        vals = np.asarray(vals, dtype=np.float64)
+        final[cols] += vals * factors[user]
+        last_raw[cols, user] = vals
+    return final, last_raw * factors
+
+
+def _ranking(final):
+    """Indices by descending score, keeping insertion order for ties"""
+    return np.argsort(-final, kind='stable')
+
+
+def combine_final_results(all_final_results):
+    """Normalize and combine every user's submitted finalResults.
+
+    all_final_results maps email -> list of {id, title, description,
+    finalScore}. Each user's scores are scaled by average_total / user_total.
+    """
+    if np is None:
+        return _combine_final_results_python(all_final_results)
+
+    users = list(all_final_results)
+    user_index = {email: u for u, email in enumerate(users)}
+    columns = {}
+    ideas = []
+    raw_scores = []
+    layers = []
+    user_totals = {}
+    total_all_scores = 0
+
+    for u, email in enumerate(users):
+        user_layers = _Layers(u, layers)
+        user_raw_scores = []
+        for result in all_final_results[email]:
+            raw_score = result['finalScore'] or 0
+            user_raw_scores.append(raw_score)
+            col = columns.get(result['id'])
+            if col is None:
+                col = columns[result['id']] = len(ideas)
+                ideas.append(result)
+                raw_scores.append({})
+            raw_scores[col][email] = raw_score
+            user_layers.add(col, raw_score)
+        user_layers.flush()
+        # sum() rather than += so float totals round exactly like the loops
+        user_total = sum(user_raw_scores)
+        user_totals[email] = user_total
+        total_all_scores += user_total
+
+    average_user_total = total_all_scores / len(all_final_results)
+
+    user_normalizations = {}
+    for email, user_total in user_totals.items():
+        if user_total > 0:
+            user_normalizations[email] = average_user_total / user_total
+        else:
+            user_normalizations[email] = 1.0
+
+    factors = np.array([user_normalizations[email] for email in users], dtype=np.float64)
+    final, normalized = _accumulate(len(ideas), len(users), layers, factors)
+    final_scores = final.tolist()
+    normalized_rows = normalized.tolist()
+
+    final_results = []
+    for col in _ranking(final).tolist():
+        idea = ideas[col]
+        row = normalized_rows[col]
+        final_results.append({
+            'id': idea['id'],
+            'title': idea['title'],
+            'description': idea['description'],
+            'final_score': final_scores[col],
+            'user_scores': raw_scores[col],
+            'normalized_user_scores': {email: row[user_index[email]]
+                                       for email in raw_scores[col]}
+        })
+
+    return ScoringResult(final_results, user_totals, average_user_total, user_normalizations)
+
+
+def _iter_round_scores(user_data):
+    """Yield the vote entries of a user_votes payload that carry a numeric score"""
+    rounds_data = user_data.get('rounds')
+    if rounds_data and isinstance(rounds_data, list):
+        for round_data in rounds_data:
+            if isinstance(round_data, dict):
+                ideas_data = round_data.get('ideas')
+                if ideas_data and isinstance(ideas_data, list):
+                    for idea in ideas_data:
+                        if isinstance(idea, dict):
+                            score = idea.get('score', 0)
+                            if isinstance(score, (int, float)):
+                                yield idea.get('id'), score
+
+
+def normalize_round_votes(all_user_votes, original_ideas, roster_size):
+    """Normalize multi-round votes (user_votes payloads) per user.
+
+    Each user's scores are scaled by (sum of all totals / roster_size) /
+    user_total and summed per idea of original_ideas.
+    """
+    if np is None:
+        return _normalize_round_votes_python(all_user_votes, original_ideas, roster_size)
+
+    # Calculate total scores across all tasks by all users
+    total_all_scores = 0
+    user_totals = {}
+    entries = {}
+    for email, user_data in all_user_votes.items():
+        user_entries = list(_iter_round_scores(user_data))
+        user_total = 0
+        for _, score in user_entries:
+            user_total += score
+        entries[email] = user_entries
+        user_totals[email] = user_total
+        total_all_scores += user_total
+    total_all_scores /= roster_size
+
+    user_normalizations = {}
+    for email, user_total in user_totals.items():
+        if total_all_scores > 0:
+            user_normalizations[email] = total_all_scores / user_total
+        else:
+            user_normalizations[email] = 1.0
+
+    columns = {}
+    ideas = []
+    for idea in original_ideas:
+        col = columns.get(idea['id'])
+        if col is None:
+            columns[idea['id']] = len(ideas)
+            ideas.append(idea)
+        else:
+            ideas[col] = idea
+
+    users = list(all_user_votes)
+    user_index = {email: u for u, email in enumerate(users)}
+    touched = [{} for _ in ideas]
+    layers = []
+    for u, email in enumerate(users):
+        user_layers = _Layers(u, layers)
+        for idea_id, score in entries[email]:
+            if idea_id:
+                col = columns.get(idea_id)
+                if col is not None:
+                    touched[col][email] = None
+                    user_layers.add(col, score)
+        user_layers.flush()
+
+    factors = np.array([user_normalizations[email] for email in users], dtype=np.float64)
+    final, normalized = _accumulate(len(ideas), len(users), layers, factors)
+    final_scores = final.tolist()
+    normalized_rows = normalized.tolist()
+
+    final_results = []
+    for col in _ranking(final).tolist():
+        idea = ideas[col]
+        row = normalized_rows[col]
+        final_results.append({
+            'id': idea['id'],
+            'title': idea['title'],
+            'description': idea['description'],
+            'final_score': final_scores[col],
+            'user_scores': {email: row[user_index[email]] for email in touched[col]}
+        })
+
+    return ScoringResult(final_results, user_totals, total_all_scores, user_normalizations)
+
+
+def _combine_final_results_python(all_final_results):
+    user_totals = {}
+    total_all_scores = 0
+
+    for email, user_results in all_final_results.items():
+        user_total = sum(result['finalScore'] or 0 for result in user_results)
+        user_totals[email] = user_total
+        total_all_scores += user_total
+
+    average_user_total = total_all_scores / len(all_final_results)
+
+    user_normalizations = {}
+    for email, user_total in user_totals.items():
+        if user_total > 0:
+            user_normalizations[email] = average_user_total / user_total
+        else:
+            user_normalizations[email] = 1.0
+
+    combined_results = {}
+    for email, user_results in all_final_results.items():
+        normalization = user_normalizations[email]
+
+        for result in user_results:
+            idea_id = result['id']
+            raw_score = result['finalScore'] or 0
+            normalized_score = raw_score * normalization
+
+            if idea_id not in combined_results:
+                combined_results[idea_id] = {
+                    'id': result['id'],
+                    'title': result['title'],
+                    'description': result['description'],
+                    'final_score': 0,
+                    'user_scores': {},
+                    'normalized_user_scores': {}
+                }
+
+            combined_results[idea_id]['user_scores'][email] = raw_score
+            combined_results[idea_id]['normalized_user_scores'][email] = normalized_score
+            combined_results[idea_id]['final_score'] += normalized_score
+
+    final_results_list = list(combined_results.values())
+    final_results_list.sort(key=lambda x: x['final_score'], reverse=True)
+
+    return ScoringResult(final_results_list, user_totals, average_user_total, user_normalizations)
+
+
+def _normalize_round_votes_python(all_user_votes, original_ideas, roster_size):
+    total_all_scores = 0
+    user_totals = {}
+
+    for email, user_data in all_user_votes.items():
+        user_total = 0
+        for _, score in _iter_round_scores(user_data):
+            user_total += score
+        user_totals[email] = user_total
+        total_all_scores += user_total
+    total_all_scores /= roster_size
+
+    user_normalizations = {}
+    for email, user_total in user_totals.items():
+        if total_all_scores > 0:
+            user_normalizations[email] = total_all_scores / user_total
+        else:
+            user_normalizations[email] = 1.0
+
+    final_idea_scores = {}
+    for idea in original_ideas:
+        final_idea_scores[idea['id']] = {
+            'id': idea['id'],
+            'title': idea['title'],
+            'description': idea['description'],
+            'final_score': 0.0,
+            'user_scores': {}
+        }
+
+    for email, user_data in all_user_votes.items():
+        normalization = user_normalizations[email]
+        for idea_id, original_score in _iter_round_scores(user_data):
+            if idea_id:
+                normalized_score = original_score * normalization
+                if idea_id in final_idea_scores:
+                    final_idea_scores[idea_id]['final_score'] += normalized_score
+                    final_idea_scores[idea_id]['user_scores'][email] = normalized_score
+
+    final_results = list(final_idea_scores.values())
+    final_results.sort(key=lambda x: x['final_score'], reverse=True)
+
+    return ScoringResult(final_results, user_totals, total_all_scores, user_normalizations)
@@ -0,0 +1,159 @@
+"""
+JSON serialization for the Voter App API
+
+Every file the storage backends write, every record they store and every
+response body goes through dumps()/loads(). They use orjson when it is
+installed and the standard library otherwise. Both backends write compact
+JSON that the other can read. Indented output is only produced when asked
+for with pretty=True (JSON_PRETTY=true makes the JSON backend's data files
+human-readable while debugging).
+
+    python serializer.py [--ideas 10000] [--voters 100]
+
+compares the backends encoding and decoding a synthetic round.
+"""
+import json
+
+import metrics
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised when orjson is missing
+    orjson = None
+
+
+class _StdlibBackend:
+    name = 'json'
+
+    def dumps(self, obj, pretty=False, sort_keys=False, default=None):
+        if pretty:
+            text = json.dumps(obj, indent=2, sort_keys=sort_keys, default=default,
+                              ensure_ascii=False)
+        else:
+            text = json.dumps(obj, separators=(',', ':'), sort_keys=sort_keys,
+                              default=default, ensure_ascii=False)
+        return text.encode('utf-8', 'surrogatepass')
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class _OrjsonBackend:
+    name = 'orjson'
+
+    def __init__(self, fallback):
+        self._fallback = fallback
+
+    def dumps(self, obj, pretty=False, sort_keys=False, default=None):
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=default, option=option)
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits, which only the standard
+            # library encodes
+            return self._fallback.dumps(obj, pretty, sort_keys, default)
+
+    def loads(self, data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # Files written by older versions may hold NaN/Infinity, which
+            # only the standard library reads; it raises if the JSON is bad
+            return self._fallback.loads(data)
+
+
+JSON_BYTES = metrics.counter(
+    'voter_json_bytes_total',
+    'JSON encoded and decoded (data files, records and response bodies)',
+    ('direction',))
+_ENCODED = JSON_BYTES.labels('encode')
+_DECODED = JSON_BYTES.labels('decode')
+
+_stdlib = _StdlibBackend()
+_backend = _OrjsonBackend(_stdlib) if orjson is not None else _stdlib
+
+
+def use_backend(name):
+    """Select 'orjson', 'json' or 'auto' (orjson when installed)"""
+    global _backend
+    if name == 'auto':
+        _backend = _OrjsonBackend(_stdlib) if orjson is not None else _stdlib
+    elif name == 'orjson':
+        if orjson is None:
+            raise ValueError("JSON backend 'orjson' requested but orjson is not installed")
+        _backend = _OrjsonBackend(_stdlib)
+    elif name == 'json':
+        _backend = _stdlib
+    else:
+        raise ValueError(f"Unknown JSON backend: {name}")
+
+
+def backend_name():
+    return _backend.name
+
+
+def dumps(obj, pretty=False, sort_keys=False, default=None):
+    """Serialize obj to UTF-8 JSON bytes, compact unless pretty"""
+    data = _backend.dumps(obj, pretty, sort_keys, default)
+    _ENCODED.inc(len(data))
+    return data
+
+
+def dumps_text(obj, pretty=False, sort_keys=False, default=None):
+    """dumps() as a str, for text files, SQLite columns and event data"""
+    return dumps(obj, pretty, sort_keys, default).decode('utf-8', 'surrogatepass')
+
+
+def loads(data):
+    """Parse JSON from bytes or str"""
+    # A str is counted in characters
+    _DECODED.inc(len(data))
+    return _backend.loads(data)
+
+
+def _benchmark(ideas, voters, repeat):
+    import time
+
+    round_ideas = [{
+        "id": f"idea-{i:05d}",
+        "title": f"Synthetic idea {i}",
+        "description": f"Benchmark idea number {i} " + "lorem ipsum " * 8,
+        "user_scores": {f"voter{v:04d}@example.com": (i + v) % 3 for v in range(voters)}
+    } for i in range(ideas)]
+
+    def best(fn):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        return min(timings) * 1000
+
+    candidates = [('json indent=2 (old)', _stdlib, True), ('json compact', _stdlib, False)]
+    if orjson is not None:
+        candidates.append(('orjson compact', _OrjsonBackend(_stdlib), False))
+
+    print(f"Round of {ideas} ideas x {voters} voters, best of {repeat}")
+    print(f"{'serializer':<22}{'bytes':>12}{'encode ms':>12}{'decode ms':>12}")
+    for label, backend, pretty in candidates:
+        encoded = backend.dumps(round_ideas, pretty)
+        encode_ms = best(lambda: backend.dumps(round_ideas, pretty))
+        decode_ms = best(lambda: backend.loads(encoded))
+        print(f"{label:<22}{len(encoded):>12}{encode_ms:>12.1f}{decode_ms:>12.1f}")
+    if orjson is None:
+        print("orjson is not installed: pip install orjson to compare it")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare JSON backends on a synthetic round")
+    parser.add_argument('--ideas', type=int, default=10000)
+    parser.add_argument('--voters', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    _benchmark(args.ideas, args.voters, args.repeat)
@@ -0,0 +1,273 @@
+"""
+Voting sessions for the Voter App API
+
+One server hosts many independent voting sessions, e.g. one per team.
+Each session keeps its whole storage in its own directory under
+SESSIONS_DIR: round files or SQLite database, roster, submissions, job
+status, event log and lock files. Sessions therefore share no files,
+locks or cached state, and a directory scan or a round transition in one
+session never waits for another. The 'default' session keeps the
+original layout in the working directory and is served by the unprefixed
+routes; every other session is served under /sessions/<id>/. With the
+'redis' storage backend a session's storage is the keys under its own
+prefix in the store shared by a cluster's nodes instead (see cluster.py).
+
+SessionRegistry opens a session on its first request and keeps at most
+max_loaded of them in memory. The least recently used one beyond that is
+unloaded (its score logs are compacted and its event relay stops); when
+it is requested again its state is reloaded from its storage, as another
+server worker would.
+
+    python sessions.py create <id> [ideas file] [roster file]
+"""
+import errno
+import os
+import re
+import shutil
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+
+import kvstore
+from logging_config import get_logger
+from roster import RosterSnapshot, parse_roster
+from storage import JsonStorage, KeyValueStorage
+
+logger = get_logger('sessions')
+
+DEFAULT_SESSION = 'default'
+# Session ids are used as directory names and URL path segments
+SESSION_ID_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9_-]{0,63}')
+
+
+def valid_session_id(session_id):
+    return isinstance(session_id, str) and SESSION_ID_PATTERN.fullmatch(session_id) is not None
+
+
+def seed_ideas(ideas):
+    """Round 0 of a new session: the given idea dicts without any scores"""
+    if not isinstance(ideas, list) or not ideas:
+        raise ValueError("ideas must be a non-empty list")
+    seeded = []
+    for idea in ideas:
+        if not isinstance(idea, dict) or idea.get('id') is None:
+            raise ValueError("Every idea needs an id")
+        seeded.append({key: value for key, value in idea.items()
+                       if key not in ('score', 'user_scores')})
+    return seeded
+
+
+class DirectorySessions:
+    """Sessions kept in one directory each under a parent directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, session_id):
+        """Directory of a session's storage (None for the default session)"""
+        if session_id == DEFAULT_SESSION:
+            return None
+        return os.path.join(self.directory, session_id)
+
+    def exists(self, session_id):
+        if session_id == DEFAULT_SESSION:
+            return True
+        return valid_session_id(session_id) and os.path.isdir(self.path(session_id))
+
+    def ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            names = []
+        return [DEFAULT_SESSION] + sorted(
+            name for name in names
+            if valid_session_id(name) and os.path.isdir(os.path.join(self.directory, name)))
+
+    def create(self, session_id, ideas, emails):
+        # The directory is written under a temporary name and renamed into
+        # place, so no request can open a half-created session
+        path = self.path(session_id)
+        if os.path.exists(path):
+            raise FileExistsError(f"Session {session_id} already exists")
+
+        os.makedirs(self.directory, exist_ok=True)
+        staging = os.path.join(self.directory, f'.{session_id}.{uuid.uuid4().hex[:8]}.tmp')
+        os.mkdir(staging)
+        try:
+            # Seed files in the JSON layout; a SQLite session imports them
+            # into its database when it is first opened
+            seed = JsonStorage(staging)
+            seed.save_round(0, ideas)
+            seed.save_roster(emails)
+            os.rename(staging, path)
+        except OSError as e:
+            shutil.rmtree(staging, ignore_errors=True)
+            if e.errno in (errno.EEXIST, errno.ENOTEMPTY):
+                raise FileExistsError(f"Session {session_id} already exists") from e
+            raise
+
+
+class SharedSessions:
+    """Sessions kept in a key-value store shared by the nodes of a cluster.
+
+    Each session's storage is a KeyValueStorage under prefix + its id; the
+    set of ids is the key prefix + 'sessions'.
+    """
+
+    def __init__(self, client, prefix='voter:', lock_ttl=10):
+        self.client = client
+        self.prefix = prefix
+        self.lock_ttl = lock_ttl
+
+    def storage(self, session_id):
+        return KeyValueStorage(self.client, f'{self.prefix}{session_id}:', self.lock_ttl)
+
+    def path(self, session_id):
+        return None
+
+    def exists(self, session_id):
+        if session_id == DEFAULT_SESSION:
+            return True
+        return (valid_session_id(session_id) and
+                bool(self.client.sismember(f'{self.prefix}sessions', session_id)))
+
+    def ids(self):
+        return [DEFAULT_SESSION] + sorted(
+            session_id.decode() for session_id in self.client.smembers(f'{self.prefix}sessions'))
+
+    def create(self, session_id, ideas, emails):
+        # The id is claimed first and only listed once the session is
+        # seeded, so no node can open a half-created session
+        if not self.client.set(f'{self.prefix}{session_id}:created', 1, nx=True):
+            raise FileExistsError(f"Session {session_id} already exists")
+        seed = self.storage(session_id)
+        seed.save_round(0, ideas)
+        seed.save_roster(emails)
+        self.client.sadd(f'{self.prefix}sessions', session_id)
+
+
+def create_catalog(config):
+    """The session catalog of the configured storage backend"""
+    if config.STORAGE_BACKEND == 'redis':
+        return SharedSessions(kvstore.connect(config.REDIS_URL), config.REDIS_PREFIX,
+                              config.REDIS_LOCK_TTL)
+    return DirectorySessions(config.SESSIONS_DIR)
+
+
+class SessionRegistry:
+    """The loaded voting sessions, by id.
+
+    catalog (DirectorySessions or SharedSessions) is where sessions are
+    created and listed. open_session(session_id, directory) builds a
+    session; directory is the catalog's path of the session, None for the
+    default session and for sessions in a key-value store.
+    """
+
+    def __init__(self, catalog, open_session, max_loaded):
+        self.catalog = catalog
+        self._open_session = open_session
+        self._max_loaded = max_loaded
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, session_id):
+        return self.catalog.path(session_id)
+
+    def exists(self, session_id):
+        return self.catalog.exists(session_id)
+
+    def get(self, session_id):
+        """The session, loading it on first use; None if it does not exist"""
+        with self._lock:
+            session = self._loaded.get(session_id)
+            if session is not None:
+                self._loaded.move_to_end(session_id)
+                return session
+        if not self.exists(session_id):
+            return None
+
+        # Loaded outside the registry lock, so opening one session does not
+        # hold up the requests of the others. Of two concurrent loads the
+        # first one registered wins; the other instance has started nothing
+        # yet and is dropped.
+        session = self._open_session(session_id, self.path(session_id))
+        with self._lock:
+            session = self._loaded.setdefault(session_id, session)
+            self._loaded.move_to_end(session_id)
+            evicted = self._evict()
+        for unloaded in evicted:
+            self._unload(unloaded)
+        return session
+
+    def _evict(self):
+        evicted = []
+        for session_id in list(self._loaded):
+            if len(self._loaded) <= self._max_loaded:
+                break
+            if session_id != DEFAULT_SESSION:
+                evicted.append(self._loaded.pop(session_id))
+        return evicted
+
+    @staticmethod
+    def _unload(session):
+        try:
+            session.close()
+        except Exception:
+            logger.exception("Error unloading session", extra={"session": session.id})
+        else:
+            logger.info("Session unloaded", extra={"session": session.id})
+
+    def loaded(self):
+        with self._lock:
+            return list(self._loaded.values())
+
+    def ids(self):
+        """Ids of every session, loaded or not"""
+        return self.catalog.ids()
+
+    def create(self, session_id, ideas, emails):
+        """Create a session from its round 0 ideas and its roster.
+
+        Raises ValueError for an invalid id or data and FileExistsError if
+        the session already exists.
+        """
+        if not valid_session_id(session_id) or session_id == DEFAULT_SESSION:
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        ideas = seed_ideas(ideas)
+        emails = RosterSnapshot(parse_roster(emails)).emails
+        self.catalog.create(session_id, ideas, emails)
+        logger.info("Session created", extra={"session": session_id, "ideas": len(ideas),
+                                              "voters": len(emails)})
+
+    def close(self):
+        """Unload every session (compacting their score logs), at exit"""
+        with self._lock:
+            sessions, self._loaded = list(self._loaded.values()), OrderedDict()
+        for session in sessions:
+            self._unload(session)
+
+
+if __name__ == '__main__':
+    from config import Config
+    from roster import read_roster_file
+    import serializer
+
+    if len(sys.argv) not in (3, 4, 5) or sys.argv[1] != 'create':
+        print("Usage: python sessions.py create <id> [ideas file] [roster file]")
+        sys.exit(1)
+
+    ideas_file = sys.argv[3] if len(sys.argv) > 3 else 'round0.json'
+    roster_file = sys.argv[4] if len(sys.argv) > 4 else Config.ROSTER_FILE
+    with open(ideas_file, 'rb') as f:
+        ideas = serializer.loads(f.read())
+    emails = read_roster_file(roster_file)
+    if emails is None:
+        sys.exit(f"{roster_file} not found")
+
+    registry = SessionRegistry(create_catalog(Config), None, 0)
+    try:
+        registry.create(sys.argv[2], ideas, emails)
+    except (ValueError, FileExistsError) as e:
+        sys.exit(str(e))
+    print(f"Created session {sys.argv[2]} in {registry.path(sys.argv[2]) or Config.REDIS_URL}")
@@ -0,0 +1,1668 @@
+"""
+Storage backends for the Voter App API
+
+JsonStorage keeps the original file layout in the working directory
+(roundX.json, user_votes_*.json, user_final_results_*.json, ...).
+SQLiteStorage keeps the same state in a single SQLite database with
+indexed tables, so status checks become queries instead of file probes.
+KeyValueStorage keeps it in a Redis-protocol store (see kvstore.py) that
+the server nodes of a cluster share.
+
+Several server workers may share one storage. Writes that must not
+interleave are done under lock(name), which also excludes other processes,
+and round_stamp()/current_round_stamp() let workers notice each other's
+changes so cached state can be refreshed.
+
+Run `python storage.py migrate` to import existing JSON files into SQLite.
+"""
+import functools
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+import kvstore
+import metrics
+import serializer
+from logging_config import get_logger
+
+logger = get_logger('storage')
+
+STORAGE_SECONDS = metrics.histogram(
+    'voter_storage_operation_seconds',
+    'Time spent reading and writing rounds, submissions and results',
+    ('backend', 'operation'))
+
+JOB_HISTORY = 100
+EVENT_HISTORY = 1000
+
+
+def scan_round_files(directory='.'):
+    """Find the highest roundX.json file in a directory"""
+    round_files = [f for f in os.listdir(
+        directory) if f.startswith('round') and f.endswith('.json')]
+    if not round_files:
+        return 0
+
+    round_numbers = []
+    for f in round_files:
+        try:
+            round_num = int(f.replace('round', '').replace('.json', ''))
+            round_numbers.append(round_num)
+        except ValueError:
+            continue
+
+    return max(round_numbers) if round_numbers else 0
+
+
+def normalize_email(email):
+    """Key under which per-user submissions are stored, in every backend"""
+    return email.strip().lower()
+
+
+def user_file_suffix(email):
+    return normalize_email(email).replace("@", "_").replace(".", "_")
+
+
+class ProcessLock:
+    """Re-entrant lock that serializes threads and, through flock(), processes.
+
+    Without fcntl (e.g. on Windows) it only serializes the threads of the
+    current process.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                self._file = open(self.path, 'a')
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+
+class GroupCommit:
+    """Shares fsync() calls between concurrent writers.
+
+    A writer add()s the file it wrote and then wait()s for the batch it
+    joined. The first waiter becomes the leader: it sleeps for the group
+    interval so that concurrent writers can join, fsyncs every file of the
+    batch once and wakes the batch's waiters. Writers that arrive while the
+    leader is syncing form the next batch. N concurrent appends to the same
+    journal therefore cost one fsync instead of N.
+    """
+
+    # Failed batches remembered for their waiters
+    ERROR_HISTORY = 16
+
+    def __init__(self, interval):
+        self._interval = interval
+        self._condition = threading.Condition()
+        self._pending = {}
+        self._batch = 1
+        self._synced = 0
+        self._leader = False
+        self._errors = {}
+        self.commits = 0
+        self.syncs = 0
+
+    def add(self, path):
+        """Schedule path for the next fsync; returns the batch to wait() for"""
+        with self._condition:
+            self._pending[path] = None
+            self.commits += 1
+            return self._batch
+
+    def wait(self, batch):
+        """Block until batch has been fsynced; raises OSError if that failed"""
+        with self._condition:
+            while self._synced < batch:
+                if not self._leader:
+                    self._leader = True
+                    break
+                self._condition.wait()
+            else:
+                return self._check(batch)
+
+        error = None
+        paths, syncing = [], self._synced
+        try:
+            time.sleep(self._interval)
+            with self._condition:
+                paths, self._pending = list(self._pending), {}
+                syncing = self._batch
+                self._batch += 1
+            for path in paths:
+                try:
+                    _fsync_path(path)
+                except FileNotFoundError:
+                    # Replaced or compacted away since it was written
+                    pass
+                except OSError as exc:
+                    error = exc
+        finally:
+            with self._condition:
+                self._synced = syncing
+                self.syncs += len(paths)
+                if error is not None:
+                    self._errors[syncing] = error
+                    while len(self._errors) > self.ERROR_HISTORY:
+                        del self._errors[next(iter(self._errors))]
+                self._leader = False
+                self._condition.notify_all()
+        with self._condition:
+            return self._check(batch)
+
+    def _check(self, batch):
+        error = self._errors.get(batch)
+        if error is not None:
+            raise error
+
+    def sync(self, path):
+        self.wait(self.add(path))
+
+
+def _timed(operation):
+    """Record a storage method's duration in STORAGE_SECONDS"""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                STORAGE_SECONDS.labels(self.name, operation).observe(
+                    time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def _fsync_path(path):
+    if os.path.isdir(path) and os.name == 'nt':
+        # Directories cannot be opened (or fsynced) on Windows
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _remove_if_exists(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _compact_round(scores):
+    return serializer.dumps_text(scores)
+
+
+def _expand_round(scores):
+    return {"ideas": [{"id": idea_id, "score": score} for idea_id, score in scores]}
+
+
+def _read_votes_stream(path):
+    """Rebuild a user_votes payload from a streamed NDJSON file"""
+    with open(path, 'r') as f:
+        data = serializer.loads(f.readline())
+        data['rounds'] = [_expand_round(serializer.loads(line)) for line in f if line.strip()]
+    return data
+
+
+def _summarize_votes(submitted_votes):
+    """vote_summary() of a list of vote submissions"""
+    idea_scores = {}
+    score_distributions = {0: 0, 1: 0, 2: 0}
+
+    for vote in submitted_votes:
+        for idea in vote['ideas']:
+            idea_id = idea['id']
+            score = idea.get('score', 0)
+
+            if idea_id not in idea_scores:
+                idea_scores[idea_id] = []
+            idea_scores[idea_id].append(score)
+
+            score_distributions[score] += 1
+
+    average_scores = {}
+    for idea_id, scores in idea_scores.items():
+        average_scores[idea_id] = sum(scores) / len(scores)
+
+    return len(submitted_votes), average_scores, score_distributions, submitted_votes[-5:]
+
+
+class _JsonVotesWriter:
+    """Streams rounds to a private NDJSON temp file, renamed into place on commit"""
+
+    def __init__(self, legacy_path, path, header, committer=None):
+        self._legacy_path = legacy_path
+        self._path = path
+        self._committer = committer
+        self._tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        self._file = open(self._tmp_path, 'w')
+        self._file.write(serializer.dumps_text(header) + "\n")
+
+    def add_round(self, scores):
+        self._file.write(_compact_round(scores) + "\n")
+
+    def commit(self):
+        if self._committer is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp_path, self._path)
+        _remove_if_exists(self._legacy_path)
+        if self._committer is not None:
+            self._committer.sync(os.path.dirname(self._path) or '.')
+
+    def abort(self):
+        self._file.close()
+        _remove_if_exists(self._tmp_path)
+
+
+# Lock file path -> ProcessLock. flock() does not exclude other descriptors
+# of the same process, so every storage opened on the same files in this
+# process (e.g. a session reopened after eviction) must share its locks.
+_process_locks = {}
+_process_locks_guard = threading.Lock()
+
+
+def process_lock(path):
+    """The ProcessLock of a lock file, one per file in each process"""
+    path = os.path.abspath(path)
+    with _process_locks_guard:
+        lock = _process_locks.get(path)
+        if lock is None:
+            lock = _process_locks[path] = ProcessLock(path)
+        return lock
+
+
+class Storage:
+    """Interface for persisted voting state.
+
+    Rounds are lists of idea dicts where each idea may carry a
+    'user_scores' mapping of email -> score.
+    """
+
+    # Cross-process coordination
+    def lock(self, name):
+        """Lock shared by every thread and worker process using this storage"""
+        return process_lock(self._lock_path(name))
+
+    def _lock_path(self, name):
+        raise NotImplementedError
+
+    def round_stamp(self, round_num):
+        """Token that changes whenever the persisted state of a round changes"""
+        return None
+
+    def current_round_stamp(self):
+        """Token that changes whenever the current round pointer changes"""
+        return None
+
+    # Rounds
+    def load_current_round(self):
+        raise NotImplementedError
+
+    def save_current_round(self, round_num):
+        raise NotImplementedError
+
+    def load_round(self, round_num):
+        """Return the ideas of a round, or None if it does not exist"""
+        raise NotImplementedError
+
+    def save_round(self, round_num, ideas):
+        raise NotImplementedError
+
+    def start_round(self, round_num, ideas, expected_round):
+        """Write the first snapshot of round_num and move the pointer to it.
+
+        A compare-and-swap on the round pointer: nothing is written unless
+        the pointer still is expected_round. Returns whether the round was
+        started. Backends with atomic writes override this lock-based one.
+        """
+        with self.lock('rounds'):
+            if self.load_current_round() != expected_round:
+                return False
+            self.save_round(round_num, ideas)
+            self.save_current_round(round_num)
+            return True
+
+    def append_scores(self, round_num, email, scores):
+        """Persist one voter's [idea_id, score] pairs for a round.
+
+        Returns a token for wait_durable(). It is meant to be called under
+        the 'rounds' lock and wait_durable() after releasing it, so that
+        concurrent voters share one fsync.
+        """
+        raise NotImplementedError
+
+    def wait_durable(self, token):
+        """Block until the append behind token is on disk"""
+
+    def score_log_mark(self, round_num):
+        """Position of the round's pending score log (0 when there is none)"""
+        return 0
+
+    def compact_round(self, round_num, ideas, mark):
+        """Fold the score log up to mark into the round snapshot"""
+
+    # Roster of eligible voters (see roster.py)
+    def roster_stamp(self):
+        """Token that changes whenever the stored roster changes"""
+        return None
+
+    def load_roster(self):
+        """Return the stored roster (a list of emails), or None if there is none"""
+        raise NotImplementedError
+
+    def save_roster(self, emails):
+        raise NotImplementedError
+
+    # Per-user submissions. They are keyed by normalize_email(), so lookups
+    # are case-insensitive and return the spellings the caller passed in.
+    def save_user_votes(self, email, data):
+        raise NotImplementedError
+
+    def load_user_votes(self, emails):
+        """Return {email: vote data} for the given emails that have voted"""
+        raise NotImplementedError
+
+    def users_with_votes(self, emails):
+        raise NotImplementedError
+
+    def open_user_votes(self, email, submitted_at):
+        """Start a streamed user_votes submission that replaces the user's votes.
+
+        Returns a writer with add_round(scores), taking one round as
+        [[idea_id, score], ...], plus commit() and abort(). Nothing is
+        visible to load_user_votes() until commit(); load_user_votes()
+        returns the usual {"email", "rounds": [{"ideas": [...]}]} payload.
+        """
+        raise NotImplementedError
+
+    def save_user_final_results(self, email, data):
+        raise NotImplementedError
+
+    def load_user_final_results(self, emails):
+        """Return {email: finalResults} for the given emails that submitted"""
+        raise NotImplementedError
+
+    def users_with_final_results(self, emails):
+        raise NotImplementedError
+
+    def has_final_results(self, email):
+        return bool(self.users_with_final_results([email]))
+
+    def delete_user_final_results(self, emails):
+        """Forget the final results submitted by the given emails"""
+        raise NotImplementedError
+
+    # Aggregated results
+    def save_final_results(self, results):
+        raise NotImplementedError
+
+    def load_final_results(self):
+        """Return the final results list, or None if not computed yet"""
+        raise NotImplementedError
+
+    # Single-round vote submissions (GET /results)
+    def record_vote(self, vote):
+        """Store a vote submission and return its id"""
+        raise NotImplementedError
+
+    def vote_users(self, round_num):
+        """Emails that submitted a vote in the given round"""
+        raise NotImplementedError
+
+    def vote_summary(self):
+        """Return (total_votes, average_scores, score_distributions, recent_votes)"""
+        raise NotImplementedError
+
+    # Background jobs
+    def save_job(self, job):
+        """Persist a job status dict (see jobs.Job.to_dict)"""
+        raise NotImplementedError
+
+    def load_job(self, job_id):
+        """Return a job status dict, or None if unknown"""
+        raise NotImplementedError
+
+    def latest_job(self, name):
+        """Return the status dict of the most recent job with this name"""
+        raise NotImplementedError
+
+    # Event log (GET /events)
+    def append_event(self, event):
+        """Append an event dict to the log shared by all workers; return its id"""
+        raise NotImplementedError
+
+    def read_events(self, after_id):
+        """Return [(id, event)] for the events appended after after_id, oldest first"""
+        raise NotImplementedError
+
+    def last_event_id(self):
+        """Id of the newest event, 0 if there is none"""
+        raise NotImplementedError
+
+
+class JsonStorage(Storage):
+    """File-per-object storage in a directory (the original layout)"""
+
+    name = 'json'
+
+    def __init__(self, directory='.', manifest_file='manifest.json', pretty=False,
+                 committer=None):
+        self.directory = directory
+        self.manifest_file = manifest_file
+        # Indent the JSON files, for reading them while debugging
+        self.pretty = pretty
+        # GroupCommit making writes durable, or None to leave it to the OS
+        self.committer = committer
+        self._votes_lock = threading.Lock()
+        self._submitted_votes = []
+        self._votes_offset = 0
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _lock_path(self, name):
+        return self._path(f'.{name}.lock')
+
+    def _round_file(self, round_num):
+        return self._path(f'round{round_num}.json')
+
+    def _log_file(self, round_num):
+        return self._path(f'round{round_num}_scores.log')
+
+    def _user_votes_file(self, email):
+        return self._path(f'user_votes_{user_file_suffix(email)}.json')
+
+    def _user_votes_stream_file(self, email):
+        return self._path(f'user_votes_{user_file_suffix(email)}.ndjson')
+
+    def _user_final_file(self, email):
+        return self._path(f'user_final_results_{user_file_suffix(email)}.json')
+
+    def _roster_file(self):
+        return self._path('roster.json')
+
+    def _write_json(self, path, data, durable=True):
+        # Write to a private temp file and rename, so readers in other
+        # workers never see a partially written file. When durable, the
+        # data is fsynced before the rename (so a crash cannot leave an
+        # empty file behind the new name) and the directory after it;
+        # concurrent renames share the directory fsync.
+        tmp_file = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        durable = durable and self.committer is not None
+        with open(tmp_file, 'wb') as f:
+            f.write(serializer.dumps(data, pretty=self.pretty))
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+        if durable:
+            self.committer.sync(self.directory)
+
+    def _file_stamp(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def round_stamp(self, round_num):
+        return (self._file_stamp(self._round_file(round_num)),
+                self._file_stamp(self._log_file(round_num)))
+
+    def current_round_stamp(self):
+        return self._file_stamp(self._path(self.manifest_file))
+
+    def read_current_round(self):
+        """Current round from the manifest, or None; never writes"""
+        try:
+            with open(self._path(self.manifest_file), 'rb') as f:
+                return int(serializer.loads(f.read())['current_round'])
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError, ValueError):
+            return None
+
+    def load_current_round(self):
+        current_round = self.read_current_round()
+        if current_round is None:
+            current_round = scan_round_files(self.directory)
+            logger.info("Bootstrapping round manifest",
+                        extra={"manifest": self.manifest_file, "round": current_round})
+            self.save_current_round(current_round)
+        return current_round
+
+    def save_current_round(self, round_num):
+        self._write_json(self._path(self.manifest_file), {
+            "current_round": round_num,
+            "updated_at": datetime.utcnow().isoformat() + "Z"
+        })
+
+    @_timed('load_round')
+    def load_round(self, round_num):
+        try:
+            with open(self._round_file(round_num), 'rb') as f:
+                ideas = serializer.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError:
+            # Snapshots are replaced atomically, so this is outside damage
+            logger.error("Round snapshot is corrupt", extra={
+                "round": round_num, "file": self._round_file(round_num)})
+            return None
+
+        index = {idea.get('id'): idea for idea in ideas}
+        try:
+            with open(self._log_file(round_num), 'r') as f:
+                for line in f:
+                    try:
+                        entry = serializer.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from a crash mid-append
+                        continue
+                    for idea_id, score in entry['scores']:
+                        idea = index.get(idea_id)
+                        if idea is not None:
+                            idea.setdefault('user_scores', {})[entry['email']] = score
+        except FileNotFoundError:
+            pass
+        return ideas
+
+    @_timed('save_round')
+    def save_round(self, round_num, ideas):
+        with self.lock('rounds'):
+            self._write_json(self._round_file(round_num), ideas)
+            try:
+                os.remove(self._log_file(round_num))
+            except FileNotFoundError:
+                pass
+
+    @_timed('append_scores')
+    def append_scores(self, round_num, email, scores):
+        # The round's score log is its write-ahead journal: load_round()
+        # replays it over the last snapshot
+        entry = serializer.dumps({"email": email, "scores": scores}) + b"\n"
+        with self.lock('rounds'):
+            with open(self._log_file(round_num), 'a+b') as f:
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        # Seal a line torn by a crash mid-append, so it
+                        # does not swallow this entry
+                        entry = b"\n" + entry
+                f.write(entry)
+        if self.committer is not None:
+            return self.committer.add(self._log_file(round_num))
+        return None
+
+    def wait_durable(self, token):
+        if token is not None:
+            self.committer.wait(token)
+
+    def score_log_mark(self, round_num):
+        try:
+            return os.path.getsize(self._log_file(round_num))
+        except FileNotFoundError:
+            return 0
+
+    @_timed('compact_round')
+    def compact_round(self, round_num, ideas, mark):
+        with self.lock('rounds'):
+            self._write_json(self._round_file(round_num), ideas)
+
+            # Votes appended after the snapshot was taken stay in the log;
+            # replaying them is idempotent.
+            if self.score_log_mark(round_num) == mark:
+                try:
+                    os.remove(self._log_file(round_num))
+                except FileNotFoundError:
+                    pass
+
+    @_timed('save_user_votes')
+    def save_user_votes(self, email, data):
+        self._write_json(self._user_votes_file(email), data)
+        _remove_if_exists(self._user_votes_stream_file(email))
+
+    @_timed('load_user_votes')
+    def load_user_votes(self, emails):
+        all_user_votes = {}
+        for email in emails:
+            user_file = self._user_votes_file(email)
+            stream_file = self._user_votes_stream_file(email)
+            if os.path.exists(user_file):
+                with open(user_file, 'rb') as f:
+                    all_user_votes[email] = serializer.loads(f.read())
+            elif os.path.exists(stream_file):
+                all_user_votes[email] = _read_votes_stream(stream_file)
+        return all_user_votes
+
+    def users_with_votes(self, emails):
+        return {email for email in emails
+                if os.path.exists(self._user_votes_file(email))
+                or os.path.exists(self._user_votes_stream_file(email))}
+
+    def open_user_votes(self, email, submitted_at):
+        return _JsonVotesWriter(self._user_votes_file(email),
+                                self._user_votes_stream_file(email),
+                                {"email": email, "submitted_at": submitted_at},
+                                self.committer)
+
+    @_timed('save_user_final_results')
+    def save_user_final_results(self, email, data):
+        self._write_json(self._user_final_file(email), data)
+
+    @_timed('load_user_final_results')
+    def load_user_final_results(self, emails):
+        all_final_results = {}
+        for email in emails:
+            user_file = self._user_final_file(email)
+            if os.path.exists(user_file):
+                with open(user_file, 'rb') as f:
+                    all_final_results[email] = serializer.loads(f.read())['finalResults']
+        return all_final_results
+
+    def users_with_final_results(self, emails):
+        return {email for email in emails
+                if os.path.exists(self._user_final_file(email))}
+
+    def delete_user_final_results(self, emails):
+        for email in emails:
+            try:
+                os.remove(self._user_final_file(email))
+            except FileNotFoundError:
+                pass
+
+    def roster_stamp(self):
+        return self._file_stamp(self._roster_file())
+
+    def load_roster(self):
+        try:
+            with open(self._roster_file(), 'rb') as f:
+                return serializer.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def save_roster(self, emails):
+        self._write_json(self._roster_file(), list(emails))
+
+    @_timed('save_final_results')
+    def save_final_results(self, results):
+        self._write_json(self._path('final_results.json'), results)
+
+    @_timed('load_final_results')
+    def load_final_results(self):
+        try:
+            with open(self._path('final_results.json'), 'rb') as f:
+                return serializer.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def _sync_votes(self):
+        """Pick up votes appended to votes.log (by any worker) since the last sync.
+
+        Must be called with _votes_lock held. Only complete lines are read, so
+        a concurrent append is picked up by a later sync.
+        """
+        try:
+            with open(self._path('votes.log'), 'rb') as f:
+                f.seek(self._votes_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if line:
+                self._submitted_votes.append(serializer.loads(line))
+        self._votes_offset += end
+
+    def record_vote(self, vote):
+        with self.lock('votes'), self._votes_lock:
+            self._sync_votes()
+            vote['id'] = len(self._submitted_votes) + 1
+            with open(self._path('votes.log'), 'a') as f:
+                f.write(serializer.dumps_text(vote) + "\n")
+            self._sync_votes()
+            return vote['id']
+
+    def vote_users(self, round_num):
+        with self._votes_lock:
+            self._sync_votes()
+            return {vote.get('user_email', '') for vote in self._submitted_votes
+                    if vote.get('round', 0) == round_num}
+
+    def vote_summary(self):
+        with self._votes_lock:
+            self._sync_votes()
+            submitted_votes = list(self._submitted_votes)
+        return _summarize_votes(submitted_votes)
+
+    def _load_jobs(self):
+        try:
+            with open(self._path('jobs.json'), 'rb') as f:
+                return serializer.loads(f.read())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save_job(self, job):
+        with self.lock('jobs'):
+            jobs = self._load_jobs()
+            jobs[job['id']] = job
+            if len(jobs) > JOB_HISTORY:
+                newest = sorted(jobs.values(), key=lambda j: j['created_at'])[-JOB_HISTORY:]
+                jobs = {j['id']: j for j in newest}
+            # Job records are progress reports; they need not survive a crash
+            self._write_json(self._path('jobs.json'), jobs, durable=False)
+
+    def load_job(self, job_id):
+        return self._load_jobs().get(job_id)
+
+    def latest_job(self, name):
+        jobs = [job for job in self._load_jobs().values() if job['name'] == name]
+        return max(jobs, key=lambda j: j['created_at']) if jobs else None
+
+    # Events are NDJSON lines in events.log; an event's id is the byte offset
+    # just past its line
+    def append_event(self, event):
+        with self.lock('events'):
+            with open(self._path('events.log'), 'ab') as f:
+                f.write(serializer.dumps(event) + b"\n")
+                return f.tell()
+
+    def read_events(self, after_id):
+        try:
+            with open(self._path('events.log'), 'rb') as f:
+                f.seek(after_id)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        events = []
+        offset = after_id
+        # Only complete lines; a concurrent append is read next time
+        for line in data[:data.rfind(b'\n') + 1].splitlines(keepends=True):
+            offset += len(line)
+            events.append((offset, serializer.loads(line)))
+        return events
+
+    def last_event_id(self):
+        try:
+            return os.path.getsize(self._path('events.log'))
+        except FileNotFoundError:
+            return 0
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rounds (
+    round_num INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ideas (
+    round_num INTEGER NOT NULL,
+    idea_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (round_num, idea_id)
+);
+CREATE TABLE IF NOT EXISTS scores (
+    round_num INTEGER NOT NULL,
+    idea_id INTEGER NOT NULL,
+    user_email TEXT NOT NULL,
+    score INTEGER,
+    PRIMARY KEY (round_num, idea_id, user_email)
+);
+CREATE INDEX IF NOT EXISTS idx_scores_round_user ON scores (round_num, user_email);
+CREATE INDEX IF NOT EXISTS idx_scores_idea_user ON scores (idea_id, user_email);
+CREATE TABLE IF NOT EXISTS user_votes (
+    user_email TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    submitted_at TEXT
+);
+CREATE TABLE IF NOT EXISTS user_final_results (
+    user_email TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    submitted_at TEXT
+);
+CREATE TABLE IF NOT EXISTS final_results (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    data TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS votes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    round_num INTEGER,
+    user_email TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_votes_round_user ON votes (round_num, user_email);
+CREATE TABLE IF NOT EXISTS vote_scores (
+    vote_id INTEGER NOT NULL,
+    idea_id INTEGER NOT NULL,
+    score INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_vote_scores_idea ON vote_scores (idea_id);
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_name_created ON jobs (name, created_at);
+CREATE TABLE IF NOT EXISTS user_vote_rounds (
+    user_email TEXT NOT NULL,
+    upload TEXT,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_user_vote_rounds ON user_vote_rounds (user_email, upload, position);
+CREATE INDEX IF NOT EXISTS idx_user_vote_rounds_upload ON user_vote_rounds (upload);
+CREATE TABLE IF NOT EXISTS roster (
+    position INTEGER PRIMARY KEY,
+    email TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    data TEXT NOT NULL
+);
+"""
+
+
+class _SQLiteVotesWriter:
+    """Inserts rounds under a private upload id, published in one transaction on commit"""
+
+    def __init__(self, storage, email, submitted_at):
+        self._storage = storage
+        self._email = email
+        self._header = {"email": email, "submitted_at": submitted_at}
+        self._upload = uuid.uuid4().hex
+        self._position = 0
+
+    def add_round(self, scores):
+        # Each round is its own short transaction, so a slow upload does not
+        # hold the database's write lock
+        with self._storage._connect() as conn:
+            conn.execute(
+                "INSERT INTO user_vote_rounds (user_email, upload, position, data) "
+                "VALUES (?, ?, ?, ?)",
+                (normalize_email(self._email), self._upload, self._position,
+                 _compact_round(scores)))
+        self._position += 1
+
+    def commit(self):
+        email = normalize_email(self._email)
+        with self._storage._connect() as conn:
+            conn.execute("DELETE FROM user_vote_rounds WHERE user_email = ? AND upload IS NULL",
+                         (email,))
+            conn.execute("UPDATE user_vote_rounds SET upload = NULL WHERE upload = ?",
+                         (self._upload,))
+            self._storage._insert_user_row(conn, 'user_votes', self._email, self._header)
+
+    def abort(self):
+        with self._storage._connect() as conn:
+            conn.execute("DELETE FROM user_vote_rounds WHERE upload = ?", (self._upload,))
+
+
+class SQLiteStorage(Storage):
+    """SQLite storage in WAL mode with one connection per worker thread"""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _lock_path(self, name):
+        return f'{self.path}.{name}.lock'
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        # Connections must not cross a fork, so they are also keyed by pid
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _now():
+        return datetime.utcnow().isoformat() + "Z"
+
+    @staticmethod
+    def _bump_stamp(conn, key):
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+            (key,))
+
+    @classmethod
+    def _bump_round_stamp(cls, conn, round_num):
+        cls._bump_stamp(conn, f'round_stamp:{round_num}')
+
+    def round_stamp(self, round_num):
+        row = self._connect().execute(
+            "SELECT value FROM meta WHERE key = ?", (f'round_stamp:{round_num}',)).fetchone()
+        return row[0] if row else None
+
+    def current_round_stamp(self):
+        return self.load_current_round()
+
+    def load_current_round(self):
+        row = self._connect().execute(
+            "SELECT value FROM meta WHERE key = 'current_round'").fetchone()
+        return int(row[0]) if row else 0
+
+    def save_current_round(self, round_num):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('current_round', ?)",
+                (str(round_num),))
+
+    @_timed('load_round')
+    def load_round(self, round_num):
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM rounds WHERE round_num = ?",
+                        (round_num,)).fetchone() is None:
+            return None
+
+        ideas = []
+        index = {}
+        for idea_id, data in conn.execute(
+                "SELECT idea_id, data FROM ideas WHERE round_num = ? ORDER BY position",
+                (round_num,)):
+            idea = serializer.loads(data)
+            ideas.append(idea)
+            index[idea_id] = idea
+
+        for idea_id, email, score in conn.execute(
+                "SELECT idea_id, user_email, score FROM scores WHERE round_num = ? ORDER BY rowid",
+                (round_num,)):
+            idea = index.get(idea_id)
+            if idea is not None:
+                idea.setdefault('user_scores', {})[email] = score
+        return ideas
+
+    def _write_round(self, conn, round_num, ideas):
+        conn.execute("DELETE FROM ideas WHERE round_num = ?", (round_num,))
+        conn.execute("DELETE FROM scores WHERE round_num = ?", (round_num,))
+        conn.execute("INSERT OR REPLACE INTO rounds (round_num, created_at) VALUES (?, ?)",
+                     (round_num, self._now()))
+        idea_rows = []
+        score_rows = []
+        for position, idea in enumerate(ideas):
+            data = {k: v for k, v in idea.items() if k != 'user_scores'}
+            idea_rows.append((round_num, idea['id'], position, serializer.dumps_text(data)))
+            for email, score in idea.get('user_scores', {}).items():
+                score_rows.append((round_num, idea['id'], email, score))
+        conn.executemany(
+            "INSERT INTO ideas (round_num, idea_id, position, data) VALUES (?, ?, ?, ?)",
+            idea_rows)
+        conn.executemany(
+            "INSERT INTO scores (round_num, idea_id, user_email, score) VALUES (?, ?, ?, ?)",
+            score_rows)
+        self._bump_round_stamp(conn, round_num)
+
+    @_timed('save_round')
+    def save_round(self, round_num, ideas):
+        with self._connect() as conn:
+            self._write_round(conn, round_num, ideas)
+
+    @_timed('start_round')
+    def start_round(self, round_num, ideas, expected_round):
+        with self._connect() as conn:
+            # The conditional update takes the database's write lock, so the
+            # check and the round's rows commit as one transaction
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('current_round', '0')")
+            moved = conn.execute(
+                "UPDATE meta SET value = ? WHERE key = 'current_round' AND value = ?",
+                (str(round_num), str(expected_round))).rowcount
+            if moved:
+                self._write_round(conn, round_num, ideas)
+        return bool(moved)
+
+    @_timed('append_scores')
+    def append_scores(self, round_num, email, scores):
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO scores (round_num, idea_id, user_email, score) VALUES (?, ?, ?, ?)",
+                [(round_num, idea_id, email, score) for idea_id, score in scores])
+            self._bump_round_stamp(conn, round_num)
+
+    def _save_user_row(self, table, email, data):
+        with self._connect() as conn:
+            self._insert_user_row(conn, table, email, data)
+
+    @staticmethod
+    def _insert_user_row(conn, table, email, data):
+        conn.execute(
+            f"INSERT OR REPLACE INTO {table} (user_email, data, submitted_at) VALUES (?, ?, ?)",
+            (normalize_email(email), serializer.dumps_text(data), data.get('submitted_at')))
+
+    def _load_user_rows(self, table, emails):
+        by_lower = {normalize_email(email): email for email in emails}
+        if not by_lower:
+            return {}
+        placeholders = ','.join('?' * len(by_lower))
+        rows = self._connect().execute(
+            f"SELECT user_email, data FROM {table} WHERE user_email IN ({placeholders})",
+            list(by_lower))
+        found = {by_lower[email]: serializer.loads(data) for email, data in rows}
+        # Keep the caller's ordering
+        return {email: found[email] for email in emails if email in found}
+
+    def _users_in(self, table, emails):
+        by_lower = {normalize_email(email): email for email in emails}
+        if not by_lower:
+            return set()
+        placeholders = ','.join('?' * len(by_lower))
+        rows = self._connect().execute(
+            f"SELECT user_email FROM {table} WHERE user_email IN ({placeholders})",
+            list(by_lower))
+        return {by_lower[row[0]] for row in rows}
+
+    @_timed('save_user_votes')
+    def save_user_votes(self, email, data):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM user_vote_rounds WHERE user_email = ? AND upload IS NULL",
+                         (normalize_email(email),))
+            self._insert_user_row(conn, 'user_votes', email, data)
+
+    @_timed('load_user_votes')
+    def load_user_votes(self, emails):
+        all_user_votes = self._load_user_rows('user_votes', emails)
+        for email, data in all_user_votes.items():
+            if 'rounds' not in data:
+                # Streamed submission: the rounds are rows of user_vote_rounds
+                rows = self._connect().execute(
+                    "SELECT data FROM user_vote_rounds WHERE user_email = ? AND upload IS NULL "
+                    "ORDER BY position", (normalize_email(email),))
+                data['rounds'] = [_expand_round(serializer.loads(row[0])) for row in rows]
+        return all_user_votes
+
+    def open_user_votes(self, email, submitted_at):
+        return _SQLiteVotesWriter(self, email, submitted_at)
+
+    def users_with_votes(self, emails):
+        return self._users_in('user_votes', emails)
+
+    @_timed('save_user_final_results')
+    def save_user_final_results(self, email, data):
+        self._save_user_row('user_final_results', email, data)
+
+    @_timed('load_user_final_results')
+    def load_user_final_results(self, emails):
+        return {email: data['finalResults']
+                for email, data in self._load_user_rows('user_final_results', emails).items()}
+
+    def users_with_final_results(self, emails):
+        return self._users_in('user_final_results', emails)
+
+    def delete_user_final_results(self, emails):
+        normalized = [normalize_email(email) for email in emails]
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM user_final_results WHERE user_email = ?",
+                             [(email,) for email in normalized])
+
+    def roster_stamp(self):
+        row = self._connect().execute(
+            "SELECT value FROM meta WHERE key = 'roster_stamp'").fetchone()
+        return row[0] if row else None
+
+    def load_roster(self):
+        # The stamp is written with the first save, so an empty table that
+        # was saved empty is still a roster
+        if self.roster_stamp() is None:
+            return None
+        rows = self._connect().execute("SELECT email FROM roster ORDER BY position").fetchall()
+        return [row[0] for row in rows]
+
+    def save_roster(self, emails):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM roster")
+            conn.executemany("INSERT INTO roster (position, email) VALUES (?, ?)",
+                             list(enumerate(emails)))
+            self._bump_stamp(conn, 'roster_stamp')
+
+    @_timed('save_final_results')
+    def save_final_results(self, results):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO final_results (id, data, created_at) VALUES (1, ?, ?)",
+                (serializer.dumps_text(results), self._now()))
+
+    @_timed('load_final_results')
+    def load_final_results(self):
+        row = self._connect().execute(
+            "SELECT data FROM final_results WHERE id = 1").fetchone()
+        return serializer.loads(row[0]) if row else None
+
+    def record_vote(self, vote):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO votes (round_num, user_email, data) VALUES (?, ?, '{}')",
+                (vote.get('round'), vote.get('user_email')))
+            vote['id'] = cursor.lastrowid
+            conn.execute("UPDATE votes SET data = ? WHERE id = ?",
+                         (serializer.dumps_text(vote), vote['id']))
+            conn.executemany(
+                "INSERT INTO vote_scores (vote_id, idea_id, score) VALUES (?, ?, ?)",
+                [(vote['id'], idea['id'], idea.get('score', 0)) for idea in vote['ideas']])
+        return vote['id']
+
+    def vote_users(self, round_num):
+        return {row[0] for row in self._connect().execute(
+            "SELECT DISTINCT user_email FROM votes WHERE round_num = ?", (round_num,))}
+
+    def vote_summary(self):
+        conn = self._connect()
+        total_votes = conn.execute("SELECT COUNT(*) FROM votes").fetchone()[0]
+
+        average_scores = {idea_id: avg for idea_id, avg in conn.execute(
+            "SELECT idea_id, AVG(score) FROM vote_scores GROUP BY idea_id ORDER BY MIN(rowid)")}
+
+        score_distributions = {0: 0, 1: 0, 2: 0}
+        for score, count in conn.execute(
+                "SELECT score, COUNT(*) FROM vote_scores GROUP BY score"):
+            score_distributions[score] = count
+
+        recent_votes = [serializer.loads(row[0]) for row in conn.execute(
+            "SELECT data FROM (SELECT id, data FROM votes ORDER BY id DESC LIMIT 5) ORDER BY id")]
+
+        return total_votes, average_scores, score_distributions, recent_votes
+
+    def save_job(self, job):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, name, created_at, data) VALUES (?, ?, ?, ?)",
+                (job['id'], job['name'], job['created_at'], serializer.dumps_text(job)))
+            conn.execute(
+                "DELETE FROM jobs WHERE id NOT IN "
+                "(SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?)", (JOB_HISTORY,))
+
+    def load_job(self, job_id):
+        row = self._connect().execute(
+            "SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return serializer.loads(row[0]) if row else None
+
+    def latest_job(self, name):
+        row = self._connect().execute(
+            "SELECT data FROM jobs WHERE name = ? ORDER BY created_at DESC LIMIT 1",
+            (name,)).fetchone()
+        return serializer.loads(row[0]) if row else None
+
+    def append_event(self, event):
+        with self._connect() as conn:
+            event_id = conn.execute(
+                "INSERT INTO events (data) VALUES (?)", (serializer.dumps_text(event),)).lastrowid
+            conn.execute("DELETE FROM events WHERE id <= ?", (event_id - EVENT_HISTORY,))
+        return event_id
+
+    def read_events(self, after_id):
+        rows = self._connect().execute(
+            "SELECT id, data FROM events WHERE id > ? ORDER BY id", (after_id,))
+        return [(event_id, serializer.loads(data)) for event_id, data in rows]
+
+    def last_event_id(self):
+        row = self._connect().execute("SELECT MAX(id) FROM events").fetchone()
+        return row[0] or 0
+
+
+# Abandoned streamed uploads (e.g. of a node that died) expire on their own
+UPLOAD_TTL_MS = 3600 * 1000
+
+
+def _local_append_event(store, keys, args):
+    event_id = store.incr(keys[0])
+    store.rpush(keys[1], args[0])
+    store.ltrim(keys[1], -int(args[1]), -1)
+    return event_id
+
+
+def _local_read_events(store, keys, args):
+    last_id = int(store.get(keys[0]) or 0)
+    length = store.llen(keys[1])
+    start = max(int(args[0]) + 1 - (last_id - length + 1), 0)
+    if start >= length:
+        return [last_id]
+    return [last_id] + store.lrange(keys[1], start, -1)
+
+
+# An event's id comes from a counter incremented in the same script that
+# appends it, so the ids of the list's entries are consecutive and end at
+# the counter's value
+APPEND_EVENT = kvstore.Script("""
+local id = redis.call('INCR', KEYS[1])
+redis.call('RPUSH', KEYS[2], ARGV[1])
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[2]), -1)
+return id
+""", _local_append_event)
+
+# [last id, entries after ARGV[1]...]
+READ_EVENTS = kvstore.Script("""
+local last = tonumber(redis.call('GET', KEYS[1]) or '0')
+local length = redis.call('LLEN', KEYS[2])
+local start = tonumber(ARGV[1]) + 1 - (last - length + 1)
+if start < 0 then start = 0 end
+if start >= length then return {last} end
+local entries = redis.call('LRANGE', KEYS[2], start, -1)
+table.insert(entries, 1, last)
+return entries
+""", _local_read_events)
+
+
+def _local_start_round(store, keys, args):
+    if int(store.get(keys[0]) or 0) != int(args[0]):
+        return 0
+    store.set(keys[2], args[2])
+    store.delete(keys[3])
+    store.incr(keys[4])
+    store.sadd(keys[5], args[1])
+    store.set(keys[0], args[1])
+    store.incr(keys[1])
+    return 1
+
+
+# KeyValueStorage.start_round(): the round is written and the pointer moved
+# only if the pointer is still ARGV[1]
+START_ROUND = kvstore.Script("""
+if (redis.call('GET', KEYS[1]) or '0') ~= ARGV[1] then return 0 end
+redis.call('SET', KEYS[3], ARGV[3])
+redis.call('DEL', KEYS[4])
+redis.call('INCR', KEYS[5])
+redis.call('SADD', KEYS[6], ARGV[2])
+redis.call('SET', KEYS[1], ARGV[2])
+redis.call('INCR', KEYS[2])
+return 1
+""", _local_start_round)
+
+
+class _KeyValueVotesWriter:
+    """Streams rounds to a private list in the store, published on commit"""
+
+    def __init__(self, storage, email, header):
+        self._storage = storage
+        self._email = email
+        self._header = header
+        self._key = storage._key('upload', uuid.uuid4().hex)
+
+    def add_round(self, scores):
+        pipe = self._storage.client.pipeline()
+        pipe.rpush(self._key, _compact_round(scores))
+        pipe.pexpire(self._key, UPLOAD_TTL_MS)
+        pipe.execute()
+
+    def commit(self):
+        client = self._storage.client
+        rounds = client.lrange(self._key, 0, -1)
+        data = dict(self._header, rounds=[_expand_round(serializer.loads(line))
+                                          for line in rounds])
+        pipe = client.pipeline()
+        pipe.hset(self._storage._key('user_votes'), normalize_email(self._email),
+                  serializer.dumps(data))
+        pipe.delete(self._key)
+        pipe.execute()
+
+    def abort(self):
+        self._storage.client.delete(self._key)
+
+
+class KeyValueStorage(Storage):
+    """Storage in a Redis-protocol key-value store (see kvstore.py).
+
+    Every key starts with prefix, one per voting session, so the server
+    nodes of a cluster keep all their sessions in one store. A round is a
+    snapshot plus a list of score log entries replayed over it, as in the
+    JSON layout. Writes of a round, the round pointer or the roster
+    increment a version counter in the same transaction; those counters
+    are the stamps, so a cache on any node is refreshed once another node
+    changed its source. Locks are kvstore.LeaseLocks, which exclude the
+    workers of every node.
+    """
+
+    name = 'redis'
+
+    def __init__(self, client, prefix='voter:default:', lock_ttl=10):
+        self.client = client
+        self.prefix = prefix
+        self.lock_ttl = lock_ttl
+
+    def _key(self, *parts):
+        return self.prefix + ':'.join(str(part) for part in parts)
+
+    def lock(self, name):
+        return kvstore.lease_lock(self.client, self._key('lock', name), self.lock_ttl)
+
+    def round_stamp(self, round_num):
+        return self.client.get(self._key('round', round_num, 'version'))
+
+    def current_round_stamp(self):
+        return self.client.get(self._key('current_round', 'version'))
+
+    def load_current_round(self):
+        current_round = self.client.get(self._key('current_round'))
+        if current_round is not None:
+            return int(current_round)
+        rounds = [int(round_num) for round_num in self.client.smembers(self._key('rounds'))]
+        current_round = max(rounds, default=0)
+        logger.info("Bootstrapping round pointer",
+                    extra={"prefix": self.prefix, "round": current_round})
+        self.save_current_round(current_round)
+        return current_round
+
+    def save_current_round(self, round_num):
+        pipe = self.client.pipeline()
+        pipe.set(self._key('current_round'), round_num)
+        pipe.incr(self._key('current_round', 'version'))
+        pipe.execute()
+
+    @_timed('load_round')
+    def load_round(self, round_num):
+        pipe = self.client.pipeline()
+        pipe.get(self._key('round', round_num))
+        pipe.lrange(self._key('round', round_num, 'log'), 0, -1)
+        snapshot, log = pipe.execute()
+        if snapshot is None:
+            return None
+
+        ideas = serializer.loads(snapshot)
+        index = {idea.get('id'): idea for idea in ideas}
+        for line in log:
+            entry = serializer.loads(line)
+            for idea_id, score in entry['scores']:
+                idea = index.get(idea_id)
+                if idea is not None:
+                    idea.setdefault('user_scores', {})[entry['email']] = score
+        return ideas
+
+    @_timed('save_round')
+    def save_round(self, round_num, ideas):
+        pipe = self.client.pipeline()
+        pipe.set(self._key('round', round_num), serializer.dumps(ideas))
+        pipe.delete(self._key('round', round_num, 'log'))
+        pipe.incr(self._key('round', round_num, 'version'))
+        pipe.sadd(self._key('rounds'), round_num)
+        pipe.execute()
+
+    @_timed('start_round')
+    def start_round(self, round_num, ideas, expected_round):
+        keys = [self._key('current_round'), self._key('current_round', 'version'),
+                self._key('round', round_num), self._key('round', round_num, 'log'),
+                self._key('round', round_num, 'version'), self._key('rounds')]
+        return bool(START_ROUND(self.client, keys,
+                                [str(expected_round), str(round_num), serializer.dumps(ideas)]))
+
+    @_timed('append_scores')
+    def append_scores(self, round_num, email, scores):
+        # Durability is left to the server's persistence settings
+        pipe = self.client.pipeline()
+        pipe.rpush(self._key('round', round_num, 'log'),
+                   serializer.dumps({"email": email, "scores": scores}))
+        pipe.incr(self._key('round', round_num, 'version'))
+        pipe.execute()
+        return None
+
+    def score_log_mark(self, round_num):
+        return self.client.llen(self._key('round', round_num, 'log'))
+
+    @_timed('compact_round')
+    def compact_round(self, round_num, ideas, mark):
+        # Entries appended after the snapshot was taken stay in the log
+        pipe = self.client.pipeline()
+        pipe.set(self._key('round', round_num), serializer.dumps(ideas))
+        pipe.ltrim(self._key('round', round_num, 'log'), mark, -1)
+        pipe.incr(self._key('round', round_num, 'version'))
+        pipe.execute()
+
+    def _load_users(self, name, emails):
+        emails = list(emails)
+        if not emails:
+            return {}
+        values = self.client.hmget(self._key(name), [normalize_email(email) for email in emails])
+        return {email: serializer.loads(value)
+                for email, value in zip(emails, values) if value is not None}
+
+    def _users_with(self, name, emails):
+        stored = {key.decode() for key in self.client.hkeys(self._key(name))}
+        return {email for email in emails if normalize_email(email) in stored}
+
+    @_timed('save_user_votes')
+    def save_user_votes(self, email, data):
+        self.client.hset(self._key('user_votes'), normalize_email(email), serializer.dumps(data))
+
+    @_timed('load_user_votes')
+    def load_user_votes(self, emails):
+        return self._load_users('user_votes', emails)
+
+    def users_with_votes(self, emails):
+        return self._users_with('user_votes', emails)
+
+    def open_user_votes(self, email, submitted_at):
+        return _KeyValueVotesWriter(self, email, {"email": email, "submitted_at": submitted_at})
+
+    @_timed('save_user_final_results')
+    def save_user_final_results(self, email, data):
+        self.client.hset(self._key('user_final_results'), normalize_email(email),
+                         serializer.dumps(data))
+
+    @_timed('load_user_final_results')
+    def load_user_final_results(self, emails):
+        return {email: data['finalResults']
+                for email, data in self._load_users('user_final_results', emails).items()}
+
+    def users_with_final_results(self, emails):
+        return self._users_with('user_final_results', emails)
+
+    def has_final_results(self, email):
+        return bool(self.client.hexists(self._key('user_final_results'), normalize_email(email)))
+
+    def delete_user_final_results(self, emails):
+        keys = [normalize_email(email) for email in emails]
+        if keys:
+            self.client.hdel(self._key('user_final_results'), *keys)
+
+    def roster_stamp(self):
+        return self.client.get(self._key('roster', 'version'))
+
+    def load_roster(self):
+        data = self.client.get(self._key('roster'))
+        return None if data is None else serializer.loads(data)
+
+    def save_roster(self, emails):
+        pipe = self.client.pipeline()
+        pipe.set(self._key('roster'), serializer.dumps(list(emails)))
+        pipe.incr(self._key('roster', 'version'))
+        pipe.execute()
+
+    @_timed('save_final_results')
+    def save_final_results(self, results):
+        self.client.set(self._key('final_results'), serializer.dumps(results))
+
+    @_timed('load_final_results')
+    def load_final_results(self):
+        data = self.client.get(self._key('final_results'))
+        return None if data is None else serializer.loads(data)
+
+    def _votes(self):
+        return [serializer.loads(line) for line in self.client.lrange(self._key('votes'), 0, -1)]
+
+    def record_vote(self, vote):
+        vote['id'] = self.client.incr(self._key('votes', 'id'))
+        self.client.rpush(self._key('votes'), serializer.dumps(vote))
+        return vote['id']
+
+    def vote_users(self, round_num):
+        return {vote.get('user_email', '') for vote in self._votes()
+                if vote.get('round', 0) == round_num}
+
+    def vote_summary(self):
+        return _summarize_votes(self._votes())
+
+    def save_job(self, job):
+        with self.lock('jobs'):
+            latest = self.latest_job(job['name'])
+            pipe = self.client.pipeline()
+            pipe.hset(self._key('jobs'), job['id'], serializer.dumps(job))
+            if latest is None or latest['created_at'] <= job['created_at']:
+                pipe.hset(self._key('jobs', 'latest'), job['name'], job['id'])
+            added = pipe.execute()[0]
+            if not added:
+                return
+            # Oldest first, like the creation times of the JSON backend
+            length = self.client.rpush(self._key('jobs', 'order'), job['id'])
+            for _ in range(length - JOB_HISTORY):
+                self.client.hdel(self._key('jobs'), self.client.lpop(self._key('jobs', 'order')))
+
+    def load_job(self, job_id):
+        data = self.client.hget(self._key('jobs'), job_id)
+        return None if data is None else serializer.loads(data)
+
+    def latest_job(self, name):
+        job_id = self.client.hget(self._key('jobs', 'latest'), name)
+        return None if job_id is None else self.load_job(job_id)
+
+    def append_event(self, event):
+        return APPEND_EVENT(self.client, [self._key('events', 'id'), self._key('events')],
+                            [serializer.dumps(event), EVENT_HISTORY])
+
+    def read_events(self, after_id):
+        reply = READ_EVENTS(self.client, [self._key('events', 'id'), self._key('events')],
+                            [after_id])
+        last_id, entries = int(reply[0]), reply[1:]
+        first_id = last_id - len(entries) + 1
+        return [(first_id + offset, serializer.loads(entry))
+                for offset, entry in enumerate(entries)]
+
+    def last_event_id(self):
+        return int(self.client.get(self._key('events', 'id')) or 0)
+
+
+def create_storage(config, directory=None, committer=None, namespace='default'):
+    """Build the storage backend selected in config.
+
+    Without a directory the storage uses the working directory (and
+    SQLITE_PATH); a session's storage keeps all of its files, including
+    the SQLite database, in its own directory. committer is a GroupCommit
+    to share with other storages, by default a new one if DURABLE_WRITES.
+    The 'redis' backend keeps a session's state under the keys of its
+    namespace (the session id) in the store at REDIS_URL.
+    """
+    if config.STORAGE_BACKEND in ('sqlite', 'redis'):
+        if config.STORAGE_BACKEND == 'redis':
+            storage = KeyValueStorage(kvstore.connect(config.REDIS_URL),
+                                      f'{config.REDIS_PREFIX}{namespace}:', config.REDIS_LOCK_TTL)
+        elif directory is None:
+            storage = SQLiteStorage(config.SQLITE_PATH)
+        else:
+            storage = SQLiteStorage(os.path.join(directory, os.path.basename(config.SQLITE_PATH)))
+        # A fresh database starts from the round0.json seed file
+        with storage.lock('rounds'):
+            if storage.load_round(0) is None:
+                seed = JsonStorage(directory or '.', config.ROUND_MANIFEST_FILE).load_round(0)
+                if seed is not None:
+                    storage.save_round(0, seed)
+        return storage
+    if config.STORAGE_BACKEND == 'json':
+        if committer is None and config.DURABLE_WRITES:
+            committer = GroupCommit(config.FSYNC_GROUP_INTERVAL_MS / 1000)
+        return JsonStorage(directory or '.', config.ROUND_MANIFEST_FILE,
+                           pretty=config.JSON_PRETTY, committer=committer)
+    raise ValueError(f"Unknown storage backend: {config.STORAGE_BACKEND}")
+
+
+def migrate_json_to_sqlite(directory, sqlite_path, manifest_file='manifest.json'):
+    """Import the JSON files of a working directory into a SQLite database"""
+    source = JsonStorage(directory, manifest_file)
+    target = SQLiteStorage(sqlite_path)
+
+    current_round = scan_round_files(directory)
+    for round_num in range(current_round + 1):
+        ideas = source.load_round(round_num)
+        if ideas is not None:
+            target.save_round(round_num, ideas)
+            print(f"Imported round{round_num}.json ({len(ideas)} ideas)")
+    # Read the pointer without bootstrapping a manifest into the source
+    current_pointer = source.read_current_round()
+    target.save_current_round(current_round if current_pointer is None else current_pointer)
+
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.startswith('user_votes_') and name.endswith('.ndjson'):
+            data = _read_votes_stream(path)
+            target.save_user_votes(data['email'], data)
+            print(f"Imported {name}")
+            continue
+        if not name.endswith('.json'):
+            continue
+        if name.startswith('user_votes_'):
+            save = target.save_user_votes
+        elif name.startswith('user_final_results_'):
+            save = target.save_user_final_results
+        else:
+            continue
+        with open(path, 'rb') as f:
+            data = serializer.loads(f.read())
+        save(data['email'], data)
+        print(f"Imported {name}")
+
+    final_results = source.load_final_results()
+    if final_results is not None:
+        target.save_final_results(final_results)
+        print("Imported final_results.json")
+
+    roster = source.load_roster()
+    if roster is not None:
+        target.save_roster(roster)
+        print(f"Imported roster.json ({len(roster)} voters)")
+
+
+if __name__ == '__main__':
+    from config import Config
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'migrate':
+        print("Usage: python storage.py migrate [directory] [sqlite_path]")
+        sys.exit(1)
+
+    directory = sys.argv[2] if len(sys.argv) > 2 else '.'
+    sqlite_path = sys.argv[3] if len(sys.argv) > 3 else Config.SQLITE_PATH
+    migrate_json_to_sqlite(directory, sqlite_path, Config.ROUND_MANIFEST_FILE)
+    print(f"Migration complete: {sqlite_path}")
@@ -0,0 +1,93 @@
+"""
+Checks for the round advancement engine in advancement.py
+
+The heap selection must match a full sort (ties to the earlier idea),
+honour the keep fraction and threshold, and the seeded random mode must
+repeat itself per round.
+
+    python -m unittest test_advancement
+"""
+import random
+import unittest
+
+import models
+from advancement import AdvancementPolicy, select_next_round, top_positions
+from models import Idea, RoundScores
+
+
+def make_round(n_ideas, votes):
+    round_scores = RoundScores([Idea(i, f'Idea {i}', f'Idea {i}') for i in range(n_ideas)])
+    for email, scores in votes.items():
+        round_scores.set_scores(email, list(enumerate(scores)))
+    return round_scores
+
+
+def ids(advancement):
+    return [idea['id'] for idea in advancement.ideas]
+
+
+class AdvancementTest(unittest.TestCase):
+
+    def test_top_positions_matches_sort(self):
+        rng = random.Random(5)
+        for _ in range(200):
+            scores = [rng.choice([0, 1, 2, 3, 4.5]) for _ in range(rng.randint(0, 40))]
+            k = rng.randint(0, len(scores))
+            expected = sorted(range(len(scores)), key=lambda p: (-scores[p], p))[:k]
+            self.assertEqual(top_positions(scores, k), expected)
+
+    def test_total_keeps_best_in_round_order(self):
+        round_scores = make_round(5, {'a': [0, 2, 1, 0, 2], 'b': [1, 0, 2, 0, 1]})
+        advancement = select_next_round(round_scores, 0, AdvancementPolicy(keep_fraction=0.6))
+        # Totals 1, 2, 3, 0, 3: the top 3 are ideas 2 and 4, then 1
+        self.assertEqual(ids(advancement), [1, 2, 4])
+        self.assertEqual((advancement.total, advancement.survival_rate), (5, 0.6))
+        self.assertEqual(advancement.ideas[0], {'id': 1, 'title': 'Idea 1', 'description': 'Idea 1'})
+
+    def test_normalized_weighs_voters_equally(self):
+        # 'a' scores everything 2, 'b' only idea 3: normalized, b's pick wins
+        round_scores = make_round(4, {'a': [2, 2, 2, 0], 'b': [0, 0, 0, 1]})
+        policy = AdvancementPolicy(mode='normalized', keep_fraction=0.25)
+        self.assertEqual(ids(select_next_round(round_scores, 0, policy)), [3])
+        self.assertEqual(ids(select_next_round(round_scores, 0, AdvancementPolicy(keep_fraction=0.25))), [0])
+
+    def test_python_totals_match_numpy(self):
+        if models.np is None:
+            self.skipTest("NumPy is not installed")
+        rng = random.Random(9)
+        round_scores = make_round(30, {f'u{u}': [rng.choice([0, 1, 2, None]) for _ in range(30)]
+                                       for u in range(7)})
+        for normalized in (False, True):
+            with_numpy = round_scores.totals(normalized)
+            numpy, models.np = models.np, None
+            try:
+                without = round_scores.totals(normalized)
+            finally:
+                models.np = numpy
+            for a, b in zip(with_numpy, without):
+                self.assertAlmostEqual(a, b)
+
+    def test_threshold(self):
+        round_scores = make_round(4, {'a': [0, 1, 0, 2]})
+        policy = AdvancementPolicy(keep_fraction=1, min_score=1)
+        self.assertEqual(ids(select_next_round(round_scores, 0, policy)), [1, 3])
+        # Nobody reaches the threshold: the best idea still advances
+        policy = AdvancementPolicy(keep_fraction=1, min_score=5)
+        self.assertEqual(ids(select_next_round(round_scores, 0, policy)), [3])
+
+    def test_seeded_random_is_reproducible(self):
+        round_scores = make_round(50, {})
+        policy = AdvancementPolicy(mode='random', seed=42)
+        first = ids(select_next_round(round_scores, 3, policy))
+        self.assertEqual(len(first), 35)
+        self.assertEqual(first, sorted(first))
+        self.assertEqual(ids(select_next_round(round_scores, 3, policy)), first)
+        self.assertNotEqual(ids(select_next_round(round_scores, 4, policy)), first)
+
+    def test_rejects_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            AdvancementPolicy(mode='best')
+
+
+if __name__ == '__main__':
+    unittest.main()
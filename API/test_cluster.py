@@ -0,0 +1,116 @@
+"""
+Checks for the clustered deployment: cluster.py, kvstore.py and the
+'redis' storage backend, run against kvstore.LocalStore
+
+The ring must only move the keys of a node that joins or leaves, nodes
+must see each other's writes through the storage stamps, and a lease
+must exclude other holders until it is released or expires.
+
+    python -m unittest test_cluster
+"""
+import threading
+import time
+import unittest
+
+from cluster import Cluster, HashRing
+from kvstore import LeaseLock, LocalStore
+from sessions import DEFAULT_SESSION, SharedSessions
+from storage import KeyValueStorage
+
+KEYS = [f'session-{i}' for i in range(2000)]
+
+
+class HashRingTest(unittest.TestCase):
+
+    def test_adding_a_node_only_moves_its_keys(self):
+        before = HashRing(['a', 'b', 'c'])
+        after = HashRing(['a', 'b', 'c', 'd'])
+        moved = [key for key in KEYS if before.node(key) != after.node(key)]
+        self.assertTrue(all(after.node(key) == 'd' for key in moved))
+        self.assertLess(abs(len(moved) - len(KEYS) / 4), len(KEYS) / 10)
+        self.assertIsNone(HashRing([]).node('x'))
+
+
+class KeyValueStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = LocalStore()
+        self.node_a = KeyValueStorage(self.store, 'voter:s:')
+        self.node_b = KeyValueStorage(self.store, 'voter:s:')
+
+    def test_rounds_replay_the_score_log_and_change_the_stamp(self):
+        self.node_a.save_round(0, [{"id": 1}, {"id": 2}])
+        stamp = self.node_b.round_stamp(0)
+        self.node_a.append_scores(0, 'ann', [[1, 2], [3, 1]])
+        self.assertNotEqual(self.node_b.round_stamp(0), stamp)
+        self.assertEqual(self.node_b.load_round(0),
+                         [{"id": 1, "user_scores": {"ann": 2}}, {"id": 2}])
+
+        mark = self.node_a.score_log_mark(0)
+        self.node_a.append_scores(0, 'bob', [[2, 0]])
+        self.node_a.compact_round(0, [{"id": 1, "user_scores": {"ann": 2}}, {"id": 2}], mark)
+        self.assertEqual(self.node_b.score_log_mark(0), 1)
+        self.assertEqual(self.node_b.load_round(0)[1], {"id": 2, "user_scores": {"bob": 0}})
+        self.assertEqual(self.node_b.load_current_round(), 0)
+
+    def test_events_and_user_data_are_shared(self):
+        first = self.node_a.append_event({"type": "vote"})
+        self.node_b.append_event({"type": "round"})
+        self.assertEqual(self.node_a.read_events(first), [(first + 1, {"type": "round"})])
+        self.assertEqual(self.node_b.last_event_id(), first + 1)
+
+        writer = self.node_a.open_user_votes('Ann@x', 'now')
+        writer.add_round([[1, 2]])
+        self.assertEqual(self.node_b.users_with_votes(['ann@x']), set())
+        writer.commit()
+        self.assertEqual(self.node_b.load_user_votes(['ANN@x'])['ANN@x']['rounds'],
+                         [{"ideas": [{"id": 1, "score": 2}]}])
+
+    def test_lease_excludes_other_nodes_until_released_or_expired(self):
+        acquired = threading.Event()
+
+        def take_over():
+            with LeaseLock(self.store, 'lock', ttl=5):
+                acquired.set()
+
+        with LeaseLock(self.store, 'lock', ttl=5):
+            thread = threading.Thread(target=take_over)
+            thread.start()
+            self.assertFalse(acquired.wait(0.1))
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+
+        # A holder that died without releasing it
+        self.store.set('lock', 'dead', px=50, nx=True)
+        started = time.monotonic()
+        with LeaseLock(self.store, 'lock', ttl=5):
+            self.assertGreaterEqual(time.monotonic() - started, 0.04)
+
+
+class ClusterTest(unittest.TestCase):
+
+    def test_members_expire_and_sessions_are_shared(self):
+        store = LocalStore()
+        node_a = Cluster(store, 'a', 'http://a/', node_ttl=0.05)
+        node_b = Cluster(store, 'b', 'http://b', node_ttl=0.05)
+        node_a.refresh()
+        node_b.refresh()
+        self.assertEqual(node_b.members, {'a': 'http://a', 'b': 'http://b'})
+        owner = node_b.owner('team-a')
+        self.assertEqual(node_a.owner_url('team-a'), None if owner == 'a' else 'http://b')
+
+        time.sleep(0.1)
+        node_b.refresh()
+        self.assertEqual(node_b.members, {'b': 'http://b'})
+        self.assertTrue(node_b.owns('team-a'))
+
+        catalog = SharedSessions(store)
+        catalog.create('team-a', [{"id": 1}], ['ann'])
+        with self.assertRaises(FileExistsError):
+            catalog.create('team-a', [{"id": 1}], [])
+        self.assertEqual(SharedSessions(store).ids(), [DEFAULT_SESSION, 'team-a'])
+        self.assertEqual(catalog.storage('team-a').load_roster(), ['ann'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Checks for the metrics in metrics.py
+
+Values recorded on many threads, including threads that have exited,
+must add up, and histograms must render cumulative buckets in the
+Prometheus text format.
+
+    python -m unittest test_metrics
+"""
+import threading
+import unittest
+
+from metrics import Counter, Histogram, Registry
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_counter_sums_thread_shards(self):
+        counter = Counter('test_total', 'Test counter', ('kind',))
+
+        def work():
+            for _ in range(1000):
+                counter.labels('a').inc()
+            counter.labels('b').inc(5)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.labels('a').inc()
+
+        samples = {labels: value for _, labels, value in counter.samples()}
+        self.assertEqual(samples[(('kind', 'a'),)], 8001)
+        self.assertEqual(samples[(('kind', 'b'),)], 40)
+        # Exited threads were folded; totals stay the same on the next scrape
+        self.assertEqual(dict((labels, value) for _, labels, value in counter.samples()), samples)
+
+    def test_histogram_exposition(self):
+        registry = Registry()
+        histogram = registry.register(
+            Histogram('test_seconds', 'Test "latency"\nhistogram', ('route',), buckets=(0.1, 1)))
+        child = histogram.labels('/a"b')
+        for value in (0.05, 0.1, 0.5, 3):
+            child.observe(value)
+
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP test_seconds Test "latency"\\nhistogram',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{route="/a\\"b",le="0.1"} 2',
+            'test_seconds_bucket{route="/a\\"b",le="1"} 3',
+            'test_seconds_bucket{route="/a\\"b",le="+Inf"} 4',
+            'test_seconds_sum{route="/a\\"b"} 3.65',
+            'test_seconds_count{route="/a\\"b"} 4',
+        ])
+
+    def test_rejects_wrong_labels(self):
+        with self.assertRaises(ValueError):
+            Counter('test_total', 'Test counter', ('kind',)).labels('a', 'b')
+
+
+if __name__ == '__main__':
+    unittest.main()
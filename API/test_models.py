@@ -0,0 +1,66 @@
+"""
+Round trip check for the compact round representation in models.py
+
+RoundScores must read and write the same stored round shape as the plain
+idea dicts it replaces: ideas in order, their extra keys, and 'user_scores'
+with null scores, ideas nobody scored and string ids.
+
+    python -m unittest test_models
+"""
+import random
+import unittest
+
+from models import Idea, RoundScores
+
+
+class RoundScoresTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        rng = random.Random(3)
+        for _ in range(100):
+            emails = [f'user{i}@example.com' for i in range(rng.randint(0, 8))]
+            ideas = []
+            for i in range(rng.randint(0, 30)):
+                idea = {'id': rng.choice([i, f'idea-{i:05d}']), 'title': f'Idea {i}',
+                        'description': f'Idea {i}'}
+                if rng.random() < 0.2:
+                    idea['category'] = 'extra'
+                voters = rng.sample(emails, rng.randint(0, len(emails)))
+                if voters:
+                    idea['user_scores'] = {email: rng.choice([0, 1, 2, None]) for email in voters}
+                ideas.append(idea)
+            round_scores = RoundScores.from_dicts(ideas)
+            restored = round_scores.to_dicts()
+            self.assertEqual(restored, ideas)
+            self.assertEqual(RoundScores.from_dicts(restored).to_dicts(), ideas)
+
+    def test_scores_for_and_voters(self):
+        round_scores = RoundScores([Idea(1, 'a', 'a'), Idea(2, 'b', 'b'), Idea(3, 'c', 'c')])
+        round_scores.set_scores('filipe', [(0, 2), (2, None)])
+        round_scores.set_score('pedro', round_scores.position(2), 0)
+        round_scores.set_scores('nobody', [])
+
+        self.assertEqual([score for _, score in round_scores.scores_for('filipe')], [2, None, None])
+        self.assertEqual([score for _, score in round_scores.scores_for('pedro')], [None, 0, None])
+        self.assertEqual([score for _, score in round_scores.scores_for('unknown')], [None] * 3)
+        self.assertEqual(round_scores.voters(), ['filipe', 'pedro'])
+        self.assertEqual(round_scores.to_dicts()[2], {'id': 3, 'title': 'c', 'description': 'c',
+                                                      'user_scores': {'filipe': None}})
+
+    def test_copy_is_independent(self):
+        round_scores = RoundScores.from_dicts([{'id': 1, 'title': 'a', 'description': 'a'}])
+        snapshot = round_scores.copy()
+        round_scores.set_score('filipe', 0, 1)
+        self.assertNotIn('user_scores', snapshot.to_dicts()[0])
+        self.assertEqual(round_scores.to_dicts()[0]['user_scores'], {'filipe': 1})
+
+    def test_rejects_scores_that_do_not_fit(self):
+        round_scores = RoundScores([Idea(1, 'a', 'a')])
+        for score in (-1, 128, 1.5, True, '2'):
+            with self.assertRaises(ValueError):
+                round_scores.set_score('filipe', 0, score)
+        self.assertEqual(round_scores.voters(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+Checks for the on-demand profiler in profiling.py
+
+An armed profile must record exactly the next `count` calls of its
+target, write one merged output file and disarm itself.
+
+    python -m unittest test_profiling
+"""
+import pstats
+import tempfile
+import time
+import unittest
+
+from profiling import Profiler, ProfileSession
+
+
+def busy(duration):
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        pass
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.profiler = Profiler(directory.name)
+
+    def test_cprofile_records_next_calls(self):
+        calls = []
+        hooked = self.profiler.hook('job')(lambda: calls.append(busy(0.001)))
+        hooked()
+        session = self.profiler.arm('job', count=2)
+        self.assertTrue(self.profiler.armed)
+        for _ in range(3):
+            hooked()
+
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(session.status, ProfileSession.COMPLETED)
+        self.assertEqual(session.captured, 2)
+        self.assertFalse(self.profiler.armed)
+        stats = pstats.Stats(session.path)
+        self.assertTrue(any(name == 'busy' for _, _, name in stats.stats))
+
+    def test_sample_writes_collapsed_stacks(self):
+        session = self.profiler.arm('job', mode='sample', interval=0.0005)
+        self.profiler.call('job', busy, 0.05)
+        with open(session.path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertIn('busy (test_profiling.py', stack)
+        self.assertGreater(int(count), 0)
+
+    def test_cancel_and_validation(self):
+        with self.assertRaises(ValueError):
+            self.profiler.arm('job', mode='trace')
+        session = self.profiler.arm('job')
+        with self.assertRaises(ValueError):
+            self.profiler.arm('job')
+        self.profiler.cancel(session.id)
+        self.assertEqual(session.status, ProfileSession.CANCELLED)
+        self.assertFalse(self.profiler.armed)
+        self.assertIsNone(self.profiler.call('job', lambda: None))
+        self.assertIsNone(session.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Checks for the voter roster in roster.py
+
+Lookups must be case-insensitive, both file formats must parse, and a
+changed source must be picked up while a broken one keeps the previous
+roster.
+
+    python -m unittest test_roster
+"""
+import os
+import tempfile
+import unittest
+
+from roster import FileRosterSource, Roster, RosterSnapshot, StorageRosterSource
+from storage import SQLiteStorage
+
+
+class RosterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_snapshot_lookup(self):
+        snapshot = RosterSnapshot(['Ana@Example.com', 'bo@example.com', ' ana@example.com'])
+        self.assertEqual(snapshot.emails, ['Ana@Example.com', 'bo@example.com'])
+        self.assertEqual(snapshot.lookup(' ANA@example.COM '), 'Ana@Example.com')
+        self.assertIn('BO@example.com', snapshot)
+        self.assertIsNone(snapshot.lookup('cy@example.com'))
+        self.assertEqual(set(snapshot.keys()), {'ana@example.com', 'bo@example.com'})
+
+    def test_file_formats(self):
+        text = self.write('roster.txt', "# voters\nana@example.com\n\nbo@example.com  # late\n")
+        listed = self.write('roster.json', '["ana@example.com", "bo@example.com"]')
+        wrapped = self.write('wrapped.json', '{"emails": ["ana@example.com", "bo@example.com"]}')
+        for path in (text, listed, wrapped):
+            self.assertEqual(FileRosterSource(path).load(), ['ana@example.com', 'bo@example.com'])
+        self.assertIsNone(FileRosterSource(os.path.join(self.directory.name, 'none')).load())
+
+    def test_reloads_changed_file(self):
+        path = self.write('roster.json', '["ana@example.com"]')
+        roster = Roster(FileRosterSource(path), reload_interval=0)
+        first = roster.current()
+        self.assertEqual(first.emails, ['ana@example.com'])
+
+        self.write('roster.json', '["ana@example.com", "bo@example.com"]')
+        current = roster.current()
+        self.assertIn('bo@example.com', current)
+        self.assertGreater(current.version, first.version)
+
+        # A broken roster is reported and the previous one kept
+        self.write('roster.json', '["ana@example.com",')
+        self.assertIs(roster.current(), current)
+
+    def test_storage_roster(self):
+        storage = SQLiteStorage(os.path.join(self.directory.name, 'voter.db'))
+        self.assertIsNone(storage.load_roster())
+        roster = Roster(StorageRosterSource(storage), reload_interval=0)
+        self.assertEqual(len(roster.current()), 0)
+
+        storage.save_roster(['ana@example.com', 'bo@example.com'])
+        self.assertEqual(roster.current().emails, ['ana@example.com', 'bo@example.com'])
+        storage.save_roster([])
+        self.assertEqual(storage.load_roster(), [])
+        self.assertEqual(len(roster.current()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+Regression check for the NumPy scoring engine
+
+The vectorized paths in scoring.py must produce exactly the same
+final_results.json as the plain Python loops, including float rounding,
+tie order and ideas submitted twice by the same user.
+
+    python -m unittest test_scoring
+"""
+import json
+import os
+import random
+import unittest
+
+import scoring
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def dump(result):
+    # Serialized like storage.save_final_results, so "equal" means byte-identical
+    return json.dumps(result.final_results, indent=2)
+
+
+@unittest.skipIf(scoring.np is None, "NumPy is not installed")
+class ScoringEngineTest(unittest.TestCase):
+
+    def assertSameAsPython(self, all_final_results):
+        self.assertEqual(dump(scoring.combine_final_results(all_final_results)),
+                         dump(scoring._combine_final_results_python(all_final_results)))
+
+    def assertSameVotesAsPython(self, all_user_votes, original_ideas, roster_size):
+        self.assertEqual(
+            dump(scoring.normalize_round_votes(all_user_votes, original_ideas, roster_size)),
+            dump(scoring._normalize_round_votes_python(all_user_votes, original_ideas, roster_size)))
+
+    def test_pedro_fixture(self):
+        with open(os.path.join(BASE_DIR, 'user_final_results_pedro.json'), 'r') as f:
+            pedro = json.load(f)['finalResults']
+        self.assertSameAsPython({'pedro': pedro})
+
+        # A second user with the same ideas in a different order and scale
+        filipe = [dict(idea, finalScore=(idea['finalScore'] or 0) * 1.7 + 0.1)
+                  for idea in reversed(pedro)]
+        self.assertSameAsPython({'pedro': pedro, 'filipe': filipe})
+
+    def test_duplicate_ids_and_float_scores(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            all_final_results = {}
+            for user in range(rng.randint(1, 6)):
+                ids = rng.sample(range(1, 25), rng.randint(1, 20))
+                ids += rng.choices(ids, k=rng.randint(0, 3))
+                all_final_results[f'user{user}'] = [{
+                    'id': idea_id,
+                    'title': f'Idea {idea_id}',
+                    'description': f'Idea {idea_id}',
+                    'finalScore': rng.choice([rng.random() * 5, rng.randint(0, 6), None])
+                } for idea_id in ids]
+            self.assertSameAsPython(all_final_results)
+
+    def test_round_votes(self):
+        rng = random.Random(11)
+        for _ in range(200):
+            n_ideas = rng.randint(1, 25)
+            original_ideas = [{'id': i, 'title': f'Idea {i}', 'description': f'Idea {i}'}
+                              for i in range(1, n_ideas + 1)]
+            all_user_votes = {}
+            for user in range(rng.randint(1, 6)):
+                rounds = []
+                for _ in range(rng.randint(1, 4)):
+                    ids = rng.sample(range(0, n_ideas + 2), rng.randint(1, n_ideas))
+                    ids += rng.choices(ids, k=rng.randint(0, 2))
+                    rounds.append({'ideas': [{'id': i, 'score': rng.choice([0, 1, 2, rng.random() * 2])}
+                                             for i in ids]})
+                all_user_votes[f'user{user}'] = {'rounds': rounds}
+            roster_size = len(all_user_votes) + rng.randint(0, 2)
+            try:
+                self.assertSameVotesAsPython(all_user_votes, original_ideas, roster_size)
+            except ZeroDivisionError:
+                # A user with a zero total divides by zero in both paths
+                with self.assertRaises(ZeroDivisionError):
+                    scoring._normalize_round_votes_python(all_user_votes, original_ideas,
+                                                          roster_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
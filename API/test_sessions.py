@@ -0,0 +1,77 @@
+"""
+Checks for the voting session registry in sessions.py
+
+A created session must hold its own round 0 and roster, ids must be safe
+directory names, and only the least recently used sessions beyond the
+limit (never the default one) may be unloaded.
+
+    python -m unittest test_sessions
+"""
+import os
+import tempfile
+import unittest
+
+from sessions import DEFAULT_SESSION, DirectorySessions, SessionRegistry
+from storage import JsonStorage
+
+IDEAS = [{"id": 1, "title": "A", "description": "a", "user_scores": {"x": 2}},
+         {"id": 2, "title": "B", "description": "b"}]
+
+
+class FakeSession:
+    def __init__(self, session_id, directory):
+        self.id = session_id
+        self.directory = directory
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class SessionRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        catalog = DirectorySessions(os.path.join(directory.name, 'sessions'))
+        self.registry = SessionRegistry(catalog, FakeSession, max_loaded=2)
+
+    def test_create_seeds_round_and_roster(self):
+        self.registry.create('team-a', IDEAS, ['Ann', 'ann', 'Bob'])
+        storage = JsonStorage(self.registry.path('team-a'))
+        self.assertEqual(storage.load_round(0), [
+            {"id": 1, "title": "A", "description": "a"},
+            {"id": 2, "title": "B", "description": "b"}])
+        self.assertEqual(storage.load_roster(), ['Ann', 'Bob'])
+        self.assertEqual(self.registry.ids(), [DEFAULT_SESSION, 'team-a'])
+
+        with self.assertRaises(FileExistsError):
+            self.registry.create('team-a', IDEAS, [])
+        for session_id in ('../x', '.hidden', '', DEFAULT_SESSION):
+            with self.assertRaises(ValueError):
+                self.registry.create(session_id, IDEAS, [])
+        with self.assertRaises(ValueError):
+            self.registry.create('team-b', [], [])
+
+    def test_get_loads_and_evicts_least_recently_used(self):
+        self.assertIsNone(self.registry.get('missing'))
+        default = self.registry.get(DEFAULT_SESSION)
+        self.assertIsNone(default.directory)
+        for session_id in ('a', 'b'):
+            self.registry.create(session_id, IDEAS, ['x'])
+
+        a = self.registry.get('a')
+        self.assertIs(self.registry.get('a'), a)
+        b = self.registry.get('b')
+        self.assertTrue(a.closed)
+        self.assertFalse(default.closed or b.closed)
+        self.assertEqual([s.id for s in self.registry.loaded()], [DEFAULT_SESSION, 'b'])
+        self.assertIsNot(self.registry.get('a'), a)
+
+        self.registry.close()
+        self.assertTrue(default.closed and b.closed)
+        self.assertEqual(self.registry.loaded(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
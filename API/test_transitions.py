@@ -0,0 +1,94 @@
+"""
+Checks for single-flight round transitions: transitions.py and the
+Storage.start_round() compare-and-swap of every backend
+
+Concurrent callers ending a round must share one run of the transition,
+a failed run must be retried by the next caller, and a round must only
+be started from the round before it.
+
+    python -m unittest test_transitions
+"""
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from kvstore import LocalStore
+from storage import JsonStorage, KeyValueStorage, SQLiteStorage
+from transitions import RoundTransitions
+
+
+class RoundTransitionsTest(unittest.TestCase):
+
+    def test_concurrent_callers_share_one_run(self):
+        runs = []
+
+        def transition(round_num):
+            runs.append(round_num)
+            time.sleep(0.05)
+            return object()
+
+        transitions = RoundTransitions(transition, history=1)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(transitions.advance(0)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(runs, [0])
+        self.assertEqual(len(set(map(id, results))), 1)
+        self.assertIs(transitions.advance(0), results[0])
+        transitions.advance(1)
+        # Only the last round's result is kept
+        self.assertIsNot(transitions.advance(0), results[0])
+
+    def test_failed_or_empty_runs_are_retried(self):
+        outcomes = [ValueError("disk full"), None, 'advanced']
+        transitions = RoundTransitions(lambda round_num: self._next(outcomes))
+        with self.assertRaises(ValueError):
+            transitions.advance(3)
+        self.assertIsNone(transitions.advance(3))
+        self.assertEqual(transitions.advance(3), 'advanced')
+        self.assertEqual(transitions.advance(3), 'advanced')
+        self.assertEqual(outcomes, [])
+
+    @staticmethod
+    def _next(outcomes):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class StartRoundTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def check_compare_and_swap(self, storage):
+        storage.save_round(0, [{"id": 1}, {"id": 2}])
+        self.assertEqual(storage.load_current_round(), 0)
+        self.assertFalse(storage.start_round(2, [{"id": 1}], 1))
+
+        self.assertTrue(storage.start_round(1, [{"id": 2}], 0))
+        self.assertFalse(storage.start_round(1, [{"id": 1}], 0))
+        self.assertEqual(storage.load_current_round(), 1)
+        self.assertEqual(storage.load_round(1), [{"id": 2}])
+
+    def test_json(self):
+        self.check_compare_and_swap(JsonStorage(self.directory))
+
+    def test_sqlite(self):
+        self.check_compare_and_swap(SQLiteStorage(os.path.join(self.directory, 'voter.db')))
+
+    def test_key_value(self):
+        self.check_compare_and_swap(KeyValueStorage(LocalStore(), 'voter:t:'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Single-flight round transitions for the Voter App API
+
+A round ends when its last voter submits (the auto-advance in
+VotingService.submit_vote) or on POST /end-round, and several of those
+can arrive at once. Each one used to select the next round's ideas itself
+and race to write it. RoundTransitions runs the transition of a round once:
+the first caller runs it, callers arriving meanwhile wait for its result
+instead of repeating the selection, and later callers get the recorded
+result. Every caller ending the same round therefore gets the same
+Advancement.
+
+This covers the threads of one server worker. Across workers and cluster
+nodes the transition itself (VotingSession.advance_round) runs under the
+storage's 'transition' lock and starts the round with Storage.start_round,
+a compare-and-swap on the round pointer, so that exactly one new round is
+written per round even if a lock lease expired.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import metrics
+
+ROUND_TRANSITION_CALLS = metrics.counter(
+    'voter_round_transition_calls_total',
+    'Requests to end a round, by whether they ran the transition or shared its result',
+    ('outcome',))
+
+
+class RoundTransitions:
+    """Runs transition(round_num) at most once per round at a time.
+
+    A None result (the round could not be ended) is not recorded, so a
+    later call tries again; neither is an exception, which is raised to
+    every caller waiting for it. The results of the last history rounds
+    are kept.
+    """
+
+    def __init__(self, transition, history=16):
+        self._transition = transition
+        self._history = history
+        self._flights = {}
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def advance(self, round_num):
+        with self._lock:
+            if round_num in self._results:
+                ROUND_TRANSITION_CALLS.labels('recorded').inc()
+                return self._results[round_num]
+            flight = self._flights.get(round_num)
+            leader = flight is None
+            if leader:
+                flight = self._flights[round_num] = Future()
+        if not leader:
+            ROUND_TRANSITION_CALLS.labels('joined').inc()
+            return flight.result()
+
+        ROUND_TRANSITION_CALLS.labels('ran').inc()
+        try:
+            result = self._transition(round_num)
+        except BaseException as e:
+            with self._lock:
+                del self._flights[round_num]
+            flight.set_exception(e)
+            raise
+        with self._lock:
+            del self._flights[round_num]
+            if result is not None:
+                self._results[round_num] = result
+                while len(self._results) > self._history:
+                    self._results.popitem(last=False)
+        flight.set_result(result)
+        return result
@@ -8,10 +8,17 @@ let currentGroupIndex = 0;
 let finalResults = []; // Store final cumulative scores
 let isVotingComplete = false;
 let allUserVotes = []; // Store all voting data to send at the end
+let statusRefreshTimer = null; // Pending automatic refresh of the status page
+let statusEvents = null; // EventSource pushing status changes while the status page is shown
 
 const MAX_SCORE_2_PERCENTAGE = 0.2;
 const MAX_SCORE_1_PERCENTAGE = 0.4;
-const API_BASE_URL = 'http://localhost:8080';
+// Voting session from the page's ?session=<id>; the default session otherwise
+const SESSION_ID = new URLSearchParams(window.location.search).get('session');
+const API_BASE_URL = 'http://localhost:8080' +
+    (SESSION_ID ? `/sessions/${encodeURIComponent(SESSION_ID)}` : '');
+const RESULTS_RETRY_DELAY_MS = 2000;
+const RESULTS_MAX_RETRIES = 30;
 
 function showEmailModal() {
     const modal = document.getElementById('emailModal');
@@ -165,22 +172,63 @@ async function showVotingStatusPageFromAPI(statusData) {
     const header = document.querySelector('.header');
     header.insertAdjacentElement('afterend', statusContainer);
 
-    // If all users have voted, show final results instead of status tabs
-    if (statusData.all_voted) {
+    // Once everyone has voted and the results are aggregated, show final results instead of status tabs
+    if (statusData.all_voted && statusData.results_status === 'completed') {
+        stopWatchingVotingStatus();
         await showFinalResults();
     } else {
+        if (statusData.all_voted) {
+            // Everyone has voted but the server is still aggregating the results
+            const calculating = document.createElement('p');
+            calculating.textContent = statusData.results_status === 'failed'
+                ? 'Calculating the final results failed. Please try again later.'
+                : 'Final results are being calculated...';
+            statusContainer.querySelector('.status-summary').appendChild(calculating);
+        }
+
         // Show refresh button for users to check status
         const refreshButton = document.createElement('button');
         refreshButton.className = 'control-button secondary';
         refreshButton.textContent = 'Refresh Status';
-        refreshButton.onclick = () => {
-            document.getElementById('statusContainer').remove();
-            document.querySelector('.game-container').style.display = 'block';
-            showVotingStatusPage();
-        };
+        refreshButton.onclick = refreshVotingStatusPage;
 
         statusContainer.querySelector('.status-summary').appendChild(refreshButton);
+
+        if (typeof EventSource !== 'undefined') {
+            watchVotingStatus();
+        } else if (statusData.all_voted && statusData.results_status !== 'failed') {
+            statusRefreshTimer = setTimeout(refreshVotingStatusPage, RESULTS_RETRY_DELAY_MS);
+        }
+    }
+}
+
+function watchVotingStatus() {
+    // The server pushes an event whenever a user completes or the final results are ready
+    if (statusEvents) {
+        return;
     }
+    statusEvents = new EventSource(`${API_BASE_URL}/events`);
+    ['final-results-submitted', 'final-results'].forEach(type => {
+        statusEvents.addEventListener(type, refreshVotingStatusPage);
+    });
+}
+
+function stopWatchingVotingStatus() {
+    if (statusEvents) {
+        statusEvents.close();
+        statusEvents = null;
+    }
+}
+
+function refreshVotingStatusPage() {
+    clearTimeout(statusRefreshTimer);
+    const statusContainer = document.getElementById('statusContainer');
+    if (!statusContainer) {
+        return;
+    }
+    statusContainer.remove();
+    document.querySelector('.game-container').style.display = 'block';
+    showVotingStatusPage();
 }
 
 function switchTab(tabName) {
@@ -1022,12 +1070,30 @@ function updateFinalResultsUI() {
     headerText.textContent = `Voting Complete - ${survivingIdeas} ideas survived 3 rounds of elimination`;
 }
 
+async function fetchFinalResults() {
+    // While the final results are being aggregated the server answers 503 with Retry-After
+    for (let attempt = 0; attempt < RESULTS_MAX_RETRIES; attempt++) {
+        const response = await fetch(`${API_BASE_URL}/final-results`);
+        if (response.status !== 503) {
+            if (!response.ok) {
+                return null;
+            }
+            const data = await response.json();
+            return data.status === 'completed' ? data.results : null;
+        }
+        const retryAfter = parseInt(response.headers.get('Retry-After'), 10);
+        const delay = Number.isNaN(retryAfter) ? RESULTS_RETRY_DELAY_MS : retryAfter * 1000;
+        await new Promise(resolve => setTimeout(resolve, delay));
+    }
+    return null;
+}
+
 async function fetchResults() {
     try {
         // Try to get final normalized results first
-        const finalResponse = await fetch(`${API_BASE_URL}/final-results`);
-        if (finalResponse.ok) {
-            return await finalResponse.json();
+        const finalResults = await fetchFinalResults();
+        if (finalResults) {
+            return finalResults;
         }
 
         // Fall back to regular results if final results aren't available yet